@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from .. import crud, database, schemas
+from ..services import job_queue, token_budget
+from ..services.llm_cache import llm_cache
+from ..services.transcript_cache import transcript_cache
+from ..services.progress_events import progress_broker
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/queue-depth", response_model=Dict[str, Dict[str, int]])
+async def read_queue_depth_endpoint(db: AsyncSession = Depends(database.get_db)):
+    return await job_queue.get_queue_depth(db)
+
+@router.get("/llm-cache/stats", response_model=Dict[str, Any])
+def read_llm_cache_stats_endpoint():
+    return llm_cache.get_stats()
+
+@router.get("/transcript-cache/stats", response_model=Dict[str, Any])
+def read_transcript_cache_stats_endpoint():
+    return transcript_cache.get_stats()
+
+@router.get("/progress-events/stats", response_model=Dict[str, Any])
+def read_progress_events_stats_endpoint():
+    return progress_broker.get_stats()
+
+@router.get("/llm-usage", response_model=List[schemas.LLMUsageAggregate])
+async def read_llm_usage_endpoint(group_by: str = Query("project", pattern="^(project|video|stage|model)$"), since_hours: int = Query(24 * 7, ge=1),
+                                  project_id: Optional[int] = None, video_id: Optional[int] = None, limit: int = Query(50, ge=1, le=500), db: AsyncSession = Depends(database.get_db)):
+    """Token usage and latency of OpenAI calls per project, video, stage or model, heaviest first. Cache hits are not counted."""
+    since = datetime.now(timezone.utc) - timedelta(hours=since_hours)
+    return await crud.get_llm_usage_summary(db, group_by=group_by, since=since, project_id=project_id, video_id=video_id, limit=limit)
+
+async def _project_token_usage(db: AsyncSession, project_id: int) -> schemas.ProjectTokenUsage:
+    project = await crud.get_project(db, project_id=project_id)
+    if not project: raise HTTPException(status_code=404, detail="Project not found")
+    since = datetime.now(timezone.utc) - timedelta(days=token_budget.PROJECT_TOKEN_CEILING_WINDOW_DAYS)
+    used = await crud.get_project_token_usage(db, project_id=project_id, since=since)
+    ceiling = project.token_ceiling if project.token_ceiling is not None else token_budget.PROJECT_TOKEN_CEILING
+    return schemas.ProjectTokenUsage(project_id=project_id, window_days=token_budget.PROJECT_TOKEN_CEILING_WINDOW_DAYS, used_tokens=used,
+                                     token_ceiling=ceiling, remaining_tokens=max(0, ceiling - used) if ceiling else None)
+
+@router.get("/projects/{project_id}/token-usage", response_model=schemas.ProjectTokenUsage)
+async def read_project_token_usage_endpoint(project_id: int, db: AsyncSession = Depends(database.get_db)):
+    return await _project_token_usage(db, project_id)
+
+@router.put("/projects/{project_id}/token-ceiling", response_model=schemas.ProjectTokenUsage)
+async def update_project_token_ceiling_endpoint(project_id: int, update: schemas.ProjectTokenCeilingUpdate, db: AsyncSession = Depends(database.get_db)):
+    """Sets the project's hard LLM token ceiling per window; calls beyond it fail until usage falls back under it."""
+    if not await crud.set_project_token_ceiling(db, project_id=project_id, token_ceiling=update.token_ceiling):
+        raise HTTPException(status_code=404, detail="Project not found")
+    token_budget.forget_project_usage(project_id)
+    db.expire_all()
+    return await _project_token_usage(db, project_id)
@@ -1,97 +1,208 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, BackgroundTasks, Response, status as http_status
-from sqlalchemy.orm import Session
-import shutil
+import logging
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Request, Response, Query, status as http_status
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
-import uuid
+import asyncio
 from typing import List, Optional 
 
 from .. import crud, schemas, database, models 
-from ..services import transcription_service 
+from ..services import job_queue, upload_service, hls_packaging 
+from ..services.utils import format_timestamp
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/projects",
     tags=["projects"],
 )
 
-UPLOAD_DIR = "/app/uploaded_videos" 
-
 @router.post("/", response_model=schemas.ProjectSchema)
-def create_project_endpoint(project: schemas.ProjectCreate, db: Session = Depends(database.get_db)):
-    db_project = crud.get_project_by_name(db, name=project.name)
+async def create_project_endpoint(project: schemas.ProjectCreate, db: AsyncSession = Depends(database.get_db)):
+    db_project = await crud.get_project_by_name(db, name=project.name)
     if db_project:
         raise HTTPException(status_code=400, detail="Project name already registered")
-    return crud.create_project(db=db, project=project)
+    return await crud.create_project(db=db, project=project)
 
-@router.get("/", response_model=List[schemas.ProjectSchema])
-def read_projects_endpoint(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    projects = crud.get_projects(db, skip=skip, limit=limit)
-    return projects
+@router.get("/", response_model=schemas.ProjectPage)
+async def read_projects_endpoint(cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=500), db: AsyncSession = Depends(database.get_db)):
+    try: projects, next_cursor = await crud.get_projects_page(db, cursor=cursor, limit=limit)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+    return schemas.ProjectPage(items=projects, next_cursor=next_cursor)
 
 @router.get("/{project_id}", response_model=schemas.ProjectSchema)
-def read_project_endpoint(project_id: int, db: Session = Depends(database.get_db)):
-    db_project = crud.get_project(db, project_id=project_id)
+async def read_project_endpoint(project_id: int, db: AsyncSession = Depends(database.get_db)):
+    db_project = await crud.get_project_with_counts(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     return db_project
 
+@router.get("/{project_id}/videos", response_model=schemas.VideoPage)
+async def read_project_videos_endpoint(project_id: int, cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=200), tag: Optional[List[str]] = Query(None), db: AsyncSession = Depends(database.get_db)):
+    """
+    Newest-first video summaries; pass `next_cursor` back as `cursor` for the next page. Full data is at GET /videos/{id}.
+    Repeat `tag` to list only the videos carrying all of the given tags.
+    """
+    if not await crud.get_project(db, project_id=project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    try: videos, next_cursor = await crud.get_videos_page(db, project_id=project_id, cursor=cursor, limit=limit, tags=tag)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+    return schemas.VideoPage(items=videos, next_cursor=next_cursor)
+
+@router.get("/{project_id}/tags", response_model=schemas.TagFacets)
+async def read_project_tag_facets_endpoint(project_id: int, tag: Optional[List[str]] = Query(None), limit: int = Query(100, ge=1, le=500), db: AsyncSession = Depends(database.get_db)):
+    """Tag counts over the project's videos, most used first; with `tag` filters, over the videos carrying all of them."""
+    if not await crud.get_project(db, project_id=project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    facets, video_count = await crud.get_tag_facets(db, project_id=project_id, tags=tag, limit=limit)
+    return schemas.TagFacets(video_count=video_count, tags=[schemas.TagFacet(tag=row.tag, count=row.count) for row in facets])
+
+@router.get("/{project_id}/search", response_model=schemas.TranscriptSearchResults)
+async def search_project_transcripts_endpoint(project_id: int, q: str = Query(..., min_length=1, max_length=200), limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0), db: AsyncSession = Depends(database.get_db)):
+    """Transcript segments of the project's videos matching `q`, best first, with the match highlighted in `snippet`."""
+    if not await crud.get_project(db, project_id=project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    rows = await crud.search_project_transcripts(db, project_id=project_id, query_text=q, limit=limit, offset=offset)
+    hits = [schemas.TranscriptSearchHit(video_id=row.video_id, video_filename=row.video_filename, position=row.position, start_seconds=row.start_seconds,
+                                        end_seconds=row.end_seconds, timestamp=format_timestamp(row.start_seconds), snippet=row.snippet, rank=row.rank) for row in rows]
+    return schemas.TranscriptSearchResults(query=q, hits=hits)
+
+async def _register_uploaded_video(db: AsyncSession, project_id: int, filename: str, upload_path: str, content_hash: str) -> models.Video:
+    """
+    Stores the upload under its content hash and creates the video row. If an identical file was already
+    transcribed, the transcript (with key moments) and tags are reused and no pipeline job is queued;
+    otherwise the video starts in 'processing' with its transcription job queued in the same transaction.
+    A new blob also gets its HLS packaging job queued; videos sharing a blob share its renditions.
+    """
+    await crud.lock_content_hash(db, content_hash)
+    existing_video = await crud.get_video_by_content_hash(db, content_hash)
+    file_path = await asyncio.to_thread(upload_service.store_blob, upload_path, content_hash, filename, existing_path=existing_video.filepath if existing_video else None)
+    video_data = schemas.VideoCreate(filename=filename)
+    hls_manifest_path = existing_video.hls_manifest_path if existing_video else None
+    package_hls = hls_packaging.HLS_ENABLED and not existing_video
+    source_video = await crud.get_video_by_content_hash(db, content_hash, transcribed_only=True)
+    if source_video:
+        db_video = await crud.create_video_for_project(db=db, video=video_data, project_id=project_id, filepath=file_path, content_hash=content_hash, status="completed", tags=list(source_video.tags or []), hls_manifest_path=hls_manifest_path, commit=False)
+        await crud.copy_transcript(db, source_video_id=source_video.id, target_video_id=db_video.id)
+        await db.commit()
+        logger.info(f"Video ID {db_video.id} reuses the transcript of identical video ID {source_video.id}, skipping the pipeline.")
+        return await crud.get_video_detail(db, db_video.id)
+    db_video = await crud.create_video_for_project(db=db, video=video_data, project_id=project_id, filepath=file_path, content_hash=content_hash, status="processing", hls_manifest_path=hls_manifest_path, commit=False)
+    await job_queue.enqueue_job(db, job_queue.JOB_TYPE_TRANSCRIPTION, {"video_id": db_video.id, "video_filepath": file_path}, commit=False)
+    if package_hls: await job_queue.enqueue_job(db, job_queue.JOB_TYPE_HLS, {"video_id": db_video.id, "video_filepath": file_path}, commit=False)
+    await db.commit()
+    logger.info(f"Video ID {db_video.id} status set to processing, transcription job queued.")
+    return await crud.get_video_detail(db, db_video.id)
+
 @router.post("/{project_id}/upload_video/", response_model=schemas.VideoSchema)
 async def upload_video_for_project_endpoint(
     project_id: int,
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
-    project = crud.get_project(db, project_id=project_id)
+    project = await crud.get_project(db, project_id=project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    unique_id = uuid.uuid4()
-    file_extension = os.path.splitext(file.filename)[1] if file.filename else ".mp4" 
-    if not file_extension: 
-        file_extension = ".mp4"
-    unique_filename = f"{unique_id}{file_extension}"
-    
-    os.makedirs(UPLOAD_DIR, exist_ok=True) 
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        print(f"Video saved to: {file_path}")
+        file_path, content_hash, size = await upload_service.save_upload_file(file)
+        logger.info(f"Video saved to: {file_path} ({size} bytes, sha256 {content_hash})")
     except Exception as e:
-        print(f"Error saving video: {e}")
+        logger.error(f"Error saving video: {e}")
         raise HTTPException(status_code=500, detail=f"Could not save video file: {e}")
     finally:
-        if file and hasattr(file, 'file') and file.file: 
-            file.file.close()
+        await file.close()
 
-    video_data = schemas.VideoCreate(filename=file.filename if file.filename else unique_filename)
-    db_video = crud.create_video_for_project(db=db, video=video_data, project_id=project_id, filepath=file_path)
-    
-    crud.update_video_data(db=db, video_id=db_video.id, status="processing")
-    print(f"Video ID {db_video.id} status set to processing.")
+    filename = file.filename or os.path.basename(file_path)
+    return await _register_uploaded_video(db, project_id, filename, file_path, content_hash)
 
-    background_tasks.add_task(transcription_service.transcribe_video_with_openai, file_path, db_video.id, database.SessionLocal)
-    print(f"Background task added for video ID {db_video.id}")
-    
-    updated_db_video = crud.get_video(db=db, video_id=db_video.id)
-    return updated_db_video if updated_db_video else db_video
+def _upload_session_response(db_upload: models.UploadSession) -> schemas.UploadSessionSchema:
+    response = schemas.UploadSessionSchema.model_validate(db_upload)
+    response.chunk_size = upload_service.UPLOAD_CHUNK_BYTES
+    return response
+
+@router.post("/{project_id}/uploads", response_model=schemas.UploadSessionSchema, status_code=http_status.HTTP_201_CREATED)
+async def init_upload_endpoint(project_id: int, upload: schemas.UploadInit, db: AsyncSession = Depends(database.get_db)):
+    if not await crud.get_project(db, project_id=project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    db_upload = await crud.create_upload_session(db, project_id=project_id, upload=upload)
+    upload_service.create_partial_file(db_upload.id)
+    return _upload_session_response(db_upload)
+
+@router.get("/{project_id}/uploads/{upload_id}", response_model=schemas.UploadSessionSchema)
+async def read_upload_endpoint(project_id: int, upload_id: str, db: AsyncSession = Depends(database.get_db)):
+    db_upload = await crud.get_upload_session(db, upload_id=upload_id, project_id=project_id)
+    if not db_upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return _upload_session_response(db_upload)
+
+@router.put("/{project_id}/uploads/{upload_id}", response_model=schemas.UploadSessionSchema)
+async def upload_chunk_endpoint(project_id: int, upload_id: str, offset: int, request: Request, db: AsyncSession = Depends(database.get_db)):
+    """
+    Writes the raw request body at `offset`. The offset may re-send already received bytes but must not leave a gap;
+    on a 409 the client resumes from the `received_bytes` reported by GET on the upload. The session row stays locked
+    until the new `received_bytes` is committed, so concurrent chunks for one upload are written one after another.
+    """
+    db_upload = await crud.get_upload_session(db, upload_id=upload_id, project_id=project_id, for_update=True)
+    if not db_upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if offset < 0 or offset > db_upload.received_bytes:
+        raise HTTPException(status_code=409, detail=f"Offset {offset} does not match received bytes {db_upload.received_bytes}")
+    max_bytes = db_upload.total_size - offset if db_upload.total_size is not None else None
+    content_length = request.headers.get("content-length")
+    if max_bytes is not None and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise HTTPException(status_code=400, detail="Upload exceeds declared total_size")
+
+    try:
+        written = await upload_service.write_stream(request.stream(), upload_service.partial_upload_path(upload_id), offset=offset, max_bytes=max_bytes)
+    except upload_service.UploadTooLarge:
+        await upload_service.truncate_partial_file(upload_id, db_upload.received_bytes)
+        raise HTTPException(status_code=400, detail="Upload exceeds declared total_size")
+    received_bytes = offset + written
+    await crud.set_upload_received_bytes(db, upload_id, received_bytes)
+    db_upload.received_bytes = received_bytes
+    return _upload_session_response(db_upload)
+
+@router.post("/{project_id}/uploads/{upload_id}/finalize", response_model=schemas.VideoSchema)
+async def finalize_upload_endpoint(project_id: int, upload_id: str, finalize: schemas.UploadFinalize, db: AsyncSession = Depends(database.get_db)):
+    # Locked until the video is registered, so a late chunk cannot change the file while it is hashed and moved.
+    db_upload = await crud.get_upload_session(db, upload_id=upload_id, project_id=project_id, for_update=True)
+    if not db_upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if db_upload.received_bytes == 0:
+        raise HTTPException(status_code=400, detail="Upload is empty")
+    if db_upload.total_size is not None and db_upload.received_bytes != db_upload.total_size:
+        raise HTTPException(status_code=409, detail=f"Upload incomplete: {db_upload.received_bytes} of {db_upload.total_size} bytes received")
+
+    content_hash = await upload_service.sha256_of_file(upload_service.partial_upload_path(upload_id))
+    if finalize.sha256 and finalize.sha256.lower() != content_hash:
+        raise HTTPException(status_code=400, detail="Checksum mismatch, upload is corrupted")
+
+    await crud.delete_upload_session(db, upload_id, commit=False)
+    return await _register_uploaded_video(db, project_id, db_upload.filename, upload_service.partial_upload_path(upload_id), content_hash)
+
+@router.delete("/{project_id}/uploads/{upload_id}", status_code=http_status.HTTP_204_NO_CONTENT)
+async def abort_upload_endpoint(project_id: int, upload_id: str, db: AsyncSession = Depends(database.get_db)):
+    if not await crud.get_upload_session(db, upload_id=upload_id, project_id=project_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    await crud.delete_upload_session(db, upload_id=upload_id)
+    upload_service.discard_partial_file(upload_id)
+    return Response(status_code=http_status.HTTP_204_NO_CONTENT)
 
 @router.delete("/{project_id}/videos/{video_id}", status_code=http_status.HTTP_204_NO_CONTENT)
-def delete_video_from_project_endpoint(
+async def delete_video_from_project_endpoint(
     project_id: int, 
     video_id: int,
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
-    db_video = crud.get_video(db, video_id=video_id)
+    db_video = await crud.get_video(db, video_id=video_id)
     if not db_video:
         raise HTTPException(status_code=404, detail="Video not found")
     if db_video.project_id != project_id: 
         raise HTTPException(status_code=403, detail="Video does not belong to this project")
     
-    deleted_video = crud.delete_video(db, video_id=video_id)
+    deleted_video = await crud.delete_video(db, video_id=video_id)
     if not deleted_video: 
         raise HTTPException(status_code=404, detail="Video not found during deletion attempt")
     
-    print(f"Video ID {video_id} deleted from project ID {project_id}")
+    logger.info(f"Video ID {video_id} deleted from project ID {project_id}")
     return Response(status_code=http_status.HTTP_204_NO_CONTENT)
\ No newline at end of file
@@ -1,27 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import crud, schemas, database
 from ..services import chat_service
+from ..services.openai_utils import stream_answer_question_from_transcript
+from ..services.transcript_cache import transcript_cache
 import json 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/public/videos", 
     tags=["public_videos"],
 )
 
 @router.get("/{public_slug}", response_model=schemas.PublicVideoSchema)
-def read_public_video_endpoint(public_slug: str, db: Session = Depends(database.get_db)):
-    db_video = crud.get_video_by_public_slug(db, public_slug=public_slug)
+async def read_public_video_endpoint(public_slug: str, db: AsyncSession = Depends(database.get_db)):
+    db_video = await crud.get_video_by_public_slug(db, public_slug=public_slug)
     if not db_video:
         raise HTTPException(status_code=404, detail="Public video not found or not available")
     
-    parsed_transcript = None
-    if db_video.transcript:
-        try:
-            parsed_transcript = json.loads(db_video.transcript)
-        except json.JSONDecodeError:
-            print(f"Error decoding transcript JSON for public video slug {public_slug}")
-            parsed_transcript = {"segments": [], "key_moments": [{"label":"Error parsing transcript", "timestamp_start": "00:00:00.000"}]}
+    cached = await transcript_cache.get_or_load(db, db_video.id, db_video.transcript_version)
+    parsed_transcript = cached.transcript
 
 
     parsed_quiz_data = None
@@ -29,12 +30,13 @@ def read_public_video_endpoint(public_slug: str, db: Session = Depends(database.
         try:
             parsed_quiz_data = json.loads(db_video.quiz_data)
         except json.JSONDecodeError:
-            print(f"Error decoding quiz_data JSON for public video slug {public_slug}")
+            logger.warning(f"Error decoding quiz_data JSON for public video slug {public_slug}")
             parsed_quiz_data = {"title": "Error", "questions": []}
             
     return schemas.PublicVideoSchema(
         filename=db_video.filename,
         filepath=db_video.filepath, 
+        hls_manifest_url=db_video.hls_manifest_url,
         transcript=parsed_transcript,
         mindmap_data=db_video.mindmap_data,
         quiz_data=parsed_quiz_data,
@@ -47,11 +49,42 @@ def read_public_video_endpoint(public_slug: str, db: Session = Depends(database.
 async def chat_with_video_endpoint(
     public_slug: str,
     chat_request: schemas.ChatRequest,
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
-    print(f"API: Received chat request for slug '{public_slug}' with question: '{chat_request.question}'")
+    logger.info(f"Received chat request for slug '{public_slug}' with question: '{chat_request.question}'")
     response_data = await chat_service.process_chat_request(public_slug, chat_request.model_dump(), db)
     if "Error:" in response_data["answer"]:
         # You might want to handle different error types with different status codes
         raise HTTPException(status_code=404, detail=response_data["answer"])
     return response_data
+
+
+@router.post("/{public_slug}/chat/stream")
+async def stream_chat_with_video_endpoint(
+    public_slug: str,
+    chat_request: schemas.ChatRequest,
+    request: Request,
+    db: AsyncSession = Depends(database.get_db)
+):
+    """
+    Server-sent events variant of the chat endpoint: `token` events carry answer text as it is generated,
+    followed by one `done` event with token usage and timings (or an `error` event).
+    """
+    logger.info(f"Received streaming chat request for slug '{public_slug}' with question: '{chat_request.question}'")
+    transcript_context, message = await chat_service.resolve_chat_context(public_slug, chat_request.question, db)
+    await db.commit(); await db.close() # the answer can stream for a long time; do not hold a pooled connection for it
+    if transcript_context is None:
+        raise HTTPException(status_code=404, detail=message)
+
+    async def event_stream():
+        events = stream_answer_question_from_transcript(transcript_context, chat_request.question, chat_request.chat_history or [])
+        try:
+            async for event, data in events:
+                if await request.is_disconnected():
+                    logger.info(f"Client disconnected from chat stream for slug '{public_slug}'.")
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
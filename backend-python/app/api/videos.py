@@ -1,60 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Response, status as http_status
-from sqlalchemy.orm import Session
-from typing import Optional, List 
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query, status as http_status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List, Any, Dict 
 from .. import crud, schemas, database, models
-from ..services import mindmap_service, quiz_service, transcription_service
+from ..services import job_queue, progress_events
+from ..services.utils import transcript_document
+import os
+import json
 import uuid
+import asyncio
 
 router = APIRouter(prefix="/videos", tags=["videos"])
 
+# Seconds between SSE comment lines that keep idle event streams (and proxies) from timing out.
+PROGRESS_KEEPALIVE_SECONDS = float(os.getenv("PROGRESS_KEEPALIVE_SECONDS", "15"))
+
+@router.get("/", response_model=schemas.VideoListPage)
+async def list_videos_endpoint(cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=200), tag: Optional[List[str]] = Query(None), db: AsyncSession = Depends(database.get_db)):
+    """Newest-first video summaries across all projects, keyset-paginated and tag-filtered like GET /projects/{id}/videos."""
+    try: videos, next_cursor = await crud.get_videos_page(db, cursor=cursor, limit=limit, with_project=True, tags=tag)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+    return schemas.VideoListPage(items=videos, next_cursor=next_cursor)
+
 @router.get("/{video_id}", response_model=schemas.VideoSchema)
-def get_video_endpoint(video_id: int, db: Session = Depends(database.get_db)):
-    db_video = crud.get_video(db, video_id=video_id)
+async def get_video_endpoint(video_id: int, db: AsyncSession = Depends(database.get_db)):
+    db_video = await crud.get_video_detail(db, video_id=video_id)
     if not db_video: raise HTTPException(status_code=404, detail="Video not found")
     return db_video
 
+@router.get("/{video_id}/events")
+async def video_events_endpoint(video_id: int, request: Request, db: AsyncSession = Depends(database.get_db)):
+    """
+    Server-sent events for one video: a `status` event with the current status first, then `status`, `stage`
+    and `progress` events from the pipeline as they happen. A `resync` event means some events may have been
+    missed and the video should be re-read.
+    """
+    # Subscribe before reading the snapshot so no status change can fall in between.
+    queue = await progress_events.progress_broker.subscribe(video_id)
+    state = await crud.get_video_state(db, video_id=video_id)
+    await db.close() # the stream can stay open for a long time; do not hold a pooled connection for it
+    if not state:
+        progress_events.progress_broker.unsubscribe(video_id, queue)
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    async def event_stream():
+        try:
+            yield f"event: status\ndata: {json.dumps({'video_id': video_id, 'event': 'status', 'status': state.status})}\n\n"
+            while True:
+                try: event = await asyncio.wait_for(queue.get(), timeout=PROGRESS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected(): break
+                    yield ": keepalive\n\n"; continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            progress_events.progress_broker.unsubscribe(video_id, queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/{video_id}/transcript", response_model=Dict[str, Any])
+async def get_video_transcript_endpoint(video_id: int, db: AsyncSession = Depends(database.get_db)):
+    db_video = await crud.get_video(db, video_id=video_id)
+    if not db_video: raise HTTPException(status_code=404, detail="Video not found")
+    if not db_video.has_transcript: raise HTTPException(status_code=404, detail="Transcript not available")
+    return transcript_document(await crud.get_transcript_segments(db, video_id=video_id), await crud.get_key_moments(db, video_id=video_id))
+
+@router.get("/{video_id}/stage-runs", response_model=List[schemas.PipelineStageRunSchema])
+async def get_video_stage_runs_endpoint(video_id: int, db: AsyncSession = Depends(database.get_db)):
+    if not await crud.get_video(db, video_id=video_id): raise HTTPException(status_code=404, detail="Video not found")
+    return await crud.get_pipeline_stage_runs(db, video_id=video_id)
+
+@router.get("/{video_id}/transcript/segments", response_model=List[schemas.TranscriptSegmentSchema])
+async def get_video_transcript_segments_endpoint(video_id: int, start: Optional[float] = None, end: Optional[float] = None, db: AsyncSession = Depends(database.get_db)):
+    """Transcript segments overlapping [start, end) seconds, e.g. ?start=600&end=720 for 10:00-12:00."""
+    if not await crud.get_video(db, video_id=video_id): raise HTTPException(status_code=404, detail="Video not found")
+    return await crud.get_transcript_segments(db, video_id=video_id, start_seconds=start, end_seconds=end)
+
 @router.delete("/{video_id}", status_code=http_status.HTTP_204_NO_CONTENT)
-def delete_video_endpoint(video_id: int, db: Session = Depends(database.get_db)):
-    deleted_video = crud.delete_video(db, video_id=video_id)
+async def delete_video_endpoint(video_id: int, db: AsyncSession = Depends(database.get_db)):
+    deleted_video = await crud.delete_video(db, video_id=video_id)
     if not deleted_video: raise HTTPException(status_code=404, detail="Video not found")
     return Response(status_code=http_status.HTTP_204_NO_CONTENT)
 
 @router.post("/{video_id}/generate-mindmap", status_code=http_status.HTTP_202_ACCEPTED)
-async def generate_mindmap_endpoint(video_id: int, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db)):
-    db_video = crud.get_video(db, video_id=video_id)
-    if not db_video or db_video.status != "completed":
+async def generate_mindmap_endpoint(video_id: int, force: bool = False, db: AsyncSession = Depends(database.get_db)):
+    # Compare-and-set in the job's transaction, so concurrent clicks cannot both queue a generation.
+    if not await crud.transition_video_status(db, video_id, from_statuses=["completed"], to_status="generating_mindmap", commit=False):
         raise HTTPException(status_code=400, detail="Video transcript not available or video not fully processed.")
-    crud.update_video_data(db=db, video_id=video_id, status="generating_mindmap", mindmap_data=None) 
-    background_tasks.add_task(mindmap_service.process_mindmap_generation, video_id, database.SessionLocal)
+    await job_queue.enqueue_job(db, job_queue.JOB_TYPE_MINDMAP, {"video_id": video_id, "bypass_cache": force})
     return {"message": "Mind map generation started."}
 
 @router.post("/{video_id}/generate-quiz", status_code=http_status.HTTP_202_ACCEPTED)
-async def generate_quiz_endpoint(video_id: int, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db)):
-    db_video = crud.get_video(db, video_id=video_id)
-    if not db_video or db_video.status != "completed":
+async def generate_quiz_endpoint(video_id: int, force: bool = False, db: AsyncSession = Depends(database.get_db)):
+    db_video = await crud.transition_video_status(db, video_id, from_statuses=["completed"], to_status="generating_quiz", commit=False)
+    if not db_video:
         raise HTTPException(status_code=400, detail="Video transcript not available or video not fully processed.")
-    crud.update_video_data(db=db, video_id=video_id, status="generating_quiz", quiz_data=None) 
-    background_tasks.add_task(quiz_service.process_quiz_generation, video_id, db_video.filename, database.SessionLocal)
+    await job_queue.enqueue_job(db, job_queue.JOB_TYPE_QUIZ, {"video_id": video_id, "video_title": db_video.filename, "bypass_cache": force})
     return {"message": "Quiz generation started."}
 
+@router.get("/{video_id}/quiz/chapters", response_model=List[schemas.QuizChapterSchema])
+async def get_quiz_chapters_endpoint(video_id: int, db: AsyncSession = Depends(database.get_db)):
+    """The quiz per chapter, including chapters whose generation failed (left out of quiz_data) and why."""
+    if not await crud.get_video(db, video_id=video_id): raise HTTPException(status_code=404, detail="Video not found")
+    return await crud.get_quiz_chapters(db, video_id=video_id)
+
+@router.post("/{video_id}/quiz/chapters/{position}/regenerate", status_code=http_status.HTTP_202_ACCEPTED)
+async def regenerate_quiz_chapter_endpoint(video_id: int, position: int, db: AsyncSession = Depends(database.get_db)):
+    """Regenerates one chapter's questions (e.g. a failed one) and re-merges the quiz; the other chapters are kept."""
+    if position not in {chapter.position for chapter in await crud.get_quiz_chapters(db, video_id=video_id)}:
+        raise HTTPException(status_code=404, detail="Quiz chapter not found")
+    db_video = await crud.transition_video_status(db, video_id, from_statuses=["completed"], to_status="generating_quiz", commit=False)
+    if not db_video:
+        raise HTTPException(status_code=400, detail="Video transcript not available or video not fully processed.")
+    await job_queue.enqueue_job(db, job_queue.JOB_TYPE_QUIZ, {"video_id": video_id, "video_title": db_video.filename, "chapters": [position]})
+    return {"message": "Quiz chapter regeneration started."}
+
 @router.put("/{video_id}/tags", response_model=schemas.VideoSchema)
-def update_video_tags_endpoint(video_id: int, tags_update: schemas.VideoTagUpdate, db: Session = Depends(database.get_db)):
-    updated_video = crud.update_video_data(db=db, video_id=video_id, tags=tags_update.tags)
+async def update_video_tags_endpoint(video_id: int, tags_update: schemas.VideoTagUpdate, db: AsyncSession = Depends(database.get_db)):
+    updated_video = await crud.update_video_data(db=db, video_id=video_id, tags=tags_update.tags)
     if not updated_video: raise HTTPException(status_code=404, detail="Video not found")
-    return updated_video
+    return await crud.get_video_detail(db, video_id=video_id)
 
 @router.post("/{video_id}/publish", response_model=schemas.VideoSchema)
-def publish_video_endpoint(video_id: int, db: Session = Depends(database.get_db)):
-    db_video = crud.get_video(db, video_id=video_id)
+async def publish_video_endpoint(video_id: int, db: AsyncSession = Depends(database.get_db)):
+    db_video = await crud.get_video(db, video_id=video_id)
     if not db_video or db_video.status != "completed":
         raise HTTPException(status_code=400, detail="Video must be processed to be published.")
     slug = db_video.public_slug or str(uuid.uuid4())
-    updated_video = crud.update_video_data(db=db, video_id=video_id, is_public=True, public_slug=slug)
+    updated_video = await crud.update_video_data(db=db, video_id=video_id, is_public=True, public_slug=slug)
     if not updated_video: raise HTTPException(status_code=500, detail="Failed to publish video")
-    return updated_video
+    return await crud.get_video_detail(db, video_id=video_id)
 
 @router.post("/{video_id}/unpublish", response_model=schemas.VideoSchema)
-def unpublish_video_endpoint(video_id: int, db: Session = Depends(database.get_db)):
-    updated_video = crud.update_video_data(db=db, video_id=video_id, is_public=False)
+async def unpublish_video_endpoint(video_id: int, db: AsyncSession = Depends(database.get_db)):
+    updated_video = await crud.update_video_data(db=db, video_id=video_id, is_public=False)
     if not updated_video: raise HTTPException(status_code=404, detail="Video not found")
-    return updated_video
\ No newline at end of file
+    return await crud.get_video_detail(db, video_id=video_id)
\ No newline at end of file
@@ -1,45 +1,338 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List as PyList 
+import logging
+from sqlalchemy import func, select, insert, update, delete, literal, tuple_, case, or_, column, Integer, String, values as values_table
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload, undefer
+from typing import Optional, List as PyList, Any, Dict 
 from . import models, schemas 
-import json, uuid, os 
+from .services.transcript_cache import transcript_cache
+from .services import progress_events, hls_packaging, metrics
+from datetime import datetime
+import json, uuid, os, base64 
 
-def get_project_by_name(db: Session, name: str): return db.query(models.Project).filter(models.Project.name == name).first()
-def create_project(db: Session, project: schemas.ProjectCreate):
-    db_project = models.Project(name=project.name); db.add(db_project); db.commit(); db.refresh(db_project); return db_project
-def get_project(db: Session, project_id: int): return db.query(models.Project).filter(models.Project.id == project_id).first()
-def get_projects(db: Session, skip: int = 0, limit: int = 100): return db.query(models.Project).offset(skip).limit(limit).all()
-def create_video_for_project(db: Session, video: schemas.VideoCreate, project_id: int, filepath: str):
-    db_video = models.Video(filename=video.filename, project_id=project_id, filepath=filepath, status="uploaded", tags=[]); db.add(db_video); db.commit(); db.refresh(db_video); return db_video
-def update_video_data(db: Session, video_id: int, status: Optional[str]=None, transcript: Optional[str]=None, summary: Optional[str]=None, mindmap_data: Optional[str]=None, quiz_data: Optional[str]=None, tags: Optional[PyList[str]]=None, is_public: Optional[bool]=None, public_slug: Optional[str]=None):
-    db_video = db.query(models.Video).filter(models.Video.id == video_id).first()
-    if db_video:
-        if status is not None: db_video.status = status
-        if transcript is not None: db_video.transcript = transcript
-        if summary is not None: db_video.summary = summary
-        if mindmap_data is not None: db_video.mindmap_data = mindmap_data
-        if quiz_data is not None: db_video.quiz_data = quiz_data
-        if tags is not None: db_video.tags = tags
-        if is_public is not None:
-            db_video.is_public = is_public
-            if is_public and not db_video.public_slug: db_video.public_slug = str(uuid.uuid4())
-            elif not is_public: db_video.public_slug = None
-        if public_slug is not None: db_video.public_slug = public_slug
-        try: db.commit(); db.refresh(db_video)
-        except Exception as e: print(f"[DB_UPDATE_ERROR] Video ID {video_id}: {e}"); db.rollback()
+logger = logging.getLogger(__name__)
+
+def _timed(function):
+    """
+    Times a crud function under its own name in crud_query_duration_seconds. Only functions no other crud function
+    awaits are decorated, so no call is observed twice; the rest show up in db_statement_duration_seconds.
+    """
+    return metrics.timed(metrics.CRUD_QUERY_DURATION, function.__name__)(function)
+
+@_timed
+async def get_project_by_name(db: AsyncSession, name: str): return (await db.scalars(select(models.Project).where(models.Project.name == name))).first()
+@_timed
+async def create_project(db: AsyncSession, project: schemas.ProjectCreate):
+    db_project = models.Project(name=project.name); db.add(db_project); await db.commit(); await db.refresh(db_project, attribute_names=["id", "name", "created_at", "video_count"]); return db_project
+@_timed
+async def get_project(db: AsyncSession, project_id: int): return await db.get(models.Project, project_id)
+@_timed
+async def get_project_with_counts(db: AsyncSession, project_id: int): return (await db.scalars(select(models.Project).options(undefer(models.Project.video_count)).where(models.Project.id == project_id))).first()
+def encode_cursor(*values) -> str: return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+def decode_cursor(cursor: str, *types: type) -> list:
+    """
+    Inverse of encode_cursor, checked against the `types` of the values it should hold; raises ValueError for
+    anything that did not come from it.
+    """
+    try: values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e: raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list) or len(values) != len(types): raise ValueError("Invalid cursor")
+    if any(isinstance(value, bool) or not isinstance(value, expected) for value, expected in zip(values, types)): raise ValueError("Invalid cursor")
+    return values
+@_timed
+async def get_projects_page(db: AsyncSession, cursor: Optional[str] = None, limit: int = 100):
+    """Projects in id order with their video counts, one page at a time. Returns (projects, next_cursor)."""
+    query = select(models.Project).options(undefer(models.Project.video_count))
+    if cursor: query = query.where(models.Project.id > decode_cursor(cursor, int)[0])
+    projects = (await db.scalars(query.order_by(models.Project.id).limit(limit + 1))).all()
+    next_cursor = encode_cursor(projects[limit - 1].id) if len(projects) > limit else None
+    return projects[:limit], next_cursor
+# Columns a video listing needs; everything else (mind map, quiz, summary) stays in the database.
+VIDEO_SUMMARY_COLUMNS = (models.Video.id, models.Video.project_id, models.Video.filename, models.Video.filepath, models.Video.status, models.Video.tags,
+                         models.Video.is_public, models.Video.public_slug, models.Video.uploaded_at, models.Video.transcript_segment_count,
+                         models.Video.has_mindmap, models.Video.has_quiz)
+@_timed
+async def get_videos_page(db: AsyncSession, project_id: Optional[int] = None, cursor: Optional[str] = None, limit: int = 50, with_project: bool = False, tags: Optional[PyList[str]] = None):
+    """
+    Newest-first video summaries (optionally of one project, optionally only those carrying all of `tags`),
+    keyset-paginated on (uploaded_at, id). Returns (videos, next_cursor).
+    """
+    query = select(models.Video).options(load_only(*VIDEO_SUMMARY_COLUMNS))
+    if with_project: query = query.options(selectinload(models.Video.project).load_only(models.Project.name))
+    if project_id is not None: query = query.where(models.Video.project_id == project_id)
+    if tags: query = query.where(models.Video.tags.contains(tags)) # tags @> '[...]', served by ix_videos_tags
+    if cursor:
+        uploaded_at, video_id = decode_cursor(cursor, str, int)
+        query = query.where(tuple_(models.Video.uploaded_at, models.Video.id) < tuple_(datetime.fromisoformat(uploaded_at), video_id))
+    videos = (await db.scalars(query.order_by(models.Video.uploaded_at.desc(), models.Video.id.desc()).limit(limit + 1))).all()
+    next_cursor = encode_cursor(videos[limit - 1].uploaded_at.isoformat(), videos[limit - 1].id) if len(videos) > limit else None
+    return videos[:limit], next_cursor
+@_timed
+async def get_tag_facets(db: AsyncSession, project_id: int, tags: Optional[PyList[str]] = None, limit: int = 100):
+    """
+    (tag, count) pairs over the project's videos, most used first. With `tags`, counts only the videos carrying all
+    of them (so the facets narrow as filters are added). Returns (facets, matching video count).
+    """
+    video = models.Video
+    conditions = [video.project_id == project_id] + ([video.tags.contains(tags)] if tags else [])
+    tag = func.jsonb_array_elements_text(video.tags).column_valued("tag")
+    count = func.count().label("count")
+    facets = (await db.execute(select(tag.label("tag"), count).select_from(video).where(*conditions).group_by(tag).order_by(count.desc(), tag).limit(limit))).all()
+    return facets, await db.scalar(select(func.count(video.id)).where(*conditions)) or 0
+def normalize_tags(tags: PyList[str]) -> PyList[str]:
+    """Trimmed, non-empty and de-duplicated (first spelling wins, case-insensitively), in their original order."""
+    seen, normalized = set(), []
+    for tag in tags:
+        tag = (tag or "").strip()
+        if tag and tag.lower() not in seen: seen.add(tag.lower()); normalized.append(tag)
+    return normalized
+@_timed
+async def create_video_for_project(db: AsyncSession, video: schemas.VideoCreate, project_id: int, filepath: str, content_hash: Optional[str] = None, status: str = "uploaded", tags: Optional[PyList[str]] = None, hls_manifest_path: Optional[str] = None, commit: bool = True):
+    db_video = models.Video(filename=video.filename, project_id=project_id, filepath=filepath, content_hash=content_hash, status=status, tags=tags or [], hls_manifest_path=hls_manifest_path); db.add(db_video); await db.flush()
+    if commit: await db.commit(); await db.refresh(db_video)
     return db_video
-def get_video(db: Session, video_id: int) -> Optional[models.Video]: return db.query(models.Video).filter(models.Video.id == video_id).first()
-def get_video_by_public_slug(db: Session, public_slug: str) -> Optional[models.Video]: return db.query(models.Video).filter(models.Video.public_slug == public_slug, models.Video.is_public == True).first()
-def delete_video(db: Session, video_id: int) -> Optional[models.Video]:
-    db_video = db.query(models.Video).filter(models.Video.id == video_id).first()
+@_timed
+async def set_hls_manifest(db: AsyncSession, filepath: str, hls_manifest_path: str) -> int:
+    """Points every video stored in the blob at its HLS manifest; returns how many rows changed."""
+    result = await db.execute(update(models.Video).where(models.Video.filepath == filepath).values(hls_manifest_path=hls_manifest_path))
+    await db.commit()
+    return result.rowcount
+async def _notify_status(db: AsyncSession, statuses: Dict[int, str]) -> None:
+    """Queues `status` progress events in the current transaction; subscribers see them once it commits."""
+    if statuses: await db.execute(progress_events.notify_statement([{"video_id": video_id, "event": "status", "status": status} for video_id, status in statuses.items()]))
+# What the single-statement video updates return instead of a loaded Video.
+VIDEO_STATE_COLUMNS = (models.Video.id, models.Video.filename, models.Video.status, models.Video.is_public, models.Video.public_slug, models.Video.transcript_version)
+@_timed
+async def update_video_data(db: AsyncSession, video_id: int, status: Optional[str]=None, summary: Optional[str]=None, mindmap_data: Optional[str]=None, quiz_data: Optional[str]=None, tags: Optional[PyList[str]]=None, is_public: Optional[bool]=None, public_slug: Optional[str]=None, commit: bool = True):
+    """
+    Writes only the given columns in one UPDATE ... RETURNING, without loading the row. Returns the video's new
+    VIDEO_STATE_COLUMNS, or None when it does not exist.
+    """
+    video = models.Video
+    values: Dict[Any, Any] = {}
+    if status is not None: values[video.status] = status
+    if summary is not None: values[video.summary] = summary
+    if mindmap_data is not None: values[video.mindmap_data] = mindmap_data
+    if quiz_data is not None: values[video.quiz_data] = quiz_data
+    if tags is not None: values[video.tags] = normalize_tags(tags)
+    if is_public is not None: values[video.is_public] = is_public
+    if public_slug is not None: values[video.public_slug] = public_slug
+    elif is_public is not None: values[video.public_slug] = func.coalesce(video.public_slug, str(uuid.uuid4())) if is_public else None
+    # Parsed transcripts are cached per (video id, transcript_version); bumping the version invalidates them everywhere.
+    publish_changes = [column.is_distinct_from(values[column]) for column in (video.is_public, video.public_slug) if column in values]
+    if publish_changes: values[video.transcript_version] = video.transcript_version + case((or_(*publish_changes), 1), else_=0)
+    if not values: return await get_video_state(db, video_id)
+    try:
+        row = (await db.execute(update(video).where(video.id == video_id).values(values).returning(*VIDEO_STATE_COLUMNS))).first()
+        if row is not None and status is not None: await _notify_status(db, {video_id: status})
+        if commit: await db.commit()
+        if publish_changes: transcript_cache.invalidate(video_id)
+        return row
+    except Exception as e: logger.error(f"Video ID {video_id}: Update failed: {e}"); await db.rollback(); return None
+async def get_video_state(db: AsyncSession, video_id: int): return (await db.execute(select(*VIDEO_STATE_COLUMNS).where(models.Video.id == video_id))).first()
+@_timed
+async def transition_video_status(db: AsyncSession, video_id: int, from_statuses: PyList[str], to_status: str, commit: bool = True):
+    """
+    Compare-and-set: moves the video to `to_status` only if its status is currently one of `from_statuses`.
+    Returns the new VIDEO_STATE_COLUMNS, or None when the video is missing or was in another status.
+    """
+    query = update(models.Video).where(models.Video.id == video_id, models.Video.status.in_(from_statuses)).values({models.Video.status: to_status})
+    row = (await db.execute(query.returning(*VIDEO_STATE_COLUMNS))).first()
+    if row is not None: await _notify_status(db, {video_id: to_status})
+    if commit: await db.commit()
+    return row
+@_timed
+async def bulk_update_video_status(db: AsyncSession, statuses: Dict[int, str], from_statuses: Optional[PyList[str]] = None, commit: bool = True) -> PyList[int]:
+    """
+    Applies {video_id: status} in one UPDATE ... FROM (VALUES ...) statement. With `from_statuses`, only videos currently
+    in one of them change. Returns the ids that were updated.
+    """
+    if not statuses: return []
+    changes = values_table(column("id", Integer), column("status", String), name="status_changes").data(list(statuses.items()))
+    query = update(models.Video).where(models.Video.id == changes.c.id).values({models.Video.status: changes.c.status})
+    if from_statuses is not None: query = query.where(models.Video.status.in_(from_statuses))
+    updated = (await db.scalars(query.returning(models.Video.id).execution_options(synchronize_session=False))).all()
+    await _notify_status(db, {video_id: statuses[video_id] for video_id in updated})
+    if commit: await db.commit()
+    return list(updated)
+async def _insert_key_moments(db: AsyncSession, video_id: int, key_moments: PyList[Dict[str, Any]]) -> None:
+    await db.execute(delete(models.KeyMoment).where(models.KeyMoment.video_id == video_id))
+    if key_moments:
+        await db.execute(insert(models.KeyMoment), [{"video_id": video_id, "position": i, "label": moment["label"], "start_seconds": float(moment.get("start", 0.0)), "details": moment.get("details")} for i, moment in enumerate(key_moments)])
+async def _commit_transcript_change(db: AsyncSession, video_id: int, values: Dict[Any, Any]) -> None:
+    values[models.Video.transcript_version] = models.Video.transcript_version + 1
+    await db.execute(update(models.Video).where(models.Video.id == video_id).values(values).execution_options(synchronize_session=False))
+    if models.Video.status in values: await _notify_status(db, {video_id: values[models.Video.status]})
+    try: await db.commit(); transcript_cache.invalidate(video_id)
+    except Exception as e: logger.error(f"Video ID {video_id}: Transcript update failed: {e}"); await db.rollback()
+@_timed
+async def save_transcript(db: AsyncSession, video_id: int, segments: PyList[Dict[str, Any]], key_moments: PyList[Dict[str, Any]], status: Optional[str] = None) -> None:
+    """Replaces the video's transcript. `segments` are {"start", "end", "text"} and `key_moments` {"label", "start", "details"?}, times in seconds."""
+    await db.execute(delete(models.TranscriptSegment).where(models.TranscriptSegment.video_id == video_id))
+    if segments:
+        await db.execute(insert(models.TranscriptSegment), [{"video_id": video_id, "position": i, "start_seconds": float(seg["start"]), "end_seconds": float(seg["end"]), "text": seg["text"]} for i, seg in enumerate(segments)])
+    await _insert_key_moments(db, video_id, key_moments)
+    # The chat retrieval index is derived from the segments; drop it so it is rebuilt from the new text.
+    await db.execute(delete(models.VideoRetrievalIndex).where(models.VideoRetrievalIndex.video_id == video_id))
+    # The digest (summary) was condensed from the old transcript.
+    values = {models.Video.transcript_segment_count: len(segments), models.Video.summary: None}
+    if status is not None: values[models.Video.status] = status
+    await _commit_transcript_change(db, video_id, values)
+@_timed
+async def save_key_moments(db: AsyncSession, video_id: int, key_moments: PyList[Dict[str, Any]]) -> None:
+    await _insert_key_moments(db, video_id, key_moments)
+    await _commit_transcript_change(db, video_id, {})
+@_timed
+async def copy_transcript(db: AsyncSession, source_video_id: int, target_video_id: int) -> None:
+    """Copies segments and key moments between videos inside the database; the caller commits."""
+    segment = models.TranscriptSegment; moment = models.KeyMoment
+    await db.execute(insert(segment).from_select(["video_id", "position", "start_seconds", "end_seconds", "text"],
+        select(literal(target_video_id), segment.position, segment.start_seconds, segment.end_seconds, segment.text).where(segment.video_id == source_video_id)))
+    await db.execute(insert(moment).from_select(["video_id", "position", "label", "start_seconds", "details"],
+        select(literal(target_video_id), moment.position, moment.label, moment.start_seconds, moment.details).where(moment.video_id == source_video_id)))
+    source = (await db.execute(select(models.Video.transcript_segment_count, models.Video.summary).where(models.Video.id == source_video_id))).first()
+    await db.execute(update(models.Video).where(models.Video.id == target_video_id).values({models.Video.transcript_segment_count: source.transcript_segment_count, models.Video.summary: source.summary}).execution_options(synchronize_session=False))
+@_timed
+async def get_transcript_segments(db: AsyncSession, video_id: int, start_seconds: Optional[float] = None, end_seconds: Optional[float] = None) -> PyList[models.TranscriptSegment]:
+    """Segments overlapping [start_seconds, end_seconds), in order; either bound may be omitted."""
+    query = select(models.TranscriptSegment).where(models.TranscriptSegment.video_id == video_id)
+    if start_seconds is not None: query = query.where(models.TranscriptSegment.end_seconds > start_seconds)
+    if end_seconds is not None: query = query.where(models.TranscriptSegment.start_seconds < end_seconds)
+    return (await db.scalars(query.order_by(models.TranscriptSegment.position))).all()
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=12, MaxFragments=1"
+@_timed
+async def search_project_transcripts(db: AsyncSession, project_id: int, query_text: str, limit: int = 20, offset: int = 0):
+    """
+    Ranked transcript segments of the project's videos matching a web-search style query ("gradient descent",
+    "loss -overfitting", ...). Matching uses the GIN index on search_vector; ts_headline only runs on the page.
+    """
+    segment = models.TranscriptSegment
+    ts_query = func.websearch_to_tsquery(models.SEARCH_TEXT_CONFIG, query_text)
+    rank = func.ts_rank_cd(segment.search_vector, ts_query).label("rank")
+    hits = (select(segment.video_id, models.Video.filename.label("video_filename"), segment.position, segment.start_seconds, segment.end_seconds, segment.text, rank)
+            .join(models.Video, models.Video.id == segment.video_id)
+            .where(models.Video.project_id == project_id, segment.search_vector.op("@@")(ts_query))
+            .order_by(rank.desc(), segment.video_id, segment.position).limit(limit).offset(offset).subquery())
+    snippet = func.ts_headline(models.SEARCH_TEXT_CONFIG, hits.c.text, func.websearch_to_tsquery(models.SEARCH_TEXT_CONFIG, query_text), SEARCH_HEADLINE_OPTIONS)
+    query = select(hits.c.video_id, hits.c.video_filename, hits.c.position, hits.c.start_seconds, hits.c.end_seconds, hits.c.rank, snippet.label("snippet"))
+    return (await db.execute(query.order_by(hits.c.rank.desc(), hits.c.video_id, hits.c.position))).all()
+@_timed
+async def get_transcript_text(db: AsyncSession, video_id: int) -> str:
+    segment = models.TranscriptSegment
+    return await db.scalar(select(func.string_agg(segment.text, aggregate_order_by(literal(" "), segment.position))).where(segment.video_id == video_id)) or ""
+@_timed
+async def get_key_moments(db: AsyncSession, video_id: int) -> PyList[models.KeyMoment]: return (await db.scalars(select(models.KeyMoment).where(models.KeyMoment.video_id == video_id).order_by(models.KeyMoment.position))).all()
+@_timed
+async def get_quiz_chapters(db: AsyncSession, video_id: int) -> PyList[models.QuizChapter]: return (await db.scalars(select(models.QuizChapter).where(models.QuizChapter.video_id == video_id).order_by(models.QuizChapter.position))).all()
+@_timed
+async def save_quiz_chapters(db: AsyncSession, video_id: int, chapters: PyList[Dict[str, Any]], chapter_count: int, commit: bool = True) -> None:
+    """
+    Replaces the given chapters ({"position", "label", "start_seconds", "content_hash", "status", "questions", "error"}) and drops
+    chapters at or past `chapter_count` (left over from an earlier set of key moments); other chapters are kept as they are.
+    """
+    chapter = models.QuizChapter
+    await db.execute(delete(chapter).where(chapter.video_id == video_id, or_(chapter.position.in_([c["position"] for c in chapters]), chapter.position >= chapter_count)))
+    if chapters: await db.execute(insert(chapter), [{"video_id": video_id, **c} for c in chapters])
+    if commit: await db.commit()
+@_timed
+async def get_video(db: AsyncSession, video_id: int) -> Optional[models.Video]: return await db.get(models.Video, video_id)
+@_timed
+async def get_video_detail(db: AsyncSession, video_id: int) -> Optional[models.Video]:
+    """The video with its transcript rows loaded up front, for endpoints that return the full VideoSchema."""
+    query = select(models.Video).options(selectinload(models.Video.segments), selectinload(models.Video.key_moments)).where(models.Video.id == video_id)
+    # populate_existing: the session may already hold this video with relationships loaded before a transcript change.
+    return (await db.scalars(query.execution_options(populate_existing=True))).first()
+@_timed
+async def get_video_by_public_slug(db: AsyncSession, public_slug: str) -> Optional[models.Video]:
+    query = select(models.Video).options(selectinload(models.Video.project).load_only(models.Project.name)).where(models.Video.public_slug == public_slug, models.Video.is_public == True)
+    return (await db.scalars(query)).first()
+async def lock_content_hash(db: AsyncSession, content_hash: str) -> None:
+    """Serializes blob creation and deletion for one content hash until the current transaction ends."""
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(content_hash))))
+# Statuses in which a video's transcript is final (mind map / quiz generation runs on top of it).
+TRANSCRIBED_STATUSES = ["completed", "generating_mindmap", "generating_quiz"]
+@_timed
+async def get_video_by_content_hash(db: AsyncSession, content_hash: str, transcribed_only: bool = False) -> Optional[models.Video]:
+    query = select(models.Video).where(models.Video.content_hash == content_hash)
+    if transcribed_only: query = query.where(models.Video.status.in_(TRANSCRIBED_STATUSES), models.Video.transcript_segment_count.isnot(None))
+    return (await db.scalars(query.order_by(models.Video.id).limit(1))).first()
+async def count_videos_sharing_file(db: AsyncSession, filepath: str, exclude_video_id: Optional[int] = None) -> int:
+    query = select(func.count(models.Video.id)).where(models.Video.filepath == filepath)
+    if exclude_video_id is not None: query = query.where(models.Video.id != exclude_video_id)
+    return await db.scalar(query) or 0
+@_timed
+async def delete_video(db: AsyncSession, video_id: int) -> Optional[models.Video]:
+    db_video = await db.get(models.Video, video_id)
     if db_video:
         video_filepath_to_delete = db_video.filepath 
-        if video_filepath_to_delete and os.path.exists(video_filepath_to_delete):
+        if db_video.content_hash: await lock_content_hash(db, db_video.content_hash)
+        # Identical uploads share one stored blob; only the last video referencing it removes the file.
+        shared_by_others = bool(video_filepath_to_delete) and await count_videos_sharing_file(db, video_filepath_to_delete, exclude_video_id=video_id) > 0
+        if video_filepath_to_delete and not shared_by_others and os.path.exists(video_filepath_to_delete):
             try:
                 os.remove(video_filepath_to_delete)
-                base_filename = os.path.splitext(os.path.basename(video_filepath_to_delete))[0]
-                audio_file_path = os.path.join(os.path.dirname(video_filepath_to_delete), f"{base_filename}.mp3")
-                if os.path.exists(audio_file_path): os.remove(audio_file_path)
-            except Exception as e: print(f"Error deleting video/audio file {video_filepath_to_delete}: {e}")
-        db.delete(db_video); db.commit()
+                hls_packaging.remove_renditions(video_filepath_to_delete)
+            except Exception as e: logger.error(f"Error deleting video file or HLS renditions {video_filepath_to_delete}: {e}")
+        await db.delete(db_video); await db.commit()
+        transcript_cache.invalidate(video_id)
         return db_video 
-    return None
\ No newline at end of file
+    return None
+@_timed
+async def create_upload_session(db: AsyncSession, project_id: int, upload: schemas.UploadInit) -> models.UploadSession:
+    db_upload = models.UploadSession(project_id=project_id, filename=upload.filename, total_size=upload.total_size, received_bytes=0); db.add(db_upload); await db.commit(); await db.refresh(db_upload); return db_upload
+@_timed
+async def get_upload_session(db: AsyncSession, upload_id: str, project_id: int, for_update: bool = False) -> Optional[models.UploadSession]:
+    """With `for_update` the row stays locked until the transaction ends, so chunk writes and finalize on one upload run one at a time."""
+    query = select(models.UploadSession).where(models.UploadSession.id == upload_id, models.UploadSession.project_id == project_id)
+    return (await db.scalars(query.with_for_update() if for_update else query)).first()
+@_timed
+async def set_upload_received_bytes(db: AsyncSession, upload_id: str, received_bytes: int) -> None:
+    await db.execute(update(models.UploadSession).where(models.UploadSession.id == upload_id).values({models.UploadSession.received_bytes: received_bytes}).execution_options(synchronize_session=False)); await db.commit()
+@_timed
+async def delete_upload_session(db: AsyncSession, upload_id: str, commit: bool = True) -> None:
+    await db.execute(delete(models.UploadSession).where(models.UploadSession.id == upload_id))
+    if commit: await db.commit()
+@_timed
+async def record_pipeline_stage_run(db: AsyncSession, video_id: int, stage: str, status: str, duration_ms: int, error: Optional[str] = None, ffmpeg_usage=None) -> None:
+    usage = {"ffmpeg_cpu_ms": int(ffmpeg_usage.cpu_seconds * 1000), "ffmpeg_bytes_in": ffmpeg_usage.bytes_in, "ffmpeg_bytes_out": ffmpeg_usage.bytes_out} if ffmpeg_usage else {}
+    db.add(models.PipelineStageRun(video_id=video_id, stage=stage, status=status, duration_ms=duration_ms, error=error[:2000] if error else None, **usage)); await db.commit()
+@_timed
+async def record_llm_usage(db: AsyncSession, **fields) -> None:
+    db.add(models.LLMUsage(**fields)); await db.commit()
+@_timed
+async def get_video_project_id(db: AsyncSession, video_id: int) -> Optional[int]: return await db.scalar(select(models.Video.project_id).where(models.Video.id == video_id))
+@_timed
+async def get_project_token_usage(db: AsyncSession, project_id: int, since: datetime) -> int:
+    usage = models.LLMUsage
+    return await db.scalar(select(func.coalesce(func.sum(usage.prompt_tokens + usage.completion_tokens), 0)).where(usage.project_id == project_id, usage.created_at >= since)) or 0
+LLM_USAGE_GROUPS = {"project": models.LLMUsage.project_id, "video": models.LLMUsage.video_id, "stage": models.LLMUsage.stage, "model": models.LLMUsage.model}
+@_timed
+async def get_llm_usage_summary(db: AsyncSession, group_by: str, since: datetime, project_id: Optional[int] = None, video_id: Optional[int] = None, limit: int = 50) -> PyList[Dict[str, Any]]:
+    """Calls, tokens and latency per `group_by` key (see LLM_USAGE_GROUPS) since `since`, heaviest token users first."""
+    usage = models.LLMUsage; key = LLM_USAGE_GROUPS[group_by]
+    total_tokens = func.sum(usage.prompt_tokens + usage.completion_tokens)
+    query = (select(key.label("key"), func.count(usage.id).label("calls"), func.sum(usage.prompt_tokens).label("prompt_tokens"), func.sum(usage.completion_tokens).label("completion_tokens"),
+                    total_tokens.label("total_tokens"), func.avg(usage.latency_ms).label("avg_latency_ms"), func.coalesce(func.sum(usage.audio_seconds), 0).label("audio_seconds"))
+             .where(usage.created_at >= since).group_by(key).order_by(total_tokens.desc(), func.count(usage.id).desc()).limit(limit))
+    if project_id is not None: query = query.where(usage.project_id == project_id)
+    if video_id is not None: query = query.where(usage.video_id == video_id)
+    return [{**row._mapping, "key": None if row.key is None else str(row.key), "avg_latency_ms": float(row.avg_latency_ms or 0)} for row in await db.execute(query)]
+@_timed
+async def set_project_token_ceiling(db: AsyncSession, project_id: int, token_ceiling: Optional[int]) -> bool:
+    result = await db.execute(update(models.Project).where(models.Project.id == project_id).values({models.Project.token_ceiling: token_ceiling}).execution_options(synchronize_session=False))
+    await db.commit(); return result.rowcount > 0
+@_timed
+async def get_pipeline_stage_runs(db: AsyncSession, video_id: int) -> PyList[models.PipelineStageRun]: return (await db.scalars(select(models.PipelineStageRun).where(models.PipelineStageRun.video_id == video_id).order_by(models.PipelineStageRun.id))).all()
+@_timed
+async def save_retrieval_index(db: AsyncSession, video_id: int, index_data: bytes, chunk_count: int, has_embeddings: bool) -> None:
+    """Stores or replaces the video's index in one statement, so concurrent saves cannot collide on the primary key."""
+    values = dict(index_data=index_data, chunk_count=chunk_count, has_embeddings=has_embeddings)
+    await db.execute(pg_insert(models.VideoRetrievalIndex).values(video_id=video_id, **values).on_conflict_do_update(index_elements=[models.VideoRetrievalIndex.video_id], set_=values))
+    await db.commit()
+@_timed
+async def lock_retrieval_index(db: AsyncSession, video_id: int) -> None:
+    """Serializes building one video's retrieval index until the current transaction ends."""
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(f"retrieval_index:{video_id}"))))
+@_timed
+async def get_retrieval_index_data(db: AsyncSession, video_id: int) -> Optional[bytes]:
+    return await db.scalar(select(models.VideoRetrievalIndex.index_data).where(models.VideoRetrievalIndex.video_id == video_id))
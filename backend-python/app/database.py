@@ -1,17 +1,91 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+from sqlalchemy import text, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 import os
+import json
+from .services import metrics
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/video_processor_db")
+# The app talks to Postgres through asyncpg; plain postgresql:// URLs are rewritten to that driver.
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1).replace("postgresql://", "postgresql+asyncpg://", 1)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Server-side cap per statement; 0 disables it.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS, pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+)
+# Objects stay usable after commit: with async sessions an expired attribute cannot be lazily reloaded.
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+metrics.instrument_engine(engine)
+
+from .models import Base, TranscriptSegment, KeyMoment, SEARCH_TEXT_CONFIG # Import Base to be used by other modules if needed
+from .services.utils import parse_timestamp
+
+# create_all() only creates missing tables, so columns added to existing tables are applied here.
+SCHEMA_MIGRATIONS = [
+    "ALTER TABLE videos ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_videos_content_hash ON videos (content_hash)",
+    "ALTER TABLE videos ADD COLUMN IF NOT EXISTS transcript_version INTEGER NOT NULL DEFAULT 1",
+    "ALTER TABLE videos ADD COLUMN IF NOT EXISTS transcript_segment_count INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_videos_project_uploaded ON videos (project_id, uploaded_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_videos_uploaded ON videos (uploaded_at, id)",
+    "ALTER TABLE videos ADD COLUMN IF NOT EXISTS hls_manifest_path VARCHAR",
+    "ALTER TABLE pipeline_stage_runs ADD COLUMN IF NOT EXISTS ffmpeg_cpu_ms INTEGER",
+    "ALTER TABLE pipeline_stage_runs ADD COLUMN IF NOT EXISTS ffmpeg_bytes_in BIGINT",
+    "ALTER TABLE pipeline_stage_runs ADD COLUMN IF NOT EXISTS ffmpeg_bytes_out BIGINT",
+    f"ALTER TABLE transcript_segments ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('{SEARCH_TEXT_CONFIG}', text)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_transcript_segments_search ON transcript_segments USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_videos_tags ON videos USING gin (tags jsonb_path_ops)",
+    "ALTER TABLE projects ADD COLUMN IF NOT EXISTS token_ceiling BIGINT",
+]
+
+def _migrate_transcript_documents(connection) -> None:
+    """
+    Moves transcripts stored as one JSON document in the old videos.transcript column into the
+    transcript_segments / key_moments tables, then drops the column. One video is read at a time.
+    """
+    has_column = connection.execute(text("SELECT 1 FROM information_schema.columns WHERE table_name = 'videos' AND column_name = 'transcript'")).first()
+    if not has_column: return
+    video_ids = connection.execute(text("SELECT id FROM videos WHERE transcript IS NOT NULL AND transcript_segment_count IS NULL")).scalars().all()
+    for video_id in video_ids:
+        raw = connection.execute(text("SELECT transcript FROM videos WHERE id = :id"), {"id": video_id}).scalar()
+        try: document = json.loads(raw)
+        except (json.JSONDecodeError, TypeError): document = None
+        if not isinstance(document, dict):
+            document = {"key_moments": [{"label": "Error parsing transcript", "timestamp_start": "00:00:00.000"}], "segments": []}
+        segments = [{"video_id": video_id, "position": i, "start_seconds": parse_timestamp(seg.get("timestamp_start", 0)),
+                     "end_seconds": parse_timestamp(seg.get("timestamp_end", 0)), "text": (seg.get("text") or "").strip()}
+                    for i, seg in enumerate(s for s in document.get("segments", []) if isinstance(s, dict))]
+        key_moments = [{"video_id": video_id, "position": i, "label": moment.get("label") or "", "start_seconds": parse_timestamp(moment.get("timestamp_start", 0)),
+                        "details": moment.get("details")} for i, moment in enumerate(m for m in document.get("key_moments", []) if isinstance(m, dict))]
+        if segments: connection.execute(insert(TranscriptSegment), segments)
+        if key_moments: connection.execute(insert(KeyMoment), key_moments)
+        connection.execute(text("UPDATE videos SET transcript_segment_count = :count WHERE id = :id"), {"count": len(segments), "id": video_id})
+    connection.execute(text("ALTER TABLE videos DROP COLUMN transcript"))
+    logger.info(f"Moved {len(video_ids)} JSON transcripts into transcript_segments / key_moments.")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _init_schema(connection) -> None:
+    # The API and the worker both run this at startup; the lock keeps them from migrating the same rows twice.
+    connection.execute(text("SELECT pg_advisory_xact_lock(hashtext('init_db'))"))
+    Base.metadata.create_all(bind=connection)
+    for statement in SCHEMA_MIGRATIONS:
+        connection.execute(text(statement))
+    _migrate_transcript_documents(connection)
 
-from .models import Base # Import Base to be used by other modules if needed
+async def init_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(_init_schema)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
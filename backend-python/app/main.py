@@ -1,20 +1,35 @@
-from fastapi import FastAPI
+import logging
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
 
-from .database import engine 
-from .models import Base 
+from .database import init_db, engine
 from .api import projects as projects_api 
 from .api import videos as videos_api     
 from .api import public as public_api 
+from .api import admin as admin_api
+from .services import upload_service
+from .services import metrics, tracing
+from .services.log import setup_logging
+from .services.progress_events import progress_broker
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Video Processor API")
 
 @app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine) 
-    print("Database tables checked/created.")
+async def on_startup():
+    tracing.init_tracing("api", engine=engine)
+    await init_db()
+    logger.info("Database tables checked/created.")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await progress_broker.close()
+
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,15 +39,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = "/app/uploaded_videos" 
+UPLOAD_DIR = upload_service.UPLOAD_DIR 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-app.mount("/static_videos", StaticFiles(directory=UPLOAD_DIR), name="static_videos")
+app.mount(upload_service.STATIC_VIDEOS_URL, StaticFiles(directory=UPLOAD_DIR), name="static_videos")
 
 app.include_router(projects_api.router)
 app.include_router(videos_api.router)
 app.include_router(public_api.router) 
+app.include_router(admin_api.router)
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to the Video Processor API"}
\ No newline at end of file
+    return {"message": "Welcome to the Video Processor API"}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
@@ -1,17 +1,26 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import JSONB 
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, ForeignKey, DateTime, Boolean, Index, LargeBinary, Computed
+from sqlalchemy import select
+from sqlalchemy.orm import relationship, column_property, deferred
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import uuid 
+import json
+from typing import Optional
+from .services.utils import transcript_document
+from .services.upload_service import STATIC_VIDEOS_URL
 
 Base = declarative_base()
 
+# Text search configuration of transcript_segments.search_vector; queries must use the same one.
+SEARCH_TEXT_CONFIG = "english"
+
 class Project(Base):
     __tablename__ = "projects"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, unique=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    token_ceiling = Column(BigInteger, nullable=True) # LLM tokens per PROJECT_TOKEN_CEILING_WINDOW_DAYS; NULL uses PROJECT_TOKEN_CEILING
     videos = relationship("Video", back_populates="project", cascade="all, delete-orphan")
 
 class Video(Base):
@@ -20,13 +29,157 @@ class Video(Base):
     project_id = Column(Integer, ForeignKey("projects.id"))
     filename = Column(String)
     filepath = Column(String) 
+    content_hash = Column(String(64), index=True, nullable=True) # sha256 hex of the uploaded file
     status = Column(String, default="uploaded") 
-    transcript = Column(Text, nullable=True) 
+    transcript_segment_count = Column(Integer, nullable=True) # NULL until a transcript (possibly an error one) is stored
+    transcript_version = Column(Integer, default=1, server_default="1", nullable=False) # bumped on transcript or publish changes
     summary = Column(Text, nullable=True) 
     mindmap_data = Column(Text, nullable=True) 
     quiz_data = Column(Text, nullable=True)
     tags = Column(JSONB, nullable=True, server_default='[]') 
     is_public = Column(Boolean, default=False, nullable=False)
     public_slug = Column(String, unique=True, index=True, nullable=True)
+    hls_manifest_path = Column(String, nullable=True) # master playlist relative to UPLOAD_DIR, set once the HLS ladder is packaged
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
-    project = relationship("Project", back_populates="videos")
\ No newline at end of file
+    # Flags for listings, computed in SQL so the mind map / quiz text never has to be loaded to show them.
+    has_mindmap = column_property(mindmap_data.isnot(None))
+    has_quiz = column_property(quiz_data.isnot(None))
+    project = relationship("Project", back_populates="videos")
+    segments = relationship("TranscriptSegment", order_by="TranscriptSegment.position", cascade="all, delete-orphan", passive_deletes=True)
+    key_moments = relationship("KeyMoment", order_by="KeyMoment.position", cascade="all, delete-orphan", passive_deletes=True)
+    quiz_chapters = relationship("QuizChapter", order_by="QuizChapter.position", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (Index("ix_videos_project_uploaded", "project_id", "uploaded_at", "id"),
+                      Index("ix_videos_uploaded", "uploaded_at", "id"),
+                      # jsonb_path_ops: smaller and faster than the default opclass, and containment (@>) is all tag filters need.
+                      Index("ix_videos_tags", "tags", postgresql_using="gin", postgresql_ops={"tags": "jsonb_path_ops"}))
+
+    @property
+    def has_transcript(self) -> bool:
+        return self.transcript_segment_count is not None
+
+    @property
+    def project_name(self) -> Optional[str]:
+        return self.project.name if self.project else None
+
+    @property
+    def hls_manifest_url(self) -> Optional[str]:
+        return f"{STATIC_VIDEOS_URL}/{self.hls_manifest_path}" if self.hls_manifest_path else None
+
+    @property
+    def transcript(self) -> Optional[str]:
+        """The transcript as the JSON document the API has always returned ({"key_moments": [...], "segments": [...]})."""
+        if self.transcript_segment_count is None: return None
+        return json.dumps(transcript_document(self.segments, self.key_moments))
+# Loaded only where asked for (undefer), so fetching a project never counts its videos by accident.
+Project.video_count = column_property(select(func.count(Video.id)).where(Video.project_id == Project.id).correlate_except(Video).scalar_subquery(), deferred=True)
+class TranscriptSegment(Base):
+    __tablename__ = "transcript_segments"
+    id = Column(BigInteger, primary_key=True)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    start_seconds = Column(Float, nullable=False)
+    end_seconds = Column(Float, nullable=False)
+    text = Column(Text, nullable=False)
+    # Maintained by Postgres on every insert, so each transcript write indexes only its own segments.
+    search_vector = deferred(Column(TSVECTOR, Computed(f"to_tsvector('{SEARCH_TEXT_CONFIG}', text)", persisted=True)))
+    __table_args__ = (Index("ix_transcript_segments_video_position", "video_id", "position", unique=True),
+                      Index("ix_transcript_segments_video_start", "video_id", "start_seconds"),
+                      Index("ix_transcript_segments_search", "search_vector", postgresql_using="gin"))
+class KeyMoment(Base):
+    __tablename__ = "key_moments"
+    id = Column(Integer, primary_key=True)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    label = Column(String, nullable=False)
+    start_seconds = Column(Float, nullable=False)
+    details = Column(Text, nullable=True)
+    __table_args__ = (Index("ix_key_moments_video_position", "video_id", "position", unique=True),)
+class QuizChapter(Base):
+    """The quiz questions generated for one chapter (key moment) of a video; videos.quiz_data is their merge."""
+    __tablename__ = "quiz_chapters"
+    id = Column(Integer, primary_key=True)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    label = Column(String, nullable=False)
+    start_seconds = Column(Float, nullable=False)
+    content_hash = Column(String(64), nullable=False) # sha256 of the chapter label and text the questions were generated from
+    status = Column(String, nullable=False) # succeeded | failed
+    questions = Column(JSONB, nullable=False, server_default='[]') # schemas.QuizQuestion dicts
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    __table_args__ = (Index("ix_quiz_chapters_video_position", "video_id", "position", unique=True),)
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=True)
+    received_bytes = Column(BigInteger, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_claim", "job_type", "status", "run_after"),)
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False, server_default='{}')
+    status = Column(String, default="queued", nullable=False) # queued | running | succeeded | failed
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    locked_by = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache_entries"
+    key = Column(String(64), primary_key=True) # sha256 of model, messages, temperature and response_format
+    model = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class PipelineStageRun(Base):
+    __tablename__ = "pipeline_stage_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), index=True, nullable=False)
+    stage = Column(String, nullable=False)
+    status = Column(String, nullable=False) # succeeded | failed
+    duration_ms = Column(Integer, nullable=False)
+    error = Column(Text, nullable=True)
+    # ffmpeg work done by the stage (CPU from -benchmark); NULL for stages that run no ffmpeg.
+    ffmpeg_cpu_ms = Column(Integer, nullable=True)
+    ffmpeg_bytes_in = Column(BigInteger, nullable=True)
+    ffmpeg_bytes_out = Column(BigInteger, nullable=True)
+    finished_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class VideoRetrievalIndex(Base):
+    __tablename__ = "video_retrieval_indexes"
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="CASCADE"), primary_key=True)
+    index_data = Column(LargeBinary, nullable=False) # services.retrieval.RetrievalIndex.to_bytes()
+    chunk_count = Column(Integer, nullable=False, default=0)
+    has_embeddings = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class LLMUsage(Base):
+    """One OpenAI API call (cache hits are not recorded), attributed to the video, project and stage it ran for."""
+    __tablename__ = "llm_usage"
+    id = Column(BigInteger, primary_key=True)
+    # SET NULL: usage stays counted in the totals after a video or project is deleted.
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="SET NULL"), nullable=True)
+    video_id = Column(Integer, ForeignKey("videos.id", ondelete="SET NULL"), nullable=True, index=True)
+    stage = Column(String, nullable=True) # pipeline stage or job type, e.g. key_moments, quiz, chat
+    kind = Column(String, nullable=False) # chat | embedding | transcription
+    model = Column(String, nullable=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)
+    audio_seconds = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    __table_args__ = (Index("ix_llm_usage_project_created", "project_id", "created_at"),
+                      Index("ix_llm_usage_created", "created_at"))
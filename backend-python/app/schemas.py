@@ -8,6 +8,22 @@ class VideoBase(BaseModel):
 class VideoCreate(VideoBase):
     pass
 
+class UploadInit(BaseModel):
+    filename: str
+    total_size: Optional[int] = Field(default=None, ge=0)
+
+class UploadFinalize(BaseModel):
+    sha256: Optional[str] = None # Optional client-side digest to verify the assembled file against
+
+class UploadSessionSchema(BaseModel):
+    id: str
+    project_id: int
+    filename: str
+    total_size: Optional[int]
+    received_bytes: int
+    chunk_size: int = 0
+    model_config = ConfigDict(from_attributes=True)
+
 class QuizQuestionOption(BaseModel):
     text: str
     is_correct: bool 
@@ -22,6 +38,16 @@ class Quiz(BaseModel):
     title: str
     questions: List[QuizQuestion]
 
+class QuizChapterSchema(BaseModel):
+    position: int
+    label: str
+    start_seconds: float
+    status: str
+    questions: List[QuizQuestion] = Field(default_factory=list)
+    error: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    model_config = ConfigDict(from_attributes=True)
+
 class VideoTagUpdate(BaseModel):
     tags: List[str] = Field(default_factory=list)
 
@@ -32,6 +58,45 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
 
+class TranscriptSegmentSchema(BaseModel):
+    start_seconds: float
+    end_seconds: float
+    text: str
+    model_config = ConfigDict(from_attributes=True)
+
+class TagFacet(BaseModel):
+    tag: str
+    count: int
+
+class TagFacets(BaseModel):
+    video_count: int
+    tags: List[TagFacet]
+
+class TranscriptSearchHit(BaseModel):
+    video_id: int
+    video_filename: str
+    position: int
+    start_seconds: float
+    end_seconds: float
+    timestamp: str
+    snippet: str
+    rank: float
+
+class TranscriptSearchResults(BaseModel):
+    query: str
+    hits: List[TranscriptSearchHit]
+
+class PipelineStageRunSchema(BaseModel):
+    stage: str
+    status: str
+    duration_ms: int
+    error: Optional[str] = None
+    ffmpeg_cpu_ms: Optional[int] = None
+    ffmpeg_bytes_in: Optional[int] = None
+    ffmpeg_bytes_out: Optional[int] = None
+    finished_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
 class VideoSchema(VideoBase):
     id: int
     project_id: int
@@ -44,12 +109,40 @@ class VideoSchema(VideoBase):
     tags: Optional[List[str]] = Field(default_factory=list)
     is_public: bool = False
     public_slug: Optional[str] = None
+    hls_manifest_url: Optional[str] = None
     uploaded_at: datetime
     model_config = ConfigDict(from_attributes=True)
     
+class VideoSummarySchema(VideoBase):
+    """Listing view of a video: no transcript, mind map or quiz, only whether they exist."""
+    id: int
+    project_id: int
+    filepath: str
+    status: str
+    tags: Optional[List[str]] = Field(default_factory=list)
+    is_public: bool = False
+    public_slug: Optional[str] = None
+    uploaded_at: datetime
+    has_transcript: bool = False
+    has_mindmap: bool = False
+    has_quiz: bool = False
+    model_config = ConfigDict(from_attributes=True)
+
+class VideoListItemSchema(VideoSummarySchema):
+    project_name: Optional[str] = None
+
+class VideoPage(BaseModel):
+    items: List[VideoSummarySchema]
+    next_cursor: Optional[str] = None
+
+class VideoListPage(BaseModel):
+    items: List[VideoListItemSchema]
+    next_cursor: Optional[str] = None
+
 class PublicVideoSchema(BaseModel): 
     filename: str
     filepath: str 
+    hls_manifest_url: Optional[str] = None
     transcript: Optional[Any]
     mindmap_data: Optional[str]
     quiz_data: Optional[Any]
@@ -64,5 +157,28 @@ class ProjectCreate(ProjectBase):
 class ProjectSchema(ProjectBase):
     id: int
     created_at: datetime
-    videos: List[VideoSchema] = []
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    video_count: int = 0
+    model_config = ConfigDict(from_attributes=True)
+
+class ProjectTokenCeilingUpdate(BaseModel):
+    token_ceiling: Optional[int] = Field(None, ge=0) # None falls back to the PROJECT_TOKEN_CEILING default, 0 is unlimited
+
+class ProjectTokenUsage(BaseModel):
+    project_id: int
+    window_days: int
+    used_tokens: int
+    token_ceiling: int # 0: unlimited
+    remaining_tokens: Optional[int] = None
+
+class LLMUsageAggregate(BaseModel):
+    key: Optional[str] = None # the project id, video id, stage or model, depending on group_by
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    avg_latency_ms: float
+    audio_seconds: float = 0.0
+
+class ProjectPage(BaseModel):
+    items: List[ProjectSchema]
+    next_cursor: Optional[str] = None
\ No newline at end of file
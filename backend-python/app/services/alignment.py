@@ -0,0 +1,77 @@
+import re
+import bisect
+import unicodedata
+from difflib import SequenceMatcher
+from collections import Counter, defaultdict
+from typing import Optional, List as PyList, Any, Dict, Tuple
+
+ALIGNMENT_NGRAM = 3
+ALIGNMENT_MIN_SCORE = 0.6
+# Only the first words of an LLM "starting_phrase" are compared; they are the ones it quotes most faithfully.
+ALIGNMENT_MAX_PHRASE_TOKENS = 12
+ALIGNMENT_MAX_CANDIDATES = 25
+
+_NON_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+def normalize_tokens(text: str) -> PyList[str]:
+    """Lowercases, strips accents and punctuation, and splits into word tokens."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [token for token in _NON_WORD_RE.sub(" ", text.lower()).split() if token]
+
+class SegmentTextIndex:
+    """
+    Token-position index over Whisper segments. All segment texts are normalized into one token stream, so a
+    phrase that runs across a segment boundary is still found, and every token remembers which segment it
+    came from. Word n-grams map to their positions for candidate lookup, and segment start times are kept
+    sorted so "only after time t" is a bisect instead of a scan.
+    """
+    def __init__(self, segments: PyList[Any], ngram: int = ALIGNMENT_NGRAM):
+        self.ngram = ngram
+        self.tokens: PyList[str] = []
+        self.token_segment: PyList[int] = []
+        self.segment_starts: PyList[float] = []
+        self.segment_first_token: PyList[int] = []
+        for segment_index, seg_obj in enumerate(segments):
+            self.segment_starts.append(float(getattr(seg_obj, 'start', 0.0)))
+            self.segment_first_token.append(len(self.tokens))
+            segment_tokens = normalize_tokens(getattr(seg_obj, 'text', ""))
+            self.tokens.extend(segment_tokens)
+            self.token_segment.extend([segment_index] * len(segment_tokens))
+        self.postings: Dict[int, Dict[Tuple[str, ...], PyList[int]]] = {}
+        for n in range(1, ngram + 1):
+            grams: Dict[Tuple[str, ...], PyList[int]] = defaultdict(list)
+            for position in range(len(self.tokens) - n + 1):
+                grams[tuple(self.tokens[position:position + n])].append(position)
+            self.postings[n] = grams
+
+    def _first_token_after(self, min_start_seconds: float) -> int:
+        segment_index = bisect.bisect_right(self.segment_starts, min_start_seconds)
+        if segment_index >= len(self.segment_first_token): return len(self.tokens)
+        return self.segment_first_token[segment_index]
+
+    def find_phrase(self, phrase: str, min_start_seconds: float = -1.0) -> Optional[Tuple[int, float]]:
+        """
+        Returns (segment_index, score) for the best fuzzy match of `phrase` that starts in a segment beginning
+        strictly after `min_start_seconds`, or None when nothing scores at least ALIGNMENT_MIN_SCORE. Candidates
+        come from the longest n-grams that get any votes, so a typo in every trigram falls back to bigrams and words.
+        """
+        phrase_tokens = normalize_tokens(phrase)[:ALIGNMENT_MAX_PHRASE_TOKENS]
+        if not phrase_tokens or not self.tokens: return None
+        first_allowed = self._first_token_after(min_start_seconds)
+        votes: Counter = Counter()
+        for n in range(min(self.ngram, len(phrase_tokens)), 0, -1):
+            grams = self.postings[n]
+            for offset in range(len(phrase_tokens) - n + 1):
+                for position in grams.get(tuple(phrase_tokens[offset:offset + n]), ()):
+                    anchor = position - offset
+                    if anchor >= first_allowed: votes[anchor] += 1
+            if votes: break
+        best: Optional[Tuple[int, float]] = None
+        for anchor, _ in votes.most_common(ALIGNMENT_MAX_CANDIDATES):
+            window = self.tokens[anchor:anchor + len(phrase_tokens)]
+            score = SequenceMatcher(None, phrase_tokens, window, autojunk=False).ratio()
+            if best is None or score > best[1] or (score == best[1] and anchor < best[0]):
+                best = (anchor, score)
+        if best is None or best[1] < ALIGNMENT_MIN_SCORE: return None
+        return self.token_segment[best[0]], best[1]
@@ -0,0 +1,90 @@
+import os
+import re
+from types import SimpleNamespace
+from .ffmpeg_runner import run_ffmpeg, timeout_for, FFmpegUsage
+from typing import List as PyList, Any, Dict, Tuple
+
+WHISPER_CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "600"))
+WHISPER_CHUNK_OVERLAP_SECONDS = float(os.getenv("WHISPER_CHUNK_OVERLAP_SECONDS", "2"))
+# How far from the nominal cut point we are willing to move it to land in a silence.
+WHISPER_CHUNK_SEARCH_SECONDS = float(os.getenv("WHISPER_CHUNK_SEARCH_SECONDS", "60"))
+SILENCE_NOISE_DB = os.getenv("SILENCE_NOISE_DB", "-30dB")
+SILENCE_MIN_DURATION_SECONDS = float(os.getenv("SILENCE_MIN_DURATION_SECONDS", "0.4"))
+
+_SILENCE_START_RE = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END_RE = re.compile(r"silence_end:\s*(-?[\d.]+)")
+
+async def detect_silences(audio: bytes, duration: float, usage: FFmpegUsage) -> PyList[Tuple[float, float]]:
+    """
+    Runs ffmpeg's silencedetect filter over the in-memory audio and returns (start, end) pairs of the silent stretches.
+    """
+    silences = []; pending_start = None
+
+    async def on_line(line: str):
+        nonlocal pending_start
+        start_match = _SILENCE_START_RE.search(line)
+        if start_match: pending_start = max(0.0, float(start_match.group(1))); return
+        end_match = _SILENCE_END_RE.search(line)
+        if end_match and pending_start is not None:
+            silences.append((pending_start, float(end_match.group(1)))); pending_start = None
+
+    usage.add(await run_ffmpeg(["-i", "pipe:0", "-af", f"silencedetect=noise={SILENCE_NOISE_DB}:d={SILENCE_MIN_DURATION_SECONDS}", "-f", "null", "-"],
+                               timeout_for(duration), input_bytes=audio, on_stderr_line=on_line, operation="silencedetect"))
+    return silences
+
+def plan_chunks(duration: float, silences: PyList[Tuple[float, float]], chunk_seconds: float = WHISPER_CHUNK_SECONDS) -> PyList[Dict[str, float]]:
+    """
+    Splits [0, duration] into consecutive chunks of roughly `chunk_seconds`, moving each cut to the middle of the
+    nearest silence when one is close enough. Each chunk owns [cut_start, cut_end) and its audio is padded by
+    WHISPER_CHUNK_OVERLAP_SECONDS on both sides so words on a cut are heard in full by at least one chunk.
+    """
+    if duration <= 0: return []
+    silence_midpoints = [(start + end) / 2 for start, end in silences]
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_seconds * 1.25:
+        target = cuts[-1] + chunk_seconds
+        candidates = [m for m in silence_midpoints if abs(m - target) <= WHISPER_CHUNK_SEARCH_SECONDS and m > cuts[-1] + chunk_seconds / 2]
+        cuts.append(min(candidates, key=lambda m: abs(m - target)) if candidates else target)
+    cuts.append(duration)
+    chunks = []
+    for index, (cut_start, cut_end) in enumerate(zip(cuts, cuts[1:])):
+        audio_start = max(0.0, cut_start - WHISPER_CHUNK_OVERLAP_SECONDS)
+        audio_end = min(duration, cut_end + WHISPER_CHUNK_OVERLAP_SECONDS)
+        chunks.append({"index": index, "cut_start": cut_start, "cut_end": cut_end, "audio_start": audio_start, "audio_end": audio_end})
+    return chunks
+
+async def extract_chunk(audio: bytes, chunk: Dict[str, float], audio_format: str, usage: FFmpegUsage) -> bytes:
+    """Cuts the chunk's [audio_start, audio_end) out of the in-memory audio without re-encoding."""
+    length = chunk["audio_end"] - chunk["audio_start"]
+    # -ss after -i: a pipe cannot be seeked, so packets before the start are read and dropped (no decoding with -c copy).
+    result = usage.add(await run_ffmpeg(["-i", "pipe:0", "-ss", f"{chunk['audio_start']:.3f}", "-t", f"{length:.3f}", "-c", "copy", "-f", audio_format, "pipe:1"],
+                                        timeout_for(length), input_bytes=audio, operation="split_chunk"))
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed to cut chunk {chunk['index']}: {result.stderr[-500:]}")
+    return result.stdout
+
+def stitch_segments(chunks: PyList[Dict[str, float]], chunk_segments: PyList[PyList[Any]]) -> PyList[Any]:
+    """
+    Shifts each chunk's Whisper segments by the chunk's audio offset and keeps only the segments whose midpoint lies
+    inside the chunk's own [cut_start, cut_end) range, which drops the copies heard twice in the overlap.
+    Start/end times are clamped so the stitched list is monotonic.
+    """
+    stitched = []
+    last_chunk_index = len(chunks) - 1
+    for chunk, segments in zip(chunks, chunk_segments):
+        for seg_obj in segments or []:
+            start = chunk["audio_start"] + float(getattr(seg_obj, 'start', 0.0))
+            end = chunk["audio_start"] + float(getattr(seg_obj, 'end', 0.0))
+            midpoint = (start + end) / 2
+            if midpoint < chunk["cut_start"]: continue
+            if midpoint >= chunk["cut_end"] and chunk["index"] != last_chunk_index: continue
+            text = getattr(seg_obj, 'text', "")
+            if not text.strip(): continue
+            stitched.append(SimpleNamespace(start=start, end=end, text=text))
+    stitched.sort(key=lambda seg: seg.start)
+    previous_start = 0.0
+    for seg in stitched:
+        seg.start = max(seg.start, previous_start)
+        seg.end = max(seg.end, seg.start)
+        previous_start = seg.start
+    return stitched
@@ -1,35 +1,87 @@
-import json
+import logging
+import os
 import asyncio
 from .. import crud
-from .openai_utils import answer_question_from_transcript
-from typing import List, Dict
+from .openai_utils import answer_question_from_transcript, embed_texts
+from .retrieval import RetrievalIndex, build_retrieval_index
+from .transcript_cache import transcript_cache, CachedTranscript
+from . import token_budget
+from typing import List, Dict, Optional, Tuple
 
-async def process_chat_request(slug: str, chat_request: Dict, db):
+logger = logging.getLogger(__name__)
+
+CHAT_TOP_K_CHUNKS = int(os.getenv("CHAT_TOP_K_CHUNKS", "6"))
+
+async def save_retrieval_index(db, video_id: int, index: RetrievalIndex) -> None:
+    index_data = await asyncio.to_thread(index.to_bytes)
+    await crud.save_retrieval_index(db, video_id=video_id, index_data=index_data, chunk_count=len(index), has_embeddings=index.embeddings is not None)
+
+async def get_retrieval_index(db, video, cached: CachedTranscript) -> Optional[RetrievalIndex]:
     """
-    Handles the business logic for a chat request.
+    Returns the video's retrieval index, kept on its transcript cache entry after the first use. Otherwise it is
+    loaded from the stored index, or, for videos transcribed before indexing existed (or whose index was
+    invalidated by a transcript change), built from the transcript and stored.
     """
-    video = crud.get_video_by_public_slug(db, public_slug=slug)
+    if cached.retrieval_index is not None: return cached.retrieval_index
+    index_data = await crud.get_retrieval_index_data(db, video_id=video.id)
+    if not index_data and cached.transcript is not None:
+        # Concurrent first chats wait here for one build. The lock ends with the commit that saves the index, or
+        # right after the re-read when the chat we waited for built it.
+        await crud.lock_retrieval_index(db, video_id=video.id)
+        index_data = await crud.get_retrieval_index_data(db, video_id=video.id)
+        if index_data: await db.commit()
+    if index_data:
+        index = await asyncio.to_thread(RetrievalIndex.from_bytes, index_data)
+    else:
+        if cached.transcript is None: return None
+        segments = [{"start": seg.start_seconds, "end": seg.end_seconds, "text": seg.text} for seg in await crud.get_transcript_segments(db, video_id=video.id)]
+        index = await build_retrieval_index(segments)
+        await save_retrieval_index(db, video.id, index)
+        logger.info(f"Video ID {video.id}: Built retrieval index with {len(index)} chunks.")
+    transcript_cache.attach_retrieval_index(cached, index, index.nbytes)
+    return index
+
+async def build_chat_context(db, video, cached: CachedTranscript, question: str) -> Optional[str]:
+    """Returns the timestamped transcript excerpts most relevant to `question`."""
+    index = await get_retrieval_index(db, video, cached)
+    if index is None or not len(index): return None
+    query_embedding = None
+    if index.embeddings is not None:
+        try: query_embedding = (await embed_texts([question]))[0]
+        except Exception as e: logger.warning(f"Query embedding failed, using BM25 only: {e}")
+    top_chunks = index.search(question, CHAT_TOP_K_CHUNKS, query_embedding=query_embedding)
+    return index.format_context(top_chunks)
+
+async def resolve_chat_context(slug: str, question: str, db) -> Tuple[Optional[str], Optional[str]]:
+    """Returns (transcript_context, None) for an answerable question or (None, user-facing message) otherwise."""
+    video = await crud.get_video_by_public_slug(db, public_slug=slug)
     if not video:
-        return {"answer": "Error: Video not found or is not public."}
+        return None, "Error: Video not found or is not public."
+    # Lasts for the rest of the request, including a streamed answer.
+    token_budget.bind_usage_scope(video_id=video.id, project_id=video.project_id, stage="chat")
     
-    if not video.transcript:
-        return {"answer": "Error: Transcript for this video is not available."}
-
-    try:
-        # Transcript is stored as a JSON string, need to extract the full text
-        transcript_data = json.loads(video.transcript)
-        full_text = " ".join([seg['text'] for seg in transcript_data.get("segments", []) if seg.get('text')])
-    except (json.JSONDecodeError, TypeError):
-        # Fallback if transcript is not a valid JSON object string
-        full_text = video.transcript
-
-    if not full_text.strip():
-        return {"answer": "This video's transcript is empty, so I cannot answer questions about it."}
+    cached = await transcript_cache.get_or_load(db, video.id, video.transcript_version)
+    if cached.transcript is None:
+        return None, "Error: Transcript for this video is not available."
+
+    transcript_context = await build_chat_context(db, video, cached, question)
+    if not transcript_context or not transcript_context.strip():
+        return None, "This video's transcript is empty, so I cannot answer questions about it."
+    return transcript_context, None
+
+async def process_chat_request(slug: str, chat_request: Dict, db):
+    """
+    Handles the business logic for a chat request.
+    """
+    question = chat_request.get("question") or ""
+    transcript_context, message = await resolve_chat_context(slug, question, db)
+    if transcript_context is None:
+        return {"answer": message}
     
     answer = await answer_question_from_transcript(
-        full_transcript_text=full_text,
-        user_question=chat_request.get("question"),
+        transcript_context=transcript_context,
+        user_question=question,
         chat_history=chat_request.get("chat_history", [])
     )
     
-    return {"answer": answer}
\ No newline at end of file
+    return {"answer": answer}
@@ -0,0 +1,108 @@
+import logging
+import os
+import asyncio
+from .. import crud
+from .utils import format_timestamp
+from .openai_utils import summarize_transcript_section, merge_section_summaries
+from typing import Optional, List as PyList, Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Transcripts up to this many characters are handed to the generators as they are; longer ones are condensed.
+CONDENSE_THRESHOLD_CHARS = int(os.getenv("CONDENSE_THRESHOLD_CHARS", "15000"))
+CONDENSE_DIGEST_MAX_CHARS = int(os.getenv("CONDENSE_DIGEST_MAX_CHARS", "15000"))
+CONDENSE_SECTION_MAX_CHARS = int(os.getenv("CONDENSE_SECTION_MAX_CHARS", "12000"))
+CONDENSE_CONCURRENCY = int(os.getenv("CONDENSE_CONCURRENCY", "4"))
+CONDENSE_MAX_REDUCE_ROUNDS = 4
+# Rough characters per English word (including the space), to turn the character budget into a word limit.
+CHARS_PER_WORD = 6
+MIN_SECTION_WORDS = 40
+
+def plan_sections(segments: PyList[Dict[str, Any]], key_moments: PyList[Dict[str, Any]]) -> PyList[Dict[str, Any]]:
+    """
+    Groups transcript segments ({"start", "end", "text"}, seconds) into sections that start at key moments
+    ({"label", "start"}, seconds); a chapter longer than CONDENSE_SECTION_MAX_CHARS is split at segment boundaries.
+    """
+    boundaries = sorted((float(moment["start"]), moment["label"]) for moment in key_moments if moment.get("label"))
+    sections: PyList[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    next_boundary = 0
+    for segment in segments:
+        text = (segment.get("text") or "").strip()
+        if not text: continue
+        start = float(segment.get("start", 0.0))
+        chapter_label = None
+        while next_boundary < len(boundaries) and boundaries[next_boundary][0] <= start:
+            chapter_label = boundaries[next_boundary][1]; next_boundary += 1
+        if current is None or chapter_label is not None or len(current["text"]) + len(text) + 1 > CONDENSE_SECTION_MAX_CHARS:
+            if current: sections.append(current)
+            current = {"label": chapter_label or (current["label"] if current else "Opening"), "start": start, "text": text}
+        else: current["text"] += " " + text
+    if current: sections.append(current)
+    return sections
+
+def _truncate_words(text: str, max_words: int) -> str:
+    words = text.split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+async def _reduce(parts: PyList[str], bypass_cache: bool) -> str:
+    """Merges groups of consecutive section summaries until the digest fits CONDENSE_DIGEST_MAX_CHARS."""
+    for _ in range(CONDENSE_MAX_REDUCE_ROUNDS):
+        digest = "\n".join(parts)
+        if len(digest) <= CONDENSE_DIGEST_MAX_CHARS: return digest
+        groups: PyList[PyList[str]] = [[]]
+        for part in parts:
+            if groups[-1] and sum(len(p) + 1 for p in groups[-1]) + len(part) > CONDENSE_SECTION_MAX_CHARS: groups.append([])
+            groups[-1].append(part)
+        if len(groups) >= len(parts): groups = [parts[i:i + 2] for i in range(0, len(parts), 2)]
+        max_words = max(MIN_SECTION_WORDS, CONDENSE_DIGEST_MAX_CHARS // CHARS_PER_WORD // len(groups))
+
+        async def merge(group: PyList[str]) -> str:
+            if len(group) == 1: return group[0]
+            timestamp = group[0].split("]", 1)[0] + "]" if group[0].startswith("[") else ""
+            try: merged = await merge_section_summaries("\n".join(group), max_words, bypass_cache=bypass_cache)
+            except Exception as e: logger.warning(f"Merging summaries failed, truncating instead: {e}"); merged = ""
+            return f"{timestamp} {merged or _truncate_words(' '.join(group), max_words)}".strip()
+
+        parts = await _gather_limited([merge(group) for group in groups])
+    return "\n".join(parts)[:CONDENSE_DIGEST_MAX_CHARS]
+
+async def _gather_limited(coroutines: PyList[Any]) -> PyList[Any]:
+    semaphore = asyncio.Semaphore(max(1, CONDENSE_CONCURRENCY))
+    async def limited(coroutine):
+        async with semaphore: return await coroutine
+    return await asyncio.gather(*[limited(coroutine) for coroutine in coroutines])
+
+async def condense_transcript(segments: PyList[Dict[str, Any]], key_moments: PyList[Dict[str, Any]], bypass_cache: bool = False) -> Tuple[str, bool]:
+    """
+    Returns (digest, condensed). Short transcripts come back whole (condensed=False). Longer ones are split into
+    chapter-aligned sections, each summarized in parallel (map, CONDENSE_CONCURRENCY at a time, LLM-cached), and
+    the timestamped summaries are merged down (reduce) to at most CONDENSE_DIGEST_MAX_CHARS characters.
+    """
+    full_text = " ".join((segment.get("text") or "").strip() for segment in segments if (segment.get("text") or "").strip())
+    if len(full_text) <= CONDENSE_THRESHOLD_CHARS: return full_text, False
+    sections = plan_sections(segments, key_moments)
+    max_words = max(MIN_SECTION_WORDS, CONDENSE_DIGEST_MAX_CHARS // CHARS_PER_WORD // len(sections))
+    logger.info(f"Condensing {len(full_text)} characters in {len(sections)} sections of at most {max_words} words each.")
+
+    async def summarize(section: Dict[str, Any]) -> str:
+        try: summary = await summarize_transcript_section(section["text"], section["label"], max_words, bypass_cache=bypass_cache)
+        except Exception as e: logger.warning(f"Summarizing section '{section['label']}' failed, truncating instead: {e}"); summary = ""
+        return f"[{format_timestamp(section['start'])[:8]}] {section['label']}: {summary or _truncate_words(section['text'], max_words)}"
+
+    digest = await _reduce(await _gather_limited([summarize(section) for section in sections]), bypass_cache)
+    logger.info(f"Digest is {len(digest)} characters ({100 * len(digest) / len(full_text):.1f}% of the transcript).")
+    return digest, True
+
+async def load_digest(db, video) -> str:
+    """
+    The digest the mind map, quiz and tag generators read: the one stored in `video.summary` by the pipeline, or
+    one built (and stored) from the transcript rows for videos transcribed before condensation existed.
+    Regenerating a mind map or quiz reuses it; it only changes with the transcript.
+    """
+    if video.summary: return video.summary
+    segments = [{"start": segment.start_seconds, "end": segment.end_seconds, "text": segment.text} for segment in await crud.get_transcript_segments(db, video_id=video.id)]
+    key_moments = [{"label": moment.label, "start": moment.start_seconds} for moment in await crud.get_key_moments(db, video_id=video.id)]
+    digest, condensed = await condense_transcript(segments, key_moments)
+    if condensed: await crud.update_video_data(db=db, video_id=video.id, summary=digest)
+    return digest
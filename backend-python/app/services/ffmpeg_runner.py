@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import time
+import fcntl
+import asyncio
+import subprocess
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional, List as PyList, Any, Dict, Callable, Awaitable
+from . import metrics
+
+# Host-wide cap on concurrent ffmpeg/ffprobe processes, shared by every worker process through lock files.
+FFMPEG_MAX_PROCESSES = int(os.getenv("FFMPEG_MAX_PROCESSES", str(os.cpu_count() or 2)))
+FFMPEG_SLOT_DIR = os.getenv("FFMPEG_SLOT_DIR", "/tmp/ffmpeg-slots")
+FFMPEG_SLOT_POLL_SECONDS = float(os.getenv("FFMPEG_SLOT_POLL_SECONDS", "0.25"))
+# Timeouts scale with the media duration: base + per_media_second * duration, capped.
+FFMPEG_TIMEOUT_BASE_SECONDS = float(os.getenv("FFMPEG_TIMEOUT_BASE_SECONDS", "60"))
+FFMPEG_TIMEOUT_PER_MEDIA_SECOND = float(os.getenv("FFMPEG_TIMEOUT_PER_MEDIA_SECOND", "0.5"))
+FFMPEG_TIMEOUT_MAX_SECONDS = float(os.getenv("FFMPEG_TIMEOUT_MAX_SECONDS", "3600"))
+FFPROBE_TIMEOUT_SECONDS = float(os.getenv("FFPROBE_TIMEOUT_SECONDS", "60"))
+
+_BENCH_RE = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s")
+_STDERR_TAIL_CHARS = 2000
+
+class FFmpegError(Exception):
+    pass
+
+class FFmpegTimeout(FFmpegError):
+    pass
+
+class FFmpegResult:
+    """Output of one ffmpeg run plus its resource usage as reported by `-benchmark`."""
+    def __init__(self, returncode: int, stdout: bytes, stderr: str, cpu_seconds: float, wall_seconds: float, bytes_in: int):
+        self.returncode = returncode; self.stdout = stdout; self.stderr = stderr
+        self.cpu_seconds = cpu_seconds; self.wall_seconds = wall_seconds
+        self.bytes_in = bytes_in; self.bytes_out = len(stdout)
+
+def timeout_for(duration_seconds: float) -> float:
+    """Timeout for processing `duration_seconds` of media; an unknown (0) duration gets the cap."""
+    if duration_seconds <= 0: return FFMPEG_TIMEOUT_MAX_SECONDS
+    return min(FFMPEG_TIMEOUT_MAX_SECONDS, FFMPEG_TIMEOUT_BASE_SECONDS + FFMPEG_TIMEOUT_PER_MEDIA_SECOND * duration_seconds)
+
+def parse_benchmark(stderr: str) -> float:
+    """user + system CPU seconds from ffmpeg's `-benchmark` summary line, 0 when it is missing."""
+    match = _BENCH_RE.search(stderr or "")
+    return float(match.group(1)) + float(match.group(2)) if match else 0.0
+
+def _try_acquire_slot() -> Optional[int]:
+    os.makedirs(FFMPEG_SLOT_DIR, exist_ok=True)
+    for slot in range(max(1, FFMPEG_MAX_PROCESSES)):
+        fd = os.open(os.path.join(FFMPEG_SLOT_DIR, f"slot-{slot}.lock"), os.O_CREAT | os.O_RDWR, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError: os.close(fd)
+    return None
+
+def _release_slot(fd: int) -> None:
+    # Closing the descriptor drops the flock; a crashed process releases its slot the same way.
+    try: fcntl.flock(fd, fcntl.LOCK_UN)
+    finally: os.close(fd)
+
+@asynccontextmanager
+async def ffmpeg_slot():
+    """Holds one of the FFMPEG_MAX_PROCESSES host-wide slots for the duration of the block."""
+    waiting_since = time.monotonic()
+    fd = _try_acquire_slot()
+    while fd is None:
+        await asyncio.sleep(FFMPEG_SLOT_POLL_SECONDS)
+        fd = _try_acquire_slot()
+    metrics.FFMPEG_SLOT_WAIT.observe(time.monotonic() - waiting_since)
+    try: yield
+    finally: _release_slot(fd)
+
+@contextmanager
+def ffmpeg_slot_sync():
+    """Blocking variant of ffmpeg_slot() for code running outside the event loop (e.g. a process pool)."""
+    fd = _try_acquire_slot()
+    while fd is None:
+        time.sleep(FFMPEG_SLOT_POLL_SECONDS)
+        fd = _try_acquire_slot()
+    try: yield
+    finally: _release_slot(fd)
+
+async def run_ffmpeg(args: PyList[str], timeout: float, input_bytes: Optional[bytes] = None,
+                     on_stderr_line: Optional[Callable[[str], Awaitable[None]]] = None, operation: str = "ffmpeg") -> FFmpegResult:
+    """
+    Runs `ffmpeg -benchmark <args>` in a host-wide slot, feeding `input_bytes` on stdin and collecting stdout in
+    memory. stderr is read line by line (for `-progress pipe:2` handlers) and its tail kept for error messages.
+    Raises FFmpegTimeout (after killing the process) when it runs longer than `timeout`. `operation` labels the
+    run in ffmpeg_run_duration_seconds.
+    """
+    async with ffmpeg_slot():
+        started_at = time.monotonic(); outcome = "error"
+        process = await asyncio.create_subprocess_exec("ffmpeg", "-hide_banner", "-nostats", "-benchmark", *args,
+                                                       stdin=asyncio.subprocess.PIPE if input_bytes is not None else asyncio.subprocess.DEVNULL,
+                                                       stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stderr_tail: PyList[str] = []; bench_line = ""
+
+        async def feed_stdin():
+            if input_bytes is None: return
+            try:
+                process.stdin.write(input_bytes); await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError): pass # ffmpeg stopped reading (e.g. -t reached)
+            finally: process.stdin.close()
+
+        async def read_stderr():
+            nonlocal bench_line
+            async for raw_line in process.stderr:
+                line = raw_line.decode("utf-8", "replace").rstrip()
+                if line.startswith("bench: utime="): bench_line = line
+                if on_stderr_line: await on_stderr_line(line)
+                stderr_tail.append(line)
+                if len(stderr_tail) > 50: del stderr_tail[0]
+
+        async def communicate():
+            stdout, _, _ = await asyncio.gather(process.stdout.read(), feed_stdin(), read_stderr())
+            await process.wait()
+            return stdout
+
+        try:
+            stdout = await asyncio.wait_for(communicate(), timeout=timeout)
+            outcome = "ok" if process.returncode == 0 else "error"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise FFmpegTimeout(f"FFmpeg process timed out after {timeout:.0f} seconds.")
+        finally:
+            if process.returncode is None: process.kill(); await process.wait()
+            metrics.FFMPEG_RUN_DURATION.labels(operation, outcome).observe(time.monotonic() - started_at)
+    stderr = "\n".join(stderr_tail)[-_STDERR_TAIL_CHARS:]
+    bytes_in = len(input_bytes) if input_bytes is not None else sum(os.path.getsize(path) for flag, path in zip(args, args[1:]) if flag == "-i" and os.path.isfile(path))
+    return FFmpegResult(process.returncode, stdout, stderr, parse_benchmark(bench_line), time.monotonic() - started_at, bytes_in)
+
+def _probe_command(media_path: str) -> PyList[str]:
+    return ["ffprobe", "-v", "error", "-show_entries", "format=duration:stream=codec_type,height", "-of", "json", media_path]
+
+def _parse_probe(stdout: str) -> Dict[str, Any]:
+    try: info = json.loads(stdout or "{}")
+    except ValueError: info = {}
+    try: duration = float((info.get("format") or {}).get("duration") or 0.0)
+    except ValueError: duration = 0.0
+    streams = info.get("streams") or []
+    codec_types = {stream.get("codec_type") for stream in streams}
+    heights = [stream["height"] for stream in streams if stream.get("codec_type") == "video" and stream.get("height")]
+    return {"duration": duration, "has_audio": "audio" in codec_types, "has_video": "video" in codec_types, "height": heights[0] if heights else None}
+
+async def probe_media(media_path: str) -> Dict[str, Any]:
+    """
+    One ffprobe call: {"duration": seconds (0 when unknown), "has_audio": bool, "has_video": bool, "height": first
+    video stream's height or None}. Raises FFmpegTimeout (after killing ffprobe) past FFPROBE_TIMEOUT_SECONDS.
+    """
+    async with ffmpeg_slot():
+        started_at = time.monotonic(); outcome = "error"
+        process = await asyncio.create_subprocess_exec(*_probe_command(media_path), stdin=asyncio.subprocess.DEVNULL,
+                                                       stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=FFPROBE_TIMEOUT_SECONDS)
+            outcome = "ok" if process.returncode == 0 else "error"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise FFmpegTimeout(f"FFprobe timed out after {FFPROBE_TIMEOUT_SECONDS:.0f} seconds.")
+        finally:
+            if process.returncode is None: process.kill(); await process.wait()
+            metrics.FFMPEG_RUN_DURATION.labels("probe", outcome).observe(time.monotonic() - started_at)
+    return _parse_probe(stdout.decode("utf-8", "replace"))
+
+def probe_media_sync(media_path: str) -> Dict[str, Any]:
+    """Blocking variant of probe_media() for code running outside the event loop (e.g. a process pool)."""
+    with ffmpeg_slot_sync():
+        process = subprocess.run(_probe_command(media_path), capture_output=True, text=True, check=False, timeout=FFPROBE_TIMEOUT_SECONDS)
+    return _parse_probe(process.stdout)
+
+class FFmpegUsage:
+    """Running totals of ffmpeg work attributed to one pipeline stage or job."""
+    def __init__(self):
+        self.runs = 0; self.cpu_seconds = 0.0; self.bytes_in = 0; self.bytes_out = 0
+
+    def add(self, result: FFmpegResult) -> FFmpegResult:
+        self.runs += 1; self.cpu_seconds += result.cpu_seconds
+        self.bytes_in += result.bytes_in; self.bytes_out += result.bytes_out
+        return result
@@ -0,0 +1,129 @@
+import logging
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .upload_service import UPLOAD_DIR
+from .ffmpeg_runner import ffmpeg_slot_sync, probe_media_sync, parse_benchmark, timeout_for, FFmpegUsage
+from . import metrics
+from typing import Optional, List as PyList, Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+HLS_ENABLED = os.getenv("HLS_ENABLED", "true").lower() == "true"
+# Comma-separated "<height>:<video kbps>" rungs; rungs taller than the source are skipped.
+HLS_LADDER = os.getenv("HLS_LADDER", "1080:5000,720:2800,480:1400,360:800")
+HLS_AUDIO_BITRATE = os.getenv("HLS_AUDIO_BITRATE", "128k")
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+HLS_X264_PRESET = os.getenv("HLS_X264_PRESET", "veryfast")
+# Encodes run in this many worker processes, each ffmpeg limited to HLS_FFMPEG_THREADS, so packaging cannot take every core.
+HLS_PROCESS_WORKERS = int(os.getenv("HLS_PROCESS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HLS_FFMPEG_THREADS = int(os.getenv("HLS_FFMPEG_THREADS", "2"))
+HLS_ROOT = os.path.join(UPLOAD_DIR, "hls")
+HLS_MASTER_PLAYLIST = "master.m3u8"
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def parse_ladder(spec: str) -> PyList[Tuple[int, int]]:
+    rungs = []
+    for item in spec.split(","):
+        if ":" not in item: continue
+        height, kbps = item.split(":", 1)
+        rungs.append((int(height), int(kbps)))
+    return sorted(rungs, reverse=True)
+
+def hls_dir_for(video_filepath: str) -> str:
+    """Renditions live under UPLOAD_DIR/hls/<blob name>, shared by every video stored in that blob."""
+    return os.path.join(HLS_ROOT, os.path.splitext(os.path.basename(video_filepath))[0])
+
+def manifest_path_for(video_filepath: str) -> str:
+    """The master playlist's path relative to UPLOAD_DIR, as stored in videos.hls_manifest_path."""
+    return os.path.relpath(os.path.join(hls_dir_for(video_filepath), HLS_MASTER_PLAYLIST), UPLOAD_DIR)
+
+def _probe_source(video_filepath: str) -> Tuple[int, bool, float]:
+    """Returns (video height, has an audio stream, duration in seconds) from one ffprobe run."""
+    probe = probe_media_sync(video_filepath)
+    if not probe["height"]: raise RuntimeError("Source has no video stream")
+    return int(probe["height"]), probe["has_audio"], probe["duration"]
+
+def select_rungs(source_height: int, ladder: PyList[Tuple[int, int]]) -> PyList[Tuple[int, int]]:
+    """Rungs no taller than the source; a source below the whole ladder gets the lowest bitrate at its own height."""
+    rungs = [(height, kbps) for height, kbps in ladder if height <= source_height]
+    return rungs or [(source_height - source_height % 2, ladder[-1][1])]
+
+def build_ffmpeg_command(video_filepath: str, output_dir: str, rungs: PyList[Tuple[int, int]], has_audio: bool) -> PyList[str]:
+    """
+    One ffmpeg run that decodes once, scales into every rung and writes a VOD HLS variant per rung plus the master
+    playlist. Everything is kept in one flat directory: ffmpeg writes the master next to the variant playlists.
+    """
+    splits = "".join(f"[v{i}]" for i in range(len(rungs)))
+    filters = [f"[0:v]split={len(rungs)}{splits}"] + [f"[v{i}]scale=-2:{height}[v{i}out]" for i, (height, _) in enumerate(rungs)]
+    command = ["ffmpeg", "-y", "-hide_banner", "-nostats", "-benchmark", "-i", video_filepath, "-filter_complex", ";".join(filters), "-threads", str(HLS_FFMPEG_THREADS)]
+    for i, (_, kbps) in enumerate(rungs):
+        command += ["-map", f"[v{i}out]", f"-c:v:{i}", "libx264", f"-b:v:{i}", f"{kbps}k", f"-maxrate:v:{i}", f"{int(kbps * 1.07)}k", f"-bufsize:v:{i}", f"{kbps * 2}k"]
+        if has_audio: command += ["-map", "0:a:0"]
+    if has_audio: command += ["-c:a", "aac", "-b:a", HLS_AUDIO_BITRATE, "-ac", "2"]
+    # Keyframes on segment boundaries so every rung can switch at every segment.
+    command += ["-preset", HLS_X264_PRESET, "-sc_threshold", "0", "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+                "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod", "-hls_flags", "independent_segments",
+                "-hls_segment_filename", os.path.join(output_dir, "v%v_%05d.ts"), "-master_pl_name", HLS_MASTER_PLAYLIST,
+                "-var_stream_map", " ".join(f"v:{i},a:{i}" if has_audio else f"v:{i}" for i in range(len(rungs))),
+                os.path.join(output_dir, "v%v.m3u8")]
+    return command
+
+def package_hls(video_filepath: str, output_dir: str) -> Dict[str, Any]:
+    """
+    Encodes the ladder into a scratch directory and renames it to `output_dir` when complete, so a half-written
+    ladder is never served. Runs in a pool process, holding one host-wide ffmpeg slot while encoding.
+    Returns the rendition heights and the encode's CPU seconds and byte counts.
+    """
+    source_height, has_audio, duration = _probe_source(video_filepath)
+    rungs = select_rungs(source_height, parse_ladder(HLS_LADDER))
+    scratch_dir = f"{output_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(scratch_dir)
+    try:
+        with ffmpeg_slot_sync():
+            process = subprocess.run(build_ffmpeg_command(video_filepath, scratch_dir, rungs, has_audio), capture_output=True, text=True, check=False,
+                                     timeout=timeout_for(duration * len(rungs))) # every rung is a full encode of the source
+        bytes_out = sum(os.path.getsize(os.path.join(scratch_dir, name)) for name in os.listdir(scratch_dir))
+        if process.returncode != 0:
+            raise RuntimeError(f"FFmpeg HLS packaging failed: {(process.stderr or '')[-1000:]}")
+        try: os.rename(scratch_dir, output_dir)
+        except OSError:
+            if not os.path.exists(os.path.join(output_dir, HLS_MASTER_PLAYLIST)): raise # otherwise a concurrent run finished first
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return {"heights": [height for height, _ in rungs], "cpu_seconds": parse_benchmark(process.stderr),
+            "bytes_in": os.path.getsize(video_filepath), "bytes_out": bytes_out}
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: a forked copy of a process with a running event loop and open DB connections is not safe to use.
+        _executor = ProcessPoolExecutor(max_workers=HLS_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+async def package_video(video_filepath: str) -> Tuple[str, Optional[FFmpegUsage]]:
+    """
+    Makes sure the blob has HLS renditions. Returns the manifest path relative to UPLOAD_DIR and the ffmpeg usage
+    of the encode (None when the renditions already existed).
+    """
+    output_dir = hls_dir_for(video_filepath)
+    if os.path.exists(os.path.join(output_dir, HLS_MASTER_PLAYLIST)): return manifest_path_for(video_filepath), None
+    os.makedirs(HLS_ROOT, exist_ok=True)
+    # Timed here: metrics observed inside the spawned encoder processes would never be scraped.
+    started_at = time.monotonic(); outcome = "error"
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_executor(), package_hls, video_filepath, output_dir); outcome = "ok"
+    finally: metrics.FFMPEG_RUN_DURATION.labels("hls_package", outcome).observe(time.monotonic() - started_at)
+    usage = FFmpegUsage(); usage.runs = 1
+    usage.cpu_seconds = result["cpu_seconds"]; usage.bytes_in = result["bytes_in"]; usage.bytes_out = result["bytes_out"]
+    logger.info(f"Packaged {os.path.basename(video_filepath)} into {len(result['heights'])} renditions {result['heights']}: {usage.cpu_seconds:.1f}s CPU, {usage.bytes_out} bytes.")
+    return manifest_path_for(video_filepath), usage
+
+def remove_renditions(video_filepath: str) -> None:
+    shutil.rmtree(hls_dir_for(video_filepath), ignore_errors=True)
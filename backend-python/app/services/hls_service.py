@@ -0,0 +1,35 @@
+import logging
+import time
+from .. import crud
+from . import progress_events, hls_packaging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+async def process_hls_packaging(video_id: int, video_filepath: str, db_session_factory):
+    """
+    Packages the video's blob into the HLS ladder and stores the manifest on every video sharing that blob.
+    Failures are re-raised so the job queue retries; playback keeps using the original file meanwhile.
+    """
+    db = db_session_factory()
+    logger.info(f"Video ID {video_id}: Starting HLS packaging.")
+    started_at = time.monotonic()
+    error: Optional[str] = None
+    usage = None
+    try:
+        await progress_events.publish(video_id, "stage", stage="hls", status="started")
+        manifest_path, usage = await hls_packaging.package_video(video_filepath)
+        updated = await crud.set_hls_manifest(db, filepath=video_filepath, hls_manifest_path=manifest_path)
+        logger.info(f"Video ID {video_id}: Manifest {manifest_path} set on {updated} video(s).")
+    except Exception as e:
+        error = str(e)
+        logger.error(f"Video ID {video_id}: HLS packaging failed: {error}")
+        raise
+    finally:
+        duration_seconds = time.monotonic() - started_at
+        status = "failed" if error else "succeeded"
+        await progress_events.publish(video_id, "stage", stage="hls", status=status, duration_seconds=round(duration_seconds, 3))
+        try: await crud.record_pipeline_stage_run(db, video_id=video_id, stage="hls", status=status, duration_ms=int(duration_seconds * 1000), error=error, ffmpeg_usage=usage)
+        except Exception as e: logger.warning(f"Video ID {video_id}: Could not record stage timing: {e}")
+        await db.close()
@@ -0,0 +1,117 @@
+import logging
+import os
+import random
+from datetime import timedelta
+from sqlalchemy import and_, or_, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, crud
+from . import tracing
+from typing import Optional, List as PyList, Any, Dict
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPE_TRANSCRIPTION = "transcription"
+JOB_TYPE_MINDMAP = "mindmap"
+JOB_TYPE_QUIZ = "quiz"
+JOB_TYPE_HLS = "hls"
+
+# Video status to fall back to once a job has used up all of its attempts (job types not listed leave it as is).
+JOB_EXHAUSTED_VIDEO_STATUS = {JOB_TYPE_TRANSCRIPTION: "failed", JOB_TYPE_MINDMAP: "completed", JOB_TYPE_QUIZ: "completed"}
+
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+
+def _mark_exhausted(job: models.Job, video_statuses: Dict[int, str]) -> None:
+    """Fails the job and adds its video's fallback status to `video_statuses`, applied by the caller in one statement."""
+    job.status = "failed"; job.locked_by = None; job.lease_expires_at = None
+    video_id = (job.payload or {}).get("video_id")
+    fallback_status = JOB_EXHAUSTED_VIDEO_STATUS.get(job.job_type)
+    if video_id and fallback_status: video_statuses[video_id] = fallback_status
+
+async def enqueue_job(db: AsyncSession, job_type: str, payload: Dict[str, Any], max_attempts: Optional[int] = None, commit: bool = True) -> models.Job:
+    # The worker continues the enqueuing request's trace from this W3C traceparent.
+    traceparent = tracing.current_traceparent()
+    if traceparent: payload = {**payload, "traceparent": traceparent}
+    db_job = models.Job(job_type=job_type, payload=payload, status="queued", attempts=0, max_attempts=max_attempts or JOB_MAX_ATTEMPTS)
+    db.add(db_job); await db.flush()
+    if commit: await db.commit(); await db.refresh(db_job)
+    logger.info(f"Enqueued {job_type} job {db_job.id}: {payload}")
+    return db_job
+
+async def claim_jobs(db: AsyncSession, job_type: str, worker_id: str, limit: int) -> PyList[Dict[str, Any]]:
+    """
+    Claims up to `limit` runnable jobs of one type with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+    workers never pick the same row. Jobs whose lease expired (worker died mid-run) are picked up again.
+    """
+    if limit <= 0: return []
+    now = func.now()
+    runnable = or_(
+        and_(models.Job.status == "queued", models.Job.run_after <= now),
+        and_(models.Job.status == "running", models.Job.lease_expires_at < now),
+    )
+    jobs = (await db.scalars(select(models.Job)
+            .where(models.Job.job_type == job_type, runnable)
+            .order_by(models.Job.run_after, models.Job.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True))).all()
+    claimed, exhausted_video_statuses = [], {}
+    for job in jobs:
+        if job.status == "running" and job.attempts >= job.max_attempts:
+            _mark_exhausted(job, exhausted_video_statuses)
+            job.last_error = (job.last_error or "") + "\nLease expired on final attempt."
+            logger.warning(f"Job {job.id} ({job.job_type}) lease expired on final attempt, marking failed.")
+            continue
+        job.status = "running"; job.locked_by = worker_id; job.attempts += 1
+        job.lease_expires_at = now + timedelta(seconds=JOB_LEASE_SECONDS)
+        claimed.append({"id": job.id, "job_type": job.job_type, "payload": dict(job.payload or {}), "attempts": job.attempts, "max_attempts": job.max_attempts})
+    await crud.bulk_update_video_status(db, exhausted_video_statuses, commit=False)
+    await db.commit()
+    return claimed
+
+async def heartbeat_job(db: AsyncSession, job_id: int, worker_id: str) -> bool:
+    result = await db.execute(update(models.Job)
+               .where(models.Job.id == job_id, models.Job.locked_by == worker_id, models.Job.status == "running")
+               .values({models.Job.lease_expires_at: func.now() + timedelta(seconds=JOB_LEASE_SECONDS)})
+               .execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount > 0
+
+async def complete_job(db: AsyncSession, job_id: int, worker_id: str) -> None:
+    await db.execute(update(models.Job)
+     .where(models.Job.id == job_id, models.Job.locked_by == worker_id)
+     .values({models.Job.status: "succeeded", models.Job.locked_by: None, models.Job.lease_expires_at: None})
+     .execution_options(synchronize_session=False))
+    await db.commit()
+
+def retry_delay_seconds(attempts: int) -> float:
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+async def fail_job(db: AsyncSession, job_id: int, worker_id: str, error: str) -> bool:
+    """
+    Records a failed attempt. Returns True when the job was re-queued with backoff, False when it is out of attempts.
+    """
+    job = (await db.scalars(select(models.Job).where(models.Job.id == job_id, models.Job.locked_by == worker_id).with_for_update())).first()
+    if not job: await db.rollback(); return False
+    job.last_error = error[:2000]; job.locked_by = None; job.lease_expires_at = None
+    will_retry = job.attempts < job.max_attempts
+    if will_retry:
+        job.status = "queued"
+        job.run_after = func.now() + timedelta(seconds=retry_delay_seconds(job.attempts))
+    else:
+        exhausted_video_statuses: Dict[int, str] = {}
+        _mark_exhausted(job, exhausted_video_statuses)
+        await crud.bulk_update_video_status(db, exhausted_video_statuses, commit=False)
+    await db.commit()
+    return will_retry
+
+async def get_queue_depth(db: AsyncSession) -> Dict[str, Dict[str, int]]:
+    rows = (await db.execute(select(models.Job.job_type, models.Job.status, func.count(models.Job.id))
+            .where(models.Job.status.in_(["queued", "running", "failed"]))
+            .group_by(models.Job.job_type, models.Job.status))).all()
+    depth: Dict[str, Dict[str, int]] = {}
+    for job_type, status, count in rows:
+        depth.setdefault(job_type, {"queued": 0, "running": 0, "failed": 0})[status] = count
+    return depth
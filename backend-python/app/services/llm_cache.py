@@ -0,0 +1,111 @@
+import logging
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select, delete
+from .. import models
+from ..database import AsyncSessionLocal
+from typing import Optional, List as PyList, Any, Dict
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_MEMORY_BYTES = int(os.getenv("LLM_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_DB_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DB_MAX_ENTRIES", "20000"))
+# The DB tier is pruned (expired rows, then oldest beyond LLM_CACHE_DB_MAX_ENTRIES) once every N writes.
+LLM_CACHE_DB_PRUNE_EVERY = int(os.getenv("LLM_CACHE_DB_PRUNE_EVERY", "100"))
+
+def make_cache_key(model: str, messages: PyList[Dict[str, Any]], temperature: Optional[float], response_format: Optional[Dict[str, Any]]) -> str:
+    material = json.dumps({"model": model, "messages": messages, "temperature": temperature, "response_format": response_format}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    Two-tier cache for chat completion contents: a per-process LRU bounded by entry count and bytes,
+    backed by the shared `llm_cache_entries` table so API and worker processes reuse each other's results.
+    """
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: int):
+        self.max_entries = max_entries; self.max_bytes = max_bytes; self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (expires_at_monotonic, response)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "memory_evictions": 0}
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            if entry[0] < time.monotonic():
+                self._drop(key); return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _memory_put(self, key: str, response: str, ttl_seconds: float) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._entries: self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl_seconds, response); self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries))); self.stats["memory_evictions"] += 1
+
+    def _drop(self, key: str) -> None:
+        _, response = self._entries.pop(key)
+        self._bytes -= len(response.encode("utf-8"))
+
+    async def _db_get(self, key: str) -> Optional[tuple]:
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(select(models.LLMCacheEntry.response, models.LLMCacheEntry.expires_at).where(models.LLMCacheEntry.key == key, models.LLMCacheEntry.expires_at > func.now()))).first()
+            return (row.response, row.expires_at) if row else None
+
+    async def _db_put(self, key: str, model: str, response: str, prune: bool) -> None:
+        async with AsyncSessionLocal() as db:
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+            await db.merge(models.LLMCacheEntry(key=key, model=model, response=response, size_bytes=len(response.encode("utf-8")), expires_at=expires_at))
+            if prune:
+                await db.execute(delete(models.LLMCacheEntry).where(models.LLMCacheEntry.expires_at <= func.now()))
+                keep_keys = select(models.LLMCacheEntry.key).order_by(models.LLMCacheEntry.created_at.desc()).limit(LLM_CACHE_DB_MAX_ENTRIES)
+                await db.execute(delete(models.LLMCacheEntry).where(models.LLMCacheEntry.key.notin_(keep_keys.scalar_subquery())))
+            await db.commit()
+
+    async def get(self, key: str) -> Optional[str]:
+        response = self._memory_get(key)
+        if response is not None:
+            self.stats["memory_hits"] += 1; return response
+        try: row = await self._db_get(key)
+        except Exception as e:
+            logger.warning(f"DB lookup failed: {e}"); row = None
+        if row is None:
+            self.stats["misses"] += 1; return None
+        response, expires_at = row
+        self._memory_put(key, response, max(0.0, (expires_at - datetime.now(timezone.utc)).total_seconds()))
+        self.stats["db_hits"] += 1
+        return response
+
+    async def set(self, key: str, model: str, response: str) -> None:
+        self._memory_put(key, response, self.ttl_seconds)
+        self.stats["writes"] += 1
+        self._writes_since_prune += 1
+        prune = self._writes_since_prune >= LLM_CACHE_DB_PRUNE_EVERY
+        if prune: self._writes_since_prune = 0
+        try: await self._db_put(key, model, response, prune)
+        except Exception as e: logger.warning(f"DB write failed: {e}")
+
+    def record_bypass(self) -> None:
+        """Counts a call that skipped the lookup on purpose (e.g. a forced regeneration)."""
+        self.stats["bypassed"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["db_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["db_hits"]
+        return {**self.stats, "enabled": LLM_CACHE_ENABLED, "hit_ratio": (hits / lookups) if lookups else 0.0,
+                "memory_entries": len(self._entries), "memory_bytes": self._bytes}
+
+llm_cache = LLMResponseCache(LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_MEMORY_BYTES, LLM_CACHE_TTL_SECONDS)
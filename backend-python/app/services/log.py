@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import logging
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json: one object per line for log shippers; text: human-readable lines for local development.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Fields added to every record logged inside log_context(), e.g. {"video_id": 12, "job_id": 40, "stage": "transcribe"}.
+_log_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+_STANDARD_RECORD_FIELDS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+@contextmanager
+def log_context(**fields):
+    token = _log_context.set({**_log_context.get(), **{key: value for key, value in fields.items() if value is not None}})
+    try: yield
+    finally: _log_context.reset(token)
+
+def _record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """Context fields, the current trace/span ids and anything passed as `extra=`."""
+    from .tracing import current_trace_ids # tracing logs through this module
+    fields = dict(_log_context.get())
+    fields.update(current_trace_ids())
+    fields.update({key: value for key, value in record.__dict__.items() if key not in _STANDARD_RECORD_FIELDS})
+    return fields
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(), "level": record.levelname,
+                 "logger": record.name, "message": record.getMessage(), **_record_fields(record)}
+        if record.exc_info: entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _record_fields(record)
+        return f"{line} {' '.join(f'{key}={value}' for key, value in fields.items())}" if fields else line
+
+def setup_logging() -> None:
+    """Routes every logger (including uvicorn's and sqlalchemy's) through one stderr handler in LOG_FORMAT."""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers = []; logging.getLogger(name).propagate = True
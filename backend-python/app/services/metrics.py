@@ -0,0 +1,128 @@
+import os
+import time
+import functools
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+from . import tracing
+
+# Port of the worker's own /metrics endpoint; the API serves its metrics on /metrics. 0 disables the worker endpoint.
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# Buckets reach into minutes: ffmpeg runs, Whisper chunks and pipeline stages are slow.
+_SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+_FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ["method", "route", "status"], buckets=_FAST_BUCKETS)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served.")
+FFMPEG_RUN_DURATION = Histogram("ffmpeg_run_duration_seconds", "Wall time of ffmpeg/ffprobe runs, excluding the wait for a slot.", ["operation", "outcome"], buckets=_SLOW_BUCKETS)
+FFMPEG_SLOT_WAIT = Histogram("ffmpeg_slot_wait_seconds", "Time spent waiting for a host-wide ffmpeg slot.", buckets=_FAST_BUCKETS + (60, 300))
+OPENAI_REQUEST_DURATION = Histogram("openai_request_duration_seconds", "Latency of OpenAI API calls (chat, embedding, transcription).", ["kind", "model"], buckets=_SLOW_BUCKETS)
+OPENAI_TOKENS = Counter("openai_tokens_total", "Tokens sent to and received from OpenAI.", ["kind", "model", "direction"])
+OPENAI_AUDIO_SECONDS = Counter("openai_audio_seconds_total", "Seconds of audio sent to Whisper.", ["model"])
+LLM_FUNCTION_DURATION = Histogram("llm_function_duration_seconds", "Latency of each LLM-backed function, including cache hits and retries.", ["function", "outcome"], buckets=_SLOW_BUCKETS)
+CRUD_QUERY_DURATION = Histogram("crud_query_duration_seconds", "Latency of crud functions not called from other crud functions.", ["function", "outcome"], buckets=_FAST_BUCKETS)
+DB_STATEMENT_DURATION = Histogram("db_statement_duration_seconds", "Latency of single SQL statements.", buckets=_FAST_BUCKETS)
+PIPELINE_STAGE_DURATION = Histogram("pipeline_stage_duration_seconds", "Duration of transcription pipeline stages.", ["stage", "status"], buckets=_SLOW_BUCKETS)
+WORKER_JOB_DURATION = Histogram("worker_job_duration_seconds", "Duration of worker jobs.", ["job_type", "outcome"], buckets=_SLOW_BUCKETS)
+WORKER_JOBS_IN_FLIGHT = Gauge("worker_jobs_in_flight", "Jobs this worker is running.", ["job_type"])
+
+def timed(histogram: Histogram, label: str, span_name: str = ""):
+    """
+    Decorator for coroutine functions: observes each call's duration in `histogram` under `label` (its first
+    label) with outcome ok/error, inside a span named `span_name` when given.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started_at = time.perf_counter(); outcome = "error"
+            try:
+                if not span_name:
+                    result = await function(*args, **kwargs)
+                else:
+                    with tracing.span(span_name): result = await function(*args, **kwargs)
+                outcome = "ok"; return result
+            finally: histogram.labels(label, outcome).observe(time.perf_counter() - started_at)
+        return wrapper
+    return decorate
+
+def llm_function(function):
+    """timed() for the LLM-backed functions in openai_utils, labelled and traced by function name."""
+    return timed(LLM_FUNCTION_DURATION, function.__name__, span_name=f"llm {function.__name__}")(function)
+
+def observe_api_call(kind: str, model: str, latency_ms: int, prompt_tokens: int, completion_tokens: int, audio_seconds) -> None:
+    OPENAI_REQUEST_DURATION.labels(kind, model).observe(latency_ms / 1000)
+    if prompt_tokens: OPENAI_TOKENS.labels(kind, model, "prompt").inc(prompt_tokens)
+    if completion_tokens: OPENAI_TOKENS.labels(kind, model, "completion").inc(completion_tokens)
+    if audio_seconds: OPENAI_AUDIO_SECONDS.labels(model).inc(audio_seconds)
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing every request under its route template (e.g. /videos/{video_id}), so the label set
+    stays small, in a server span that jobs enqueued by the request continue (see job_queue.enqueue_job).
+    A request counts until its last body chunk is sent or the client disconnects, so streamed responses
+    (chat streams, progress events) are timed and shown in flight for their whole length.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        method = scope["method"]; started_at = time.perf_counter(); state = {"status": 500, "finished": False}
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        with tracing.span(f"{method} {scope['path']}", **{"http.method": method}) as current:
+            def finish():
+                if state["finished"]: return
+                state["finished"] = True
+                HTTP_REQUESTS_IN_FLIGHT.dec()
+                route = getattr(scope.get("route"), "path", None)
+                HTTP_REQUEST_DURATION.labels(method, route or "unmatched", str(state["status"])).observe(time.perf_counter() - started_at)
+                if current is not None:
+                    current.set_attribute("http.status_code", state["status"])
+                    if route: current.update_name(f"{method} {route}")
+
+            async def observed_send(message):
+                if message["type"] == "http.response.start": state["status"] = message["status"]
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False): finish()
+
+            async def observed_receive():
+                message = await receive()
+                if message["type"] == "http.disconnect": finish()
+                return message
+
+            try: await self.app(scope, observed_receive, observed_send)
+            finally: finish()
+
+class _PoolCollector:
+    """Connection pool usage of a SQLAlchemy engine, read at scrape time."""
+    def __init__(self, engine):
+        self.pool = engine.sync_engine.pool
+
+    def collect(self):
+        family = GaugeMetricFamily("db_pool_connections", "Database pool connections by state.", labels=["state"])
+        family.add_metric(["checked_out"], self.pool.checkedout())
+        family.add_metric(["idle"], self.pool.checkedin())
+        family.add_metric(["overflow"], max(0, self.pool.overflow()))
+        family.add_metric(["size"], self.pool.size())
+        yield family
+
+def instrument_engine(engine) -> None:
+    """Registers the pool gauges and times every statement the engine executes."""
+    from sqlalchemy import event
+    REGISTRY.register(_PoolCollector(engine))
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("statement_started_at")
+        if started: DB_STATEMENT_DURATION.observe(time.perf_counter() - started.pop())
+
+def start_worker_metrics_server() -> None:
+    if WORKER_METRICS_PORT: start_http_server(WORKER_METRICS_PORT)
+
+def render_latest():
+    """(body, content type) of the current metrics, for the API's /metrics route."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,46 +1,49 @@
+import logging
 import os
-import json
 import asyncio
 from .. import crud
-from ..database import SessionLocal
+from . import progress_events, condensation
 from .openai_utils import generate_mindmap_data_from_transcript 
+from .utils import format_timestamp
 from typing import Optional, List as PyList, Any, Dict
 
+logger = logging.getLogger(__name__)
 
-async def process_mindmap_generation(video_id: int, db_session_factory):
+
+async def process_mindmap_generation(video_id: int, db_session_factory, bypass_cache: bool = False, final_attempt: bool = True):
+    """Errors are re-raised so the job queue retries; the error mind map is only written on the `final_attempt`."""
     db = db_session_factory()
-    print(f"[MindmapService] Video ID {video_id}: Starting mind map generation process.")
+    logger.info(f"Video ID {video_id}: Starting mind map generation process.")
     try:
-        video = crud.get_video(db, video_id=video_id)
+        video = await crud.get_video(db, video_id=video_id)
         if not video: 
-            print(f"[MindmapService] Video ID {video_id}: Not found."); return
-        if not video.transcript:
-            print(f"[MindmapService] Video ID {video_id}: No transcript available.")
-            crud.update_video_data(db=db, video_id=video_id, mindmap_data="# Mind Map Failed\n- No transcript.", status="completed")
+            logger.info(f"Video ID {video_id}: Not found."); return
+        if video.transcript_segment_count is None:
+            logger.info(f"Video ID {video_id}: No transcript available.")
+            await crud.update_video_data(db=db, video_id=video_id, mindmap_data="# Mind Map Failed\n- No transcript.", status="completed")
             return
         
-        try:
-            transcript_data = json.loads(video.transcript)
-            full_text = " ".join([seg['text'] for seg in transcript_data.get("segments", [])])
-            key_moments = transcript_data.get("key_moments", [])
-        except json.JSONDecodeError:
-            print(f"[MindmapService] Video ID {video_id}: Could not parse transcript.")
-            crud.update_video_data(db=db, video_id=video_id, mindmap_data="# Mind Map Failed\n- Parse transcript error.", status="completed")
-            return
+        full_text = await crud.get_transcript_text(db, video_id=video_id)
+        key_moments = [{"label": moment.label, "timestamp_start": format_timestamp(moment.start_seconds)} for moment in await crud.get_key_moments(db, video_id=video_id)]
 
         if not full_text.strip():
-            print(f"[MindmapService] Video ID {video_id}: Transcript text empty.")
-            crud.update_video_data(db=db, video_id=video_id, mindmap_data="# Mind Map Failed\n- Empty transcript text.", status="completed")
+            logger.info(f"Video ID {video_id}: Transcript text empty.")
+            await crud.update_video_data(db=db, video_id=video_id, mindmap_data="# Mind Map Failed\n- Empty transcript text.", status="completed")
             return
 
-        mindmap_markdown = await generate_mindmap_data_from_transcript(full_text, key_moments)
-        print(f"[MindmapService] Video ID {video_id}: Mind map generated, updating status to 'completed'.")
-        crud.update_video_data(db=db, video_id=video_id, mindmap_data=mindmap_markdown, status="completed")
-        print(f"[MindmapService] Video ID {video_id}: Mind map saved.")
+        await progress_events.publish(video_id, "stage", stage="mindmap", status="started")
+        digest = await condensation.load_digest(db, video)
+        mindmap_markdown = await generate_mindmap_data_from_transcript(digest, key_moments, bypass_cache=bypass_cache)
+        logger.info(f"Video ID {video_id}: Mind map generated, updating status to 'completed'.")
+        await crud.update_video_data(db=db, video_id=video_id, mindmap_data=mindmap_markdown, status="completed")
+        logger.info(f"Video ID {video_id}: Mind map saved.")
 
     except Exception as e:
-        print(f"[MindmapService] Video ID {video_id}: Error in process_mindmap_generation: {str(e)}")
-        crud.update_video_data(db=db, video_id=video_id, mindmap_data=f"# Mind Map Error\n- {str(e)}", status="completed")
+        logger.error(f"Video ID {video_id}: Error in process_mindmap_generation: {str(e)}")
+        if final_attempt:
+            await db.rollback()
+            await crud.update_video_data(db=db, video_id=video_id, mindmap_data=f"# Mind Map Error\n- {str(e)}", status="completed")
+        raise
     finally:
-        print(f"[MindmapService] Video ID {video_id}: Mindmap task finished, closing DB session.")
-        db.close()
\ No newline at end of file
+        logger.debug(f"Video ID {video_id}: Mindmap task finished, closing DB session.")
+        await db.close()
\ No newline at end of file
@@ -1,30 +1,176 @@
+import logging
 import os
 import json
 import asyncio
-from openai import OpenAI
-from typing import List as PyList, Any, Dict 
+import time
+import random
+import httpx
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+from typing import Optional, List as PyList, Any, Dict, AsyncIterator, Tuple 
+from .rate_limiter import RequestRateLimiter
+from .alignment import SegmentTextIndex
 from .utils import format_timestamp 
+from .llm_cache import llm_cache, make_cache_key, LLM_CACHE_ENABLED
+from . import token_budget, metrics
+from .token_budget import fit_prompt, count_message_tokens
 from .prompt_manager import ( # Import prompts from prompt_manager
     get_key_moments_extraction_prompt,
     get_mindmap_generation_prompt,
-    get_quiz_generation_prompt,
+    get_chapter_quiz_prompt,
     get_tag_generation_prompt,
+    get_chunk_summary_prompt,
+    get_digest_reduce_prompt,
     get_chat_prompt
 )
 
+logger = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+WHISPER_TIMEOUT_SECONDS = float(os.getenv("WHISPER_TIMEOUT_SECONDS", "300"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "32"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_RETRY_BASE_SECONDS = float(os.getenv("OPENAI_RETRY_BASE_SECONDS", "1"))
+OPENAI_RETRY_MAX_SECONDS = float(os.getenv("OPENAI_RETRY_MAX_SECONDS", "60"))
+# Org limits for this process; set them to your share when running several API/worker processes.
+OPENAI_CHAT_RPM_LIMIT = int(os.getenv("OPENAI_CHAT_RPM_LIMIT", "3000"))
+OPENAI_CHAT_TPM_LIMIT = int(os.getenv("OPENAI_CHAT_TPM_LIMIT", "250000"))
+OPENAI_WHISPER_RPM_LIMIT = int(os.getenv("OPENAI_WHISPER_RPM_LIMIT", "50"))
+# Completion tokens reserved per chat call on top of the prompt estimate.
+OPENAI_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_TOKENS_ESTIMATE", "1000"))
+
 try:
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=60.0) 
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS, keepalive_expiry=30.0),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=10.0))
+    # Retries are handled below so they can share the rate limiter and honor Retry-After.
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=OPENAI_TIMEOUT_SECONDS, max_retries=0, http_client=http_client) 
     if not os.getenv("OPENAI_API_KEY"):
-        print("Warning: OPENAI_API_KEY environment variable not set. OpenAI calls will fail.")
+        logger.warning("OPENAI_API_KEY environment variable not set. OpenAI calls will fail.")
 except Exception as e:
-    print(f"Error initializing OpenAI client: {e}. OpenAI calls will fail.")
+    logger.error(f"Error initializing OpenAI client: {e}. OpenAI calls will fail.")
     client = None
 
-async def extract_key_moments(full_transcript_text: str, whisper_segments_objects: PyList[Any]) -> PyList[Dict[str, str]]:
+chat_rate_limiter = RequestRateLimiter(OPENAI_CHAT_RPM_LIMIT, OPENAI_CHAT_TPM_LIMIT)
+whisper_rate_limiter = RequestRateLimiter(OPENAI_WHISPER_RPM_LIMIT)
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers: return None
+    if headers.get("retry-after-ms"):
+        try: return float(headers["retry-after-ms"]) / 1000
+        except ValueError: pass
+    retry_after = headers.get("retry-after")
+    if not retry_after: return None
+    try: return float(retry_after)
+    except ValueError: pass
+    try: return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError): return None
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, RateLimitError):
+        return getattr(error, "code", None) != "insufficient_quota" # quota exhaustion will not clear by waiting
+    if isinstance(error, (APIConnectionError, APITimeoutError, InternalServerError)): return True
+    return isinstance(error, APIStatusError) and error.status_code in (408, 409)
+
+async def _call_with_retries(request, rate_limiter: RequestRateLimiter, estimated_tokens: int = 0, description: str = "OpenAI call"):
+    """
+    Runs `request()` (a coroutine factory) under the rate limiter, retrying rate limits, timeouts and 5xx
+    with jittered exponential backoff. A server-provided Retry-After always takes precedence.
+    """
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        await rate_limiter.acquire(estimated_tokens)
+        try:
+            return await request()
+        except Exception as e:
+            if attempt >= OPENAI_MAX_RETRIES or not _is_retryable(e): raise
+            backoff = min(OPENAI_RETRY_MAX_SECONDS, OPENAI_RETRY_BASE_SECONDS * (2 ** attempt))
+            delay = _retry_after_seconds(e)
+            delay = delay if delay is not None else random.uniform(0, backoff)
+            logger.warning(f"{description} failed ({type(e).__name__}), retry {attempt + 1}/{OPENAI_MAX_RETRIES} in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+async def _create_chat_completion(**request_kwargs):
+    """One chat completion, checked against the project's token ceiling and recorded in llm_usage."""
+    await token_budget.check_token_ceiling()
+    prompt_tokens = count_message_tokens(request_kwargs["messages"], request_kwargs["model"])
+    estimated_tokens = prompt_tokens + OPENAI_COMPLETION_TOKENS_ESTIMATE
+    started_at = time.perf_counter()
+    response = await _call_with_retries(lambda: client.chat.completions.create(**request_kwargs), chat_rate_limiter, estimated_tokens, f"Chat completion ({request_kwargs.get('model')})")
+    usage = getattr(response, "usage", None)
+    if usage is not None: chat_rate_limiter.record_actual_tokens(estimated_tokens, getattr(usage, "total_tokens", 0) or 0)
+    await token_budget.record_usage("chat", request_kwargs["model"], getattr(usage, "prompt_tokens", None) or prompt_tokens,
+                                    getattr(usage, "completion_tokens", None) or 0, int((time.perf_counter() - started_at) * 1000))
+    return response
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_BATCH_SIZE = 256
+
+@metrics.llm_function
+async def embed_texts(texts: PyList[str]) -> PyList[PyList[float]]:
+    embeddings: PyList[PyList[float]] = []
+    for batch_start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        batch = texts[batch_start:batch_start + EMBEDDING_BATCH_SIZE]
+        await token_budget.check_token_ceiling()
+        estimated_tokens = sum(token_budget.count_tokens(text, EMBEDDING_MODEL) for text in batch)
+        started_at = time.perf_counter()
+        response = await _call_with_retries(lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=batch), chat_rate_limiter, estimated_tokens, "Embeddings")
+        usage = getattr(response, "usage", None)
+        await token_budget.record_usage("embedding", EMBEDDING_MODEL, getattr(usage, "prompt_tokens", None) or estimated_tokens, 0, int((time.perf_counter() - started_at) * 1000))
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
+
+@metrics.llm_function
+async def transcribe_audio(audio_bytes: bytes, filename: str) -> PyList[Any]:
+    """Sends one in-memory audio file to Whisper (its format is taken from `filename`) and returns its verbose_json segments."""
+    started_at = time.perf_counter()
+    whisper_response = await _call_with_retries(
+        lambda: client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(filename, audio_bytes),
+            response_format="verbose_json",
+            timestamp_granularities=["segment"],
+            timeout=WHISPER_TIMEOUT_SECONDS),
+        whisper_rate_limiter, description="Whisper transcription")
+    # Whisper is billed by audio duration, not tokens.
+    await token_budget.record_usage("transcription", "whisper-1", latency_ms=int((time.perf_counter() - started_at) * 1000), audio_seconds=getattr(whisper_response, "duration", None))
+    return getattr(whisper_response, 'segments', None) or []
+
+def _is_json_object(content: str) -> bool:
+    try: return isinstance(json.loads(content), dict)
+    except (json.JSONDecodeError, TypeError): return False
+
+async def _cached_chat_completion(model: str, messages: PyList[Dict[str, str]], temperature: float, response_format: Optional[Dict[str, str]] = None, bypass_cache: bool = False) -> Optional[str]:
+    """
+    Returns the completion content for these exact inputs, from the LLM cache when possible.
+    `bypass_cache` forces a fresh call (the result still refreshes the cache). JSON-mode responses are only
+    cached when they parse, so a malformed answer is never replayed.
+    """
+    cache_key = make_cache_key(model, messages, temperature, response_format)
+    if LLM_CACHE_ENABLED and not bypass_cache:
+        cached_content = await llm_cache.get(cache_key)
+        if cached_content is not None:
+            logger.debug(f"LLM cache hit for {model} ({cache_key[:12]}).")
+            return cached_content
+    elif bypass_cache:
+        llm_cache.record_bypass()
+    request_kwargs = {"model": model, "messages": messages, "temperature": temperature}
+    if response_format is not None: request_kwargs["response_format"] = response_format
+    response = await _create_chat_completion(**request_kwargs)
+    content = response.choices[0].message.content
+    if LLM_CACHE_ENABLED and content and (response_format is None or _is_json_object(content)):
+        await llm_cache.set(cache_key, model, content)
+    return content
+
+@metrics.llm_function
+async def extract_key_moments(full_transcript_text: str, whisper_segments_objects: PyList[Any], bypass_cache: bool = False) -> PyList[Dict[str, str]]:
     key_moments_final: PyList[Dict[str, str]] = []
     if not client: return [] 
     if not full_transcript_text.strip(): return []
-    print("[OpenAI_Utils] Starting key moment extraction...")
+    logger.info("Starting key moment extraction...")
     try:
         estimated_duration_minutes = 0
         if whisper_segments_objects and hasattr(whisper_segments_objects[-1], 'end'):
@@ -34,122 +180,132 @@ async def extract_key_moments(full_transcript_text: str, whisper_segments_object
         if estimated_duration_minutes > 20: num_chapters_suggestion = "7-10"
         elif estimated_duration_minutes < 5: num_chapters_suggestion = "3-5"
 
-        extraction_prompt = get_key_moments_extraction_prompt(full_transcript_text, num_chapters_suggestion)
-
         chat_model_to_use = "gpt-3.5-turbo-0125" 
-        response = await asyncio.to_thread(
-            client.chat.completions.create, model=chat_model_to_use,
-            messages=[
-                {"role": "system", "content": "You identify key moments in transcripts, returning JSON: {\"key_moments\": [{\"label\": str, \"starting_phrase\": str}]}"},
+        system_prompt = "You identify key moments in transcripts, returning JSON: {\"key_moments\": [{\"label\": str, \"starting_phrase\": str}]}"
+        extraction_prompt = fit_prompt(chat_model_to_use, lambda text: get_key_moments_extraction_prompt(text, num_chapters_suggestion), full_transcript_text, system_prompt)
+
+        raw_response_content = await _cached_chat_completion(
+            chat_model_to_use,
+            [
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": extraction_prompt}],
-            temperature=0.3, response_format={"type": "json_object"} )
+            temperature=0.3, response_format={"type": "json_object"}, bypass_cache=bypass_cache)
 
-        raw_response_content = response.choices[0].message.content
         extracted_moments_data = []
         if raw_response_content:
             try:
                 data = json.loads(raw_response_content)
                 if isinstance(data, dict) and "key_moments" in data and isinstance(data["key_moments"], list):
                     extracted_moments_data = data["key_moments"]
-            except Exception as e: print(f"[OpenAI_Utils] Error processing key moments response: {e}")
+            except Exception as e: logger.warning(f"Error processing key moments response: {e}")
         if not extracted_moments_data: 
-            print("[OpenAI_Utils] No key moments extracted by LLM or parsing failed.")
+            logger.warning("No key moments extracted by LLM or parsing failed.")
             return []
 
+        segment_index = SegmentTextIndex(whisper_segments_objects)
         last_found_timestamp_seconds = -1.0 
         for moment_info in extracted_moments_data:
             label = moment_info.get("label"); starting_phrase = moment_info.get("starting_phrase")
             if not all([label, starting_phrase, isinstance(label, str), isinstance(starting_phrase, str)]): continue
-            found_timestamp_str = "00:00:00.000"; current_best_match_start_seconds = -1.0
-            for seg_obj in whisper_segments_objects:
-                segment_text = getattr(seg_obj, 'text', ""); segment_start_seconds = getattr(seg_obj, 'start', 0.0)
-                if segment_start_seconds <= last_found_timestamp_seconds: continue
-                if starting_phrase.lower() in segment_text.lower():
-                    if current_best_match_start_seconds == -1.0 or segment_start_seconds < current_best_match_start_seconds:
-                        if not any(km['timestamp_start'] == format_timestamp(segment_start_seconds) for km in key_moments_final):
-                            current_best_match_start_seconds = segment_start_seconds
-                            found_timestamp_str = format_timestamp(segment_start_seconds)
-            if current_best_match_start_seconds > -1.0:
-                key_moments_final.append({"label": label.strip(), "timestamp_start": found_timestamp_str})
-                last_found_timestamp_seconds = current_best_match_start_seconds
+            match = segment_index.find_phrase(starting_phrase, min_start_seconds=last_found_timestamp_seconds)
+            if match is None: continue
+            segment_start_seconds = segment_index.segment_starts[match[0]]
+            key_moments_final.append({"label": label.strip(), "timestamp_start": format_timestamp(segment_start_seconds)})
+            last_found_timestamp_seconds = segment_start_seconds
         key_moments_final.sort(key=lambda x: x['timestamp_start'])
         final_unique_moments = []; seen_timestamps = set()
         for moment in key_moments_final:
             if moment['timestamp_start'] not in seen_timestamps:
                 final_unique_moments.append(moment); seen_timestamps.add(moment['timestamp_start'])
-        print(f"[OpenAI_Utils] Key moment extraction successful. Found {len(final_unique_moments)} moments.")
+        logger.info(f"Key moment extraction successful. Found {len(final_unique_moments)} moments.")
         return final_unique_moments
-    except Exception as e: print(f"[OpenAI_Utils] Error in extract_key_moments: {str(e)}"); return []
+    except Exception as e: logger.error(f"Error in extract_key_moments: {str(e)}"); return []
+
+CONDENSE_MODEL = os.getenv("CONDENSE_MODEL", "gpt-4o-mini")
+
+@metrics.llm_function
+async def summarize_transcript_section(section_text: str, section_label: str, max_words: int, bypass_cache: bool = False) -> str:
+    """Condenses one transcript section to at most `max_words` words. Cached like every chat completion, so unchanged sections are never re-summarized."""
+    content = await _cached_chat_completion(
+        CONDENSE_MODEL,
+        [
+            {"role": "system", "content": "You condense video transcripts faithfully and concisely."},
+            {"role": "user", "content": fit_prompt(CONDENSE_MODEL, lambda text: get_chunk_summary_prompt(text, section_label, max_words), section_text)}],
+        temperature=0.2, bypass_cache=bypass_cache)
+    return (content or "").strip()
 
-async def generate_mindmap_data_from_transcript(full_transcript_text: str, key_moments: PyList[Dict[str,str]]) -> str:
+@metrics.llm_function
+async def merge_section_summaries(section_summaries: str, max_words: int, bypass_cache: bool = False) -> str:
+    content = await _cached_chat_completion(
+        CONDENSE_MODEL,
+        [
+            {"role": "system", "content": "You merge summaries of consecutive video sections faithfully and concisely."},
+            {"role": "user", "content": fit_prompt(CONDENSE_MODEL, lambda text: get_digest_reduce_prompt(text, max_words), section_summaries)}],
+        temperature=0.2, bypass_cache=bypass_cache)
+    return (content or "").strip()
+
+@metrics.llm_function
+async def generate_mindmap_data_from_transcript(transcript_digest: str, key_moments: PyList[Dict[str,str]], bypass_cache: bool = False) -> str:
     if not client: return "# Mind Map Error\n- Client not initialized."
-    if not full_transcript_text.strip(): return "# Mind Map Error\n- Empty transcript."
-    print("[OpenAI_Utils] Starting mind map generation...")
+    if not transcript_digest.strip(): return "# Mind Map Error\n- Empty transcript."
+    logger.info("Starting mind map generation...")
     key_moments_summary = "\nKey moments:\n" + "\n".join([f"- {km['label']} ({km['timestamp_start']})" for km in key_moments]) if key_moments else ""
     
-    mindmap_prompt = get_mindmap_generation_prompt(full_transcript_text, key_moments_summary)
-    
-    try:
-        response = await asyncio.to_thread(
-            client.chat.completions.create, model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You generate Markdown mind maps from transcripts."},
-                {"role": "user", "content": mindmap_prompt}],
-            temperature=0.5)
-        print("[OpenAI_Utils] Mind map Markdown generated by LLM.")
-        return response.choices[0].message.content or "# Mind Map\n- No content."
-    except Exception as e: print(f"[OpenAI_Utils] Error in generate_mindmap: {str(e)}"); return f"# Mind Map Error\n- {str(e)}"
-
-async def generate_quiz_data_from_transcript(full_transcript_text: str, video_title: str) -> Dict[str, Any]:
-    if not client: return {"title": f"Quiz for {video_title}", "questions": [{"question_text": "Quiz generation failed: OpenAI client not initialized.", "question_type": "single-choice", "options": [], "explanation": ""}]}
-    if not full_transcript_text.strip(): return {"title": f"Quiz for {video_title}", "questions": [{"question_text": "Quiz generation failed: Transcript empty.", "question_type": "single-choice", "options": [], "explanation": ""}]}
-    print("[OpenAI_Utils] Starting quiz generation...")
-    
-    quiz_prompt = get_quiz_generation_prompt(full_transcript_text, video_title)
+    mindmap_prompt = fit_prompt("gpt-3.5-turbo", lambda text: get_mindmap_generation_prompt(text, key_moments_summary), transcript_digest)
     
-    try:
-        chat_model_to_use = "gpt-3.5-turbo-0125" 
-        response = await asyncio.to_thread(
-            client.chat.completions.create, model=chat_model_to_use,
-            messages=[
-                {"role": "system", "content": "You are an assistant that generates quizzes in a specific JSON format from video transcripts."},
-                {"role": "user", "content": quiz_prompt}],
-            temperature=0.4, response_format={"type": "json_object"})
-        quiz_json_str = response.choices[0].message.content
-        print("[OpenAI_Utils] Quiz JSON generated by LLM.")
-        if quiz_json_str:
-            parsed_quiz = json.loads(quiz_json_str)
-            if "title" in parsed_quiz and "questions" in parsed_quiz: return parsed_quiz
-        return {"title": f"Quiz for {video_title}", "questions": [{"question_text": "Failed to parse quiz data from LLM.", "question_type": "single-choice", "options": [], "explanation": ""}]}
-    except Exception as e:
-        print(f"[OpenAI_Utils] Error in generate_quiz: {str(e)}")
-        return {"title": f"Quiz for {video_title}", "questions": [{"question_text": f"Quiz generation error: {str(e)}", "question_type": "single-choice", "options": [], "explanation": ""}]}
+    # API errors propagate, so the mind map job is retried instead of storing an error mind map.
+    mindmap_markdown = await _cached_chat_completion(
+        "gpt-3.5-turbo",
+        [
+            {"role": "system", "content": "You generate Markdown mind maps from transcripts."},
+            {"role": "user", "content": mindmap_prompt}],
+        temperature=0.5, bypass_cache=bypass_cache)
+    logger.info("Mind map Markdown generated by LLM.")
+    return mindmap_markdown or "# Mind Map\n- No content."
+
+@metrics.llm_function
+async def generate_chapter_quiz_questions(chapter_text: str, chapter_label: str, video_title: str, question_count: int, bypass_cache: bool = False) -> PyList[Any]:
+    """
+    The raw "questions" list the model returns for one chapter; the caller validates each question.
+    Raises on API errors and on a response that is not a JSON object with a "questions" list.
+    """
+    if not client: raise RuntimeError("OpenAI client not initialized")
+    logger.debug(f"Starting quiz generation for chapter '{chapter_label}'...")
+    quiz_json_str = await _cached_chat_completion(
+        "gpt-3.5-turbo-0125",
+        [
+            {"role": "system", "content": "You are an assistant that generates quiz questions in a specific JSON format from video transcripts."},
+            {"role": "user", "content": fit_prompt("gpt-3.5-turbo-0125", lambda text: get_chapter_quiz_prompt(text, chapter_label, video_title, question_count), chapter_text)}],
+        temperature=0.4, response_format={"type": "json_object"}, bypass_cache=bypass_cache)
+    parsed = json.loads(quiz_json_str or "{}")
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("questions"), list): raise ValueError("Response has no 'questions' list")
+    return parsed["questions"]
 
-async def generate_tags_from_transcript(full_transcript_text: str) -> PyList[str]:
+@metrics.llm_function
+async def generate_tags_from_transcript(transcript_digest: str, bypass_cache: bool = False) -> PyList[str]:
     if not client:
-        print("[OpenAI_Utils] OpenAI client not initialized. Cannot generate tags.")
+        logger.warning("OpenAI client not initialized. Cannot generate tags.")
         return []
-    if not full_transcript_text.strip():
-        print("[OpenAI_Utils] Transcript text is empty. Cannot generate tags.")
+    if not transcript_digest.strip():
+        logger.info("Transcript text is empty. Cannot generate tags.")
         return []
 
-    tagging_prompt = get_tag_generation_prompt(full_transcript_text)
+    tagging_prompt = fit_prompt("gpt-3.5-turbo-0125", get_tag_generation_prompt, transcript_digest)
 
-    print("[OpenAI_Utils] Requesting tag generation from OpenAI chat model...")
+    logger.info("Requesting tag generation from OpenAI chat model...")
     try:
         chat_model_to_use = "gpt-3.5-turbo-0125" 
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model=chat_model_to_use,
-            messages=[
+        tags_json_str = await _cached_chat_completion(
+            chat_model_to_use,
+            [
                 {"role": "system", "content": "You are an assistant that suggests relevant tags (categories, keywords) for a video transcript. You return a JSON object with a 'tags' key, which is a list of strings."},
                 {"role": "user", "content": tagging_prompt}
             ],
             temperature=0.3, 
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            bypass_cache=bypass_cache
         )
-        tags_json_str = response.choices[0].message.content
-        print(f"[OpenAI_Utils] Raw tags JSON object string: {tags_json_str}")
+        logger.debug(f"Raw tags JSON object string: {tags_json_str}")
         
         extracted_tags_list = []
         if tags_json_str:
@@ -159,33 +315,93 @@ async def generate_tags_from_transcript(full_transcript_text: str) -> PyList[str
                     extracted_tags_list = [str(tag).strip() for tag in data["tags"] if isinstance(tag, str) and tag.strip()] 
                     extracted_tags_list = list(dict.fromkeys(extracted_tags_list))
             except json.JSONDecodeError as json_e:
-                print(f"[OpenAI_Utils] Error decoding JSON from tags response: {json_e}")
+                logger.warning(f"Error decoding JSON from tags response: {json_e}")
             except Exception as e:
-                print(f"[OpenAI_Utils] An unexpected error occurred while processing tags response: {e}")
+                logger.warning(f"An unexpected error occurred while processing tags response: {e}")
         
         if not extracted_tags_list:
-            print("[OpenAI_Utils] No tags were extracted or the response was not in the expected format.")
+            logger.info("No tags were extracted or the response was not in the expected format.")
             return []
         
-        print(f"[OpenAI_Utils] Tag generation successful. Found {len(extracted_tags_list)} tags: {extracted_tags_list}")
+        logger.info(f"Tag generation successful. Found {len(extracted_tags_list)} tags: {extracted_tags_list}")
         return extracted_tags_list
 
     except Exception as e:
-        print(f"[OpenAI_Utils] Error during tag generation with OpenAI: {str(e)}")
+        logger.error(f"Error during tag generation with OpenAI: {str(e)}")
         return []
     
-async def answer_question_from_transcript(full_transcript_text: str, user_question: str, chat_history: PyList[Dict[str,str]]) -> str:
-    if not client or not full_transcript_text.strip(): return "Error: Cannot answer question as the video transcript is empty."
-    print(f"[OpenAI_Utils] Answering question: '{user_question}'")
-    prompt = get_chat_prompt(full_transcript_text, user_question)
+CHAT_MODEL = "gpt-4o-mini"
+
+def _build_chat_messages(transcript_context: str, user_question: str, chat_history: PyList[Dict[str,str]]) -> PyList[Dict[str, str]]:
+    prompt = fit_prompt(CHAT_MODEL, lambda text: get_chat_prompt(text, user_question), transcript_context)
     messages_for_api = []
     # for message in chat_history:
     #     messages_for_api.append({"role": message["role"], "content": message["content"]})
     messages_for_api.append({"role": "user", "content": prompt})
+    return messages_for_api
+
+@metrics.llm_function
+async def answer_question_from_transcript(transcript_context: str, user_question: str, chat_history: PyList[Dict[str,str]]) -> str:
+    if not client or not transcript_context.strip(): return "Error: Cannot answer question as the video transcript is empty."
+    logger.info(f"Answering question: '{user_question}'")
+    messages_for_api = _build_chat_messages(transcript_context, user_question, chat_history)
     try:
-        response = await asyncio.to_thread(client.chat.completions.create, model="gpt-4o-mini", messages=messages_for_api, temperature=0.2)
+        response = await _create_chat_completion(model=CHAT_MODEL, messages=messages_for_api, temperature=0.2)
         answer = response.choices[0].message.content
         return answer or "I'm sorry, I could not generate a response."
     except Exception as e:
-        print(f"[OpenAI_Utils] Error during chat completion: {e}")
-        return "An error occurred while answering the question."
\ No newline at end of file
+        logger.error(f"Error during chat completion: {e}")
+        return "An error occurred while answering the question."
+
+async def stream_answer_question_from_transcript(transcript_context: str, user_question: str, chat_history: PyList[Dict[str,str]]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of answer_question_from_transcript. Yields ("token", {"text"}) events as the model produces
+    them and a final ("done", usage) or ("error", {"message"}) event. Closing the generator (e.g. when the client
+    disconnects) closes the upstream HTTP stream, so no tokens are generated for nobody.
+    """
+    if not client or not transcript_context.strip():
+        yield "error", {"message": "Error: Cannot answer question as the video transcript is empty."}; return
+    logger.info(f"Streaming answer to question: '{user_question}'")
+    messages_for_api = _build_chat_messages(transcript_context, user_question, chat_history)
+    prompt_tokens = count_message_tokens(messages_for_api, CHAT_MODEL)
+    estimated_tokens = prompt_tokens + OPENAI_COMPLETION_TOKENS_ESTIMATE
+    started_at = time.perf_counter(); first_token_at = None; usage = None
+    try:
+        await token_budget.check_token_ceiling()
+        stream = await _call_with_retries(
+            lambda: client.chat.completions.create(model=CHAT_MODEL, messages=messages_for_api, temperature=0.2, stream=True, stream_options={"include_usage": True}),
+            chat_rate_limiter, estimated_tokens, f"Chat completion stream ({CHAT_MODEL})")
+    except Exception as e:
+        logger.error(f"Error opening chat completion stream: {e}")
+        yield "error", {"message": "An error occurred while answering the question."}; return
+    outcome = "error"; streamed_text = []
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None: usage = chunk.usage
+            if not chunk.choices: continue
+            text = chunk.choices[0].delta.content
+            if text:
+                if first_token_at is None: first_token_at = time.perf_counter()
+                streamed_text.append(text)
+                yield "token", {"text": text}
+        outcome = "ok"
+    except Exception as e:
+        logger.error(f"Error during chat completion stream: {e}")
+        yield "error", {"message": "An error occurred while answering the question."}; return
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = "cancelled"; raise
+    finally:
+        # Also runs when the client disconnects mid-answer: the tokens were generated and billed all the same.
+        # Without a usage chunk the prompt is taken as estimated and the completion as the text streamed so far.
+        prompt_used = getattr(usage, "prompt_tokens", None) or prompt_tokens
+        completion_used = getattr(usage, "completion_tokens", None) or token_budget.count_tokens("".join(streamed_text), CHAT_MODEL)
+        chat_rate_limiter.record_actual_tokens(estimated_tokens, getattr(usage, "total_tokens", None) or prompt_used + completion_used)
+        metrics.LLM_FUNCTION_DURATION.labels("stream_answer_question_from_transcript", outcome).observe(time.perf_counter() - started_at)
+        try: await stream.close()
+        finally: await asyncio.shield(token_budget.record_usage("chat", CHAT_MODEL, prompt_used, completion_used, int((time.perf_counter() - started_at) * 1000)))
+    yield "done", {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None), "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+        "time_to_first_token_ms": int((first_token_at - started_at) * 1000) if first_token_at else None,
+        "duration_ms": int((time.perf_counter() - started_at) * 1000),
+    }
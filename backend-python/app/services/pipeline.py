@@ -0,0 +1,121 @@
+import time
+import asyncio
+from typing import Optional, List as PyList, Any, Dict, Callable, Awaitable, Iterable
+
+StageRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+StagePersister = Callable[[Dict[str, Any], Dict[str, Any]], Any]
+
+class Stage:
+    """
+    One named step of a pipeline. `run(context)` receives the shared context (all outputs produced so far plus the
+    initial inputs) and returns a dict containing every name in `outputs`. `persist(context, outputs)`, when given,
+    is called as soon as the stage finishes so its results are saved without waiting for the rest of the graph.
+    A failing `critical` stage aborts the whole run; any other failure only skips the stages that depend on it.
+    """
+    def __init__(self, name: str, run: StageRunner, inputs: Iterable[str] = (), outputs: Iterable[str] = (), persist: Optional[StagePersister] = None,
+                 critical: bool = False):
+        self.name = name; self.run = run; self.persist = persist; self.critical = critical
+        self.inputs = tuple(inputs); self.outputs = tuple(outputs)
+
+class StageFailed(Exception):
+    def __init__(self, stage_name: str, error: BaseException):
+        super().__init__(f"Stage '{stage_name}' failed: {error}")
+        self.stage_name = stage_name; self.error = error
+
+class Pipeline:
+    """
+    A DAG of stages wired by their declared inputs and outputs. Every stage whose inputs are available is started
+    immediately, so independent stages run concurrently. A failing critical stage cancels the ones still running
+    and is raised as StageFailed. A failing non-critical stage (its run or its persist) is reported as 'failed' and
+    every stage that needs one of its outputs, directly or not, as 'skipped'; the rest of the graph still finishes.
+    """
+    def __init__(self, stages: PyList[Stage], initial_inputs: Iterable[str] = ()):
+        self.stages = list(stages)
+        producers: Dict[str, str] = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in producers: raise ValueError(f"Output '{output}' produced by both '{producers[output]}' and '{stage.name}'")
+                producers[output] = stage.name
+        available = set(initial_inputs) | set(producers)
+        for stage in self.stages:
+            missing = [name for name in stage.inputs if name not in available]
+            if missing: raise ValueError(f"Stage '{stage.name}' needs {missing}, which no stage produces")
+        self._check_acyclic(producers)
+
+    def _check_acyclic(self, producers: Dict[str, str]) -> None:
+        depends_on = {stage.name: {producers[name] for name in stage.inputs if name in producers} for stage in self.stages}
+        visiting, done = set(), set()
+        def visit(name: str):
+            if name in done: return
+            if name in visiting: raise ValueError(f"Pipeline has a cycle through stage '{name}'")
+            visiting.add(name)
+            for dependency in depends_on[name]: visit(dependency)
+            visiting.discard(name); done.add(name)
+        for stage in self.stages: visit(stage.name)
+
+    async def run(self, context: Dict[str, Any], on_stage_finished: Optional[Callable[[str, str, float, Optional[str]], Any]] = None,
+                  on_stage_started: Optional[Callable[[str], Any]] = None) -> Dict[str, float]:
+        """
+        Runs the graph over `context` (updated in place with stage outputs) and returns per-stage durations in
+        seconds. `on_stage_started(stage_name)` is called for every started stage and `on_stage_finished(stage_name,
+        status, duration_seconds, error)` for every stage, with status 'succeeded', 'failed' or 'skipped' (both
+        awaited when they are coroutine functions).
+        """
+        pending = {stage.name: stage for stage in self.stages}
+        running: Dict[asyncio.Task, tuple] = {}
+        timings: Dict[str, float] = {}
+        lost_outputs: Dict[str, str] = {} # output name -> the failed or skipped stage that would have produced it
+
+        async def fail(stage: Stage, duration: float, error: BaseException, message: str):
+            if on_stage_finished: await _maybe_await(on_stage_finished(stage.name, "failed", duration, message))
+            if stage.critical: raise StageFailed(stage.name, error)
+            lost_outputs.update({name: stage.name for name in stage.outputs})
+
+        try:
+            while pending or running:
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for name, stage in list(pending.items()):
+                        lost = [input_name for input_name in stage.inputs if input_name in lost_outputs]
+                        if not lost: continue
+                        del pending[name]; skipped = True
+                        lost_outputs.update({output: name for output in stage.outputs})
+                        if on_stage_finished: await _maybe_await(on_stage_finished(name, "skipped", 0.0, f"needs '{lost[0]}' from stage '{lost_outputs[lost[0]]}'"))
+                for name, stage in list(pending.items()):
+                    if all(input_name in context for input_name in stage.inputs):
+                        del pending[name]
+                        if on_stage_started: await _maybe_await(on_stage_started(name))
+                        running[asyncio.create_task(stage.run(context))] = (stage, time.perf_counter())
+                if not running:
+                    if not pending: break
+                    raise RuntimeError(f"Pipeline stalled, stages never became ready: {sorted(pending)}")
+                finished, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    stage, started_at = running.pop(task)
+                    duration = time.perf_counter() - started_at
+                    timings[stage.name] = duration
+                    error = task.exception()
+                    if error is None:
+                        outputs = task.result() or {}
+                        missing = [name for name in stage.outputs if name not in outputs]
+                        if missing: error = RuntimeError(f"did not return {missing}")
+                    if error is not None:
+                        await fail(stage, duration, error, str(error)); continue
+                    context.update({name: outputs[name] for name in stage.outputs})
+                    if stage.persist:
+                        try: await _maybe_await(stage.persist(context, outputs))
+                        except Exception as persist_error:
+                            # Unsaved outputs are withdrawn so nothing downstream builds on them.
+                            for name in stage.outputs: context.pop(name, None)
+                            await fail(stage, duration, persist_error, f"persist: {persist_error}"); continue
+                    if on_stage_finished: await _maybe_await(on_stage_finished(stage.name, "succeeded", duration, None))
+        finally:
+            for task in running:
+                task.cancel()
+            if running: await asyncio.gather(*running.keys(), return_exceptions=True)
+        return timings
+
+async def _maybe_await(value):
+    if asyncio.iscoroutine(value): return await value
+    return value
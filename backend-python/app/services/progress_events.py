@@ -0,0 +1,129 @@
+import logging
+import os
+import json
+import time
+import asyncio
+import asyncpg
+from sqlalchemy import select, func, column, Text, values as values_table
+from ..database import engine
+from typing import Optional, List as PyList, Any, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL = os.getenv("PROGRESS_CHANNEL", "video_progress")
+# Percent steps between two ffmpeg progress events for the same video.
+PROGRESS_PERCENT_STEP = int(os.getenv("PROGRESS_PERCENT_STEP", "5"))
+PROGRESS_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("PROGRESS_SUBSCRIBER_QUEUE_SIZE", "100"))
+PROGRESS_RECONNECT_SECONDS = float(os.getenv("PROGRESS_RECONNECT_SECONDS", "2"))
+PROGRESS_LISTEN_READY_TIMEOUT_SECONDS = float(os.getenv("PROGRESS_LISTEN_READY_TIMEOUT_SECONDS", "5"))
+
+def _payload(video_id: int, event: str, data: Dict[str, Any]) -> str:
+    return json.dumps({"video_id": video_id, "event": event, "ts": time.time(), **data})
+
+def notify_statement(events: PyList[Dict[str, Any]]):
+    """
+    One SELECT pg_notify(...) for any number of {"video_id", "event", ...} events. Executed inside a session's
+    transaction, the notifications are delivered only if (and when) that transaction commits.
+    """
+    payloads = values_table(column("payload", Text), name="progress_events").data(
+        [(_payload(event["video_id"], event["event"], {k: v for k, v in event.items() if k not in ("video_id", "event")}),) for event in events])
+    return select(func.pg_notify(PROGRESS_CHANNEL, payloads.c.payload)).select_from(payloads)
+
+async def publish(video_id: int, event: str, **data) -> None:
+    """Sends one progress event right away on its own connection. Best effort: failures are logged, never raised."""
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(select(func.pg_notify(PROGRESS_CHANNEL, _payload(video_id, event, data))))
+            await connection.commit()
+    except Exception as e: logger.warning(f"Video ID {video_id}: Could not publish '{event}' event: {e}")
+
+class PercentReporter:
+    """Publishes `progress` events for one stage, at most one per PROGRESS_PERCENT_STEP percent."""
+    def __init__(self, video_id: int, stage: str):
+        self.video_id = video_id; self.stage = stage
+        self._last_percent = -PROGRESS_PERCENT_STEP
+
+    async def report(self, percent: float, **data) -> None:
+        percent = max(0, min(100, int(percent)))
+        if percent <= self._last_percent or (percent < 100 and percent < self._last_percent + PROGRESS_PERCENT_STEP): return
+        self._last_percent = percent
+        await publish(self.video_id, "progress", stage=self.stage, percent=percent, **data)
+
+class ProgressBroker:
+    """
+    Per-process fan-out of progress notifications. One dedicated asyncpg connection LISTENs on PROGRESS_CHANNEL
+    (started by the first subscriber) and each notification is copied into the queues of that video's subscribers,
+    so every API process serves events published by any worker. After a lost connection it reconnects and sends
+    a `resync` event, since notifications sent in between are gone.
+    """
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None # created lazily so it binds to the running loop
+        self._connection: Optional[asyncpg.Connection] = None
+
+    def _dsn(self) -> str:
+        return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try: event = json.loads(payload)
+        except ValueError: return
+        for queue in self._subscribers.get(event.get("video_id"), ()):
+            _offer(queue, event)
+
+    async def _listen(self) -> None:
+        reconnecting = False
+        while True:
+            try:
+                self._connection = await asyncpg.connect(self._dsn())
+                closed = asyncio.Event()
+                self._connection.add_termination_listener(lambda connection: closed.set())
+                await self._connection.add_listener(PROGRESS_CHANNEL, self._on_notification)
+                self._ready.set()
+                logger.info(f"Listening on channel '{PROGRESS_CHANNEL}'.")
+                if reconnecting:
+                    for video_id, queues in self._subscribers.items():
+                        for queue in queues: _offer(queue, {"video_id": video_id, "event": "resync", "ts": time.time()})
+                await closed.wait()
+                logger.warning("Listener connection lost, reconnecting.")
+            except asyncio.CancelledError: raise
+            except Exception as e: logger.warning(f"Listener connection failed: {e}")
+            self._ready.clear(); reconnecting = True
+            await asyncio.sleep(PROGRESS_RECONNECT_SECONDS)
+
+    async def subscribe(self, video_id: int) -> asyncio.Queue:
+        """Returns a queue receiving the video's events; waits (briefly) until the listener is connected."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=PROGRESS_SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(video_id, set()).add(queue)
+        if self._ready is None: self._ready = asyncio.Event()
+        if self._task is None or self._task.done(): self._task = asyncio.create_task(self._listen())
+        try: await asyncio.wait_for(self._ready.wait(), timeout=PROGRESS_LISTEN_READY_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError: logger.warning(f"Video ID {video_id}: Listener not ready, events may be delayed.")
+        return queue
+
+    def unsubscribe(self, video_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(video_id)
+        if queues is None: return
+        queues.discard(queue)
+        if not queues: del self._subscribers[video_id]
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"listening": bool(self._ready and self._ready.is_set()), "videos": len(self._subscribers),
+                "subscribers": sum(len(queues) for queues in self._subscribers.values())}
+
+def _offer(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+    """Queues the event, dropping the subscriber's oldest one when it is not keeping up."""
+    if queue.full():
+        try: queue.get_nowait()
+        except asyncio.QueueEmpty: pass
+    queue.put_nowait(event)
+
+progress_broker = ProgressBroker()
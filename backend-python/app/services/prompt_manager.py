@@ -26,51 +26,55 @@ def get_key_moments_extraction_prompt(full_transcript_text: str, num_chapters_su
     {full_transcript_text}
     """
 
-def get_mindmap_generation_prompt(full_transcript_text: str, key_moments_summary: str) -> str:
+def get_mindmap_generation_prompt(transcript_digest: str, key_moments_summary: str) -> str:
     """
-    Returns the prompt for generating a mind map from a transcript and key moments.
+    Returns the prompt for generating a mind map from a transcript digest and key moments.
     """
     return f"""
     Based on the following video transcript and its key moments, generate a hierarchical mind map in Markdown format.
     The mind map should represent the main ideas, sub-topics, and their relationships.
     Use Markdown headings for the main branches (e.g., # Main Idea) and nested lists for sub-topics.
     Aim for 2-4 levels of depth. Ensure the structure is clear and logical.
+    For long videos the transcript is given as a condensed digest, one timestamped section per chapter; cover every section.
     
     {key_moments_summary}
 
-    Full Transcript:
-    {full_transcript_text[:15000]} 
-    """ # Limiting transcript length for token limits
+    Transcript:
+    {transcript_digest} 
+    """
 
-def get_quiz_generation_prompt(full_transcript_text: str, video_title: str) -> str:
+def get_chapter_quiz_prompt(chapter_text: str, chapter_label: str, video_title: str, question_count: int) -> str:
     """
-    Returns the prompt for generating a quiz from a transcript.
+    Returns the prompt for generating the quiz questions of one chapter of a video.
     """
     return f"""
-    Based on the following video transcript, generate a quiz with 15-20 questions to test understanding of the content.
+    Based on the following chapter of a video transcript, generate {question_count} quiz questions that test understanding of this chapter's content.
     Include a mix of single-choice and multiple-choice questions.
     For each question, provide:
     - "question_text": The question itself.
     - "question_type": Either "single-choice" or "multiple-choice".
-    - "options": A list of option objects, each with "text" and "is_correct" (boolean). For single-choice, only one option should be correct.
+    - "options": A list of 3-5 option objects, each with "text" and "is_correct" (boolean). For single-choice, exactly one option must be correct; for multiple-choice, at least one.
     - "explanation": (Optional) A brief explanation for the correct answer.
 
-    Return the result *only* as a JSON object with a "title" (e.g., "Quiz for: [Video Title]") and a "questions" key, where "questions" is a list of question objects as described above.
-    Example of the "questions" list structure:
-    [
-      {{"question_text": "Q1?", "question_type": "single-choice", "options": [{{"text": "A", "is_correct": false}}, {{"text": "B", "is_correct": true}}], "explanation": "B is correct because..."}},
-      {{"question_text": "Q2? (Select all)", "question_type": "multiple-choice", "options": [{{"text": "X", "is_correct": true}}, {{"text": "Y", "is_correct": false}}, {{"text": "Z", "is_correct": true}}], "explanation": "X and Z..."}}
-    ]
-    If the transcript is too short or unsuitable for 15-20 questions, generate as many good questions as possible.
+    Return the result *only* as a JSON object with a single key "questions", a list of question objects as described above.
+    Example:
+    {{
+      "questions": [
+        {{"question_text": "Q1?", "question_type": "single-choice", "options": [{{"text": "A", "is_correct": false}}, {{"text": "B", "is_correct": true}}], "explanation": "B is correct because..."}},
+        {{"question_text": "Q2? (Select all)", "question_type": "multiple-choice", "options": [{{"text": "X", "is_correct": true}}, {{"text": "Y", "is_correct": false}}, {{"text": "Z", "is_correct": true}}], "explanation": "X and Z..."}}
+      ]
+    }}
+    If the chapter is too short for {question_count} good questions, generate fewer.
 
     Video Title: {video_title}
+    Chapter: {chapter_label}
     Transcript:
-    {full_transcript_text[:15000]} 
+    {chapter_text}
     """
 
-def get_tag_generation_prompt(full_transcript_text: str) -> str:
+def get_tag_generation_prompt(transcript_digest: str) -> str:
     """
-    Returns the prompt for generating tags from a transcript.
+    Returns the prompt for generating tags from a transcript digest.
     """
     return f"""
     Based on the following video transcript, suggest 5-10 relevant tags or categories.
@@ -81,21 +85,49 @@ def get_tag_generation_prompt(full_transcript_text: str) -> str:
     If no relevant tags can be found, return an empty list for the "tags" key: {{"tags": []}}
 
     Transcript:
-    {full_transcript_text[:10000]} 
+    {transcript_digest} 
+    """
+
+def get_chunk_summary_prompt(section_text: str, section_label: str, max_words: int) -> str:
+    """
+    Returns the prompt for condensing one chapter of a long transcript (the map step of condensation).
+    """
+    return f"""
+    Condense the following section of a video transcript into at most {max_words} words.
+    Keep every distinct topic, definition, example, number and conclusion; drop filler, repetition and small talk.
+    Write plain sentences in the speaker's terms, without an introduction like "In this section".
+
+    Section: {section_label}
+    Transcript section:
+    {section_text}
+    """
+
+def get_digest_reduce_prompt(section_summaries: str, max_words: int) -> str:
+    """
+    Returns the prompt for merging consecutive section summaries into one (the reduce step of condensation).
+    """
+    return f"""
+    The following are consecutive, timestamped summaries of parts of one video.
+    Merge them into a single summary of at most {max_words} words that keeps every distinct topic in order.
+    Do not add information that is not in the summaries.
+
+    Summaries:
+    {section_summaries}
     """
 
 def get_chat_prompt(transcript_context: str, user_question: str) -> str:
     """
-    Returns the prompt for answering a user's question based on a transcript.
+    Returns the prompt for answering a user's question based on timestamped transcript excerpts.
     """
     return f"""
-    You are a helpful assistant who answers questions based *only* on the provided video transcript.
-    The user is asking a question about the video. Use the following transcript to answer it.
-    If the answer cannot be found in the transcript, respond with "I'm sorry, I cannot answer that question based on the provided transcript."
+    You are a helpful assistant who answers questions based *only* on the provided video transcript excerpts.
+    The user is asking a question about the video. Each excerpt starts with its [HH:MM:SS] position in the video.
+    Cite the timestamps of the excerpts you used in your answer, e.g. "... as explained at [00:12:05]".
+    If the answer cannot be found in the excerpts, respond with "I'm sorry, I cannot answer that question based on the provided transcript."
     Do not use any outside knowledge.
 
     ---
-    TRANSCRIPT CONTEXT:
+    TRANSCRIPT EXCERPTS:
     {transcript_context}
     ---
 
@@ -1,47 +1,153 @@
+import logging
 import os
 import json
 import asyncio
-from .. import crud
-from ..database import SessionLocal
-from .openai_utils import generate_quiz_data_from_transcript 
-from typing import Optional, List as PyList, Any, Dict
+import hashlib
+from pydantic import ValidationError
+from .. import crud, schemas
+from . import progress_events, condensation
+from .openai_utils import generate_chapter_quiz_questions
+from typing import Optional, List as PyList, Any, Dict, Tuple
 
+logger = logging.getLogger(__name__)
 
-async def process_quiz_generation(video_id: int, video_title: str, db_session_factory):
-    db = db_session_factory()
-    print(f"[QuizService] Video ID {video_id}: Starting quiz generation process for '{video_title}'.")
-    default_error_quiz = {"title": f"Quiz for {video_title}", "questions": [{"question_text": "Quiz generation error.", "question_type": "single-choice", "options": [], "explanation": ""}]}
+# Questions for the whole video, spread over its chapters within the per-chapter bounds.
+QUIZ_TARGET_QUESTIONS = int(os.getenv("QUIZ_TARGET_QUESTIONS", "18"))
+QUIZ_MIN_QUESTIONS_PER_CHAPTER = int(os.getenv("QUIZ_MIN_QUESTIONS_PER_CHAPTER", "2"))
+QUIZ_MAX_QUESTIONS_PER_CHAPTER = int(os.getenv("QUIZ_MAX_QUESTIONS_PER_CHAPTER", "6"))
+QUIZ_CHAPTER_CONCURRENCY = int(os.getenv("QUIZ_CHAPTER_CONCURRENCY", "4"))
+# Attempts per chapter; retries bypass the LLM cache so a bad cached response is replaced.
+QUIZ_CHAPTER_ATTEMPTS = int(os.getenv("QUIZ_CHAPTER_ATTEMPTS", "2"))
+
+def _error_quiz(video_title: str, message: str) -> Dict[str, Any]:
+    return {"title": f"Quiz for {video_title}", "questions": [{"question_text": message, "question_type": "single-choice", "options": [], "explanation": ""}]}
+
+def plan_chapters(segments: PyList[Dict[str, Any]], key_moments: PyList[Dict[str, Any]]) -> PyList[Dict[str, Any]]:
+    """
+    Splits transcript segments ({"start", "end", "text"}) at key moments ({"label", "start"}, seconds) into
+    chapters {"position", "label", "start_seconds", "segments"}; without key moments the whole video is one chapter.
+    Text before the first key moment belongs to the first chapter; chapters without text are left out.
+    """
+    moments = sorted((float(moment["start"]), moment["label"]) for moment in key_moments if moment.get("label")) or [(0.0, "Full video")]
+    grouped: PyList[PyList[Dict[str, Any]]] = [[] for _ in moments]
+    index = 0
+    for segment in segments:
+        while index + 1 < len(moments) and moments[index + 1][0] <= float(segment["start"]): index += 1
+        if (segment.get("text") or "").strip(): grouped[index].append(segment)
+    chapters = [(start, label, chapter_segments) for (start, label), chapter_segments in zip(moments, grouped) if chapter_segments]
+    return [{"position": position, "label": label, "start_seconds": start, "segments": chapter_segments} for position, (start, label, chapter_segments) in enumerate(chapters)]
+
+def questions_per_chapter(chapter_count: int) -> int:
+    return max(QUIZ_MIN_QUESTIONS_PER_CHAPTER, min(QUIZ_MAX_QUESTIONS_PER_CHAPTER, round(QUIZ_TARGET_QUESTIONS / max(1, chapter_count))))
+
+def chapter_content_hash(chapter: Dict[str, Any]) -> str:
+    text = " ".join(segment["text"].strip() for segment in chapter["segments"])
+    return hashlib.sha256(json.dumps([chapter["label"], text]).encode("utf-8")).hexdigest()
+
+def validate_questions(raw_questions: PyList[Any]) -> Tuple[PyList[Dict[str, Any]], int]:
+    """Questions that parse as schemas.QuizQuestion and have a sensible set of correct options; returns (valid, rejected count)."""
+    valid = []
+    for raw in raw_questions:
+        try: question = schemas.QuizQuestion.model_validate(raw)
+        except ValidationError: continue
+        correct = sum(1 for option in question.options if option.is_correct)
+        if len(question.options) < 2 or correct == 0 or (question.question_type == "single-choice" and correct != 1): continue
+        valid.append(question.model_dump())
+    return valid, len(raw_questions) - len(valid)
+
+async def generate_chapter(chapter: Dict[str, Any], video_title: str, question_count: int, bypass_cache: bool = False) -> Dict[str, Any]:
+    """
+    Generates and validates one chapter's questions. Never raises: a chapter that still has no valid question
+    after QUIZ_CHAPTER_ATTEMPTS comes back with status 'failed' and the last error.
+    """
+    row = {"position": chapter["position"], "label": chapter["label"], "start_seconds": chapter["start_seconds"],
+           "content_hash": chapter_content_hash(chapter), "status": "failed", "questions": [], "error": None}
     try:
-        video = crud.get_video(db, video_id=video_id)
-        if not video: 
-            print(f"[QuizService] Video ID {video_id}: Not found."); return
-        if not video.transcript:
-            print(f"[QuizService] Video ID {video_id}: No transcript available.")
-            crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(default_error_quiz), status="completed")
-            return
-        
+        # Long chapters are condensed like whole transcripts are for the mind map.
+        chapter_text, _ = await condensation.condense_transcript(chapter["segments"], [])
+    except Exception as e:
+        row["error"] = f"Could not prepare chapter text: {e}"; return row
+    for attempt in range(max(1, QUIZ_CHAPTER_ATTEMPTS)):
         try:
-            transcript_data = json.loads(video.transcript)
-            full_text = " ".join([seg['text'] for seg in transcript_data.get("segments", []) if seg.get('text')])
-        except json.JSONDecodeError:
-            print(f"[QuizService] Video ID {video_id}: Could not parse transcript.")
-            crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(default_error_quiz), status="completed")
+            raw_questions = await generate_chapter_quiz_questions(chapter_text, chapter["label"], video_title, question_count, bypass_cache=bypass_cache or attempt > 0)
+            questions, rejected = validate_questions(raw_questions)
+            if rejected: logger.warning(f"Chapter '{chapter['label']}': Dropped {rejected} invalid question(s).")
+            if questions:
+                row.update(status="succeeded", questions=questions, error=None); return row
+            row["error"] = "No valid questions in the response."
+        except Exception as e: row["error"] = str(e)
+        logger.warning(f"Chapter '{chapter['label']}': Attempt {attempt + 1} failed: {row['error']}")
+    return row
+
+async def generate_chapters(chapters: PyList[Dict[str, Any]], video_title: str, question_count: int, bypass_cache: bool = False) -> PyList[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(max(1, QUIZ_CHAPTER_CONCURRENCY))
+    async def limited(chapter):
+        async with semaphore: return await generate_chapter(chapter, video_title, question_count, bypass_cache=bypass_cache)
+    return await asyncio.gather(*[limited(chapter) for chapter in chapters])
+
+def merge_quiz(video_title: str, chapter_rows: PyList[Any]) -> Dict[str, Any]:
+    """The Quiz stored in videos.quiz_data: every succeeded chapter's questions in chapter order; failed chapters are skipped."""
+    def field(row, name): return row[name] if isinstance(row, dict) else getattr(row, name)
+    rows = sorted(chapter_rows, key=lambda row: field(row, "position"))
+    questions = [question for row in rows if field(row, "status") == "succeeded" for question in field(row, "questions")]
+    if not questions: return _error_quiz(video_title, "Quiz generation failed for every chapter.")
+    return {"title": f"Quiz for: {video_title}", "questions": questions}
+
+async def process_quiz_generation(video_id: int, video_title: str, db_session_factory, bypass_cache: bool = False, chapters: Optional[PyList[int]] = None,
+                                  final_attempt: bool = True):
+    """
+    Builds the quiz chapter by chapter. Chapters already generated from the same text are kept, so only new,
+    changed or failed chapters are generated; `chapters` regenerates exactly those positions instead, and
+    `bypass_cache` regenerates everything. Errors, and a run in which every chapter failed, are raised so the
+    job queue retries; failed chapters and the error quiz are only written on the `final_attempt`.
+    """
+    db = db_session_factory()
+    logger.info(f"Video ID {video_id}: Starting quiz generation process for '{video_title}'.")
+    had_quiz = False
+    try:
+        video = await crud.get_video(db, video_id=video_id)
+        if not video:
+            logger.info(f"Video ID {video_id}: Not found."); return
+        had_quiz = bool(video.quiz_data)
+        if video.transcript_segment_count is None:
+            logger.info(f"Video ID {video_id}: No transcript available.")
+            await crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(_error_quiz(video_title, "Quiz generation error.")), status="completed")
             return
 
-        if not full_text.strip():
-            print(f"[QuizService] Video ID {video_id}: Transcript text empty.")
-            crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(default_error_quiz), status="completed")
+        segments = [{"start": segment.start_seconds, "end": segment.end_seconds, "text": segment.text} for segment in await crud.get_transcript_segments(db, video_id=video_id)]
+        key_moments = [{"label": moment.label, "start": moment.start_seconds} for moment in await crud.get_key_moments(db, video_id=video_id)]
+        planned = plan_chapters(segments, key_moments)
+        if not planned:
+            logger.info(f"Video ID {video_id}: Transcript text empty.")
+            await crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(_error_quiz(video_title, "Quiz generation error.")), status="completed")
             return
 
-        quiz_json_data = await generate_quiz_data_from_transcript(full_text, video_title)
-        print(f"[QuizService] Video ID {video_id}: Quiz generated, updating status to 'completed'.")
-        crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(quiz_json_data), status="completed")
-        print(f"[QuizService] Video ID {video_id}: Quiz saved.")
+        stored = {chapter.position: chapter for chapter in await crud.get_quiz_chapters(db, video_id=video_id)}
+        if chapters is not None: to_generate = [chapter for chapter in planned if chapter["position"] in set(chapters)]
+        else: to_generate = [chapter for chapter in planned if bypass_cache or chapter["position"] not in stored
+                             or stored[chapter["position"]].status != "succeeded" or stored[chapter["position"]].content_hash != chapter_content_hash(chapter)]
+        logger.info(f"Video ID {video_id}: Generating {len(to_generate)} of {len(planned)} chapter(s).")
+
+        await progress_events.publish(video_id, "stage", stage="quiz", status="started")
+        generated = await generate_chapters(to_generate, video_title, questions_per_chapter(len(planned)), bypass_cache=bypass_cache or chapters is not None)
+        failed = [row["label"] for row in generated if row["status"] == "failed"]
+        if generated and len(failed) == len(generated) and not final_attempt:
+            raise RuntimeError(f"All {len(failed)} chapter(s) failed, last error: {generated[-1]['error']}")
+        if failed: logger.warning(f"Video ID {video_id}: {len(failed)} chapter(s) failed and are left out of the quiz: {failed}")
+        await crud.save_quiz_chapters(db, video_id=video_id, chapters=generated, chapter_count=len(planned))
+        quiz_json_data = merge_quiz(video_title, await crud.get_quiz_chapters(db, video_id=video_id))
+        logger.info(f"Video ID {video_id}: Quiz generated, updating status to 'completed'.")
+        await crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(quiz_json_data), status="completed")
+        logger.info(f"Video ID {video_id}: Quiz saved.")
 
     except Exception as e:
-        print(f"[QuizService] Video ID {video_id}: Error in process_quiz_generation: {str(e)}")
-        default_error_quiz["questions"][0]["question_text"] = f"Quiz generation error: {str(e)}"
-        crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(default_error_quiz), status="completed")
+        logger.error(f"Video ID {video_id}: Error in process_quiz_generation: {str(e)}")
+        await db.rollback()
+        # An existing quiz stays in place; only a video without one gets the error quiz.
+        if final_attempt:
+            await crud.update_video_data(db=db, video_id=video_id, status="completed",
+                                         quiz_data=None if had_quiz else json.dumps(_error_quiz(video_title, f"Quiz generation error: {str(e)}")))
+        raise
     finally:
-        print(f"[QuizService] Video ID {video_id}: Quiz task finished, closing DB session.")
-        db.close()
\ No newline at end of file
+        logger.debug(f"Video ID {video_id}: Quiz task finished, closing DB session.")
+        await db.close()
@@ -0,0 +1,60 @@
+import time
+import asyncio
+from typing import Optional
+
+class TokenBucket:
+    """
+    Async token bucket holding up to `capacity` tokens, refilled continuously at `capacity / period_seconds`.
+    Waiters are served in arrival order. `adjust` lets callers correct an estimate after the fact; the balance
+    may go negative, which simply delays the next acquirers.
+    """
+    def __init__(self, capacity: float, period_seconds: float = 60.0):
+        self.capacity = float(capacity)
+        self.refill_per_second = self.capacity / period_seconds
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None # created lazily so it binds to the running loop
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Waits until `amount` tokens are available and takes them. Returns the seconds spent waiting."""
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        if self._lock is None: self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.refill_per_second
+                await asyncio.sleep(delay); waited += delay
+
+    def adjust(self, delta: float) -> None:
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - delta)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+class RequestRateLimiter:
+    """Requests-per-minute and (optionally) tokens-per-minute limits applied together."""
+    def __init__(self, requests_per_minute: int, tokens_per_minute: Optional[int] = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, estimated_tokens: int = 0) -> float:
+        waited = await self.requests.acquire(1)
+        if self.tokens is not None and estimated_tokens > 0:
+            waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def record_actual_tokens(self, estimated_tokens: int, actual_tokens: int) -> None:
+        if self.tokens is not None and actual_tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
@@ -0,0 +1,154 @@
+import logging
+import io
+import os
+import json
+import asyncio
+import numpy as np
+from .alignment import normalize_tokens
+from .utils import format_timestamp
+from .openai_utils import embed_texts
+from typing import Optional, List as PyList, Any, Dict
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CHUNK_SECONDS = float(os.getenv("RETRIEVAL_CHUNK_SECONDS", "45"))
+RETRIEVAL_CHUNK_MAX_CHARS = int(os.getenv("RETRIEVAL_CHUNK_MAX_CHARS", "1200"))
+RETRIEVAL_EMBEDDINGS_ENABLED = os.getenv("RETRIEVAL_EMBEDDINGS_ENABLED", "false").lower() == "true"
+# Weight of the embedding similarity when both signals are available; BM25 gets the rest.
+RETRIEVAL_EMBEDDING_WEIGHT = float(os.getenv("RETRIEVAL_EMBEDDING_WEIGHT", "0.5"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_STOPWORDS = frozenset("""a an and are as at be but by can do does for from had has have he her his how i if in into is it its
+me my no not of on or our she so than that the their them then there these they this to was we were what when where which
+who why will with would you your""".split())
+
+def _terms(text: str) -> PyList[str]:
+    return [token for token in normalize_tokens(text) if token not in _STOPWORDS]
+
+def chunk_segments(segments: PyList[Dict[str, Any]]) -> PyList[Dict[str, Any]]:
+    """
+    Groups consecutive transcript segments ({"start", "end", "text"}, in seconds) into chunks of roughly
+    RETRIEVAL_CHUNK_SECONDS / RETRIEVAL_CHUNK_MAX_CHARS, keeping the start and end time of each chunk.
+    """
+    chunks: PyList[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    for segment in segments:
+        text = (segment.get("text") or "").strip()
+        if not text: continue
+        start = float(segment.get("start", 0.0)); end = float(segment.get("end", 0.0))
+        if current and (end - current["start"] > RETRIEVAL_CHUNK_SECONDS or len(current["text"]) + len(text) > RETRIEVAL_CHUNK_MAX_CHARS):
+            chunks.append(current); current = None
+        if current is None: current = {"start": start, "end": end, "text": text}
+        else: current["end"] = max(current["end"], end); current["text"] += " " + text
+    if current: chunks.append(current)
+    return chunks
+
+class RetrievalIndex:
+    """
+    BM25 index over a video's transcript chunks, stored as compressed-sparse-column NumPy arrays: the postings of
+    term t are doc_ids[term_ptr[t]:term_ptr[t+1]] with frequencies term_freqs[...] over the same range. An optional
+    (chunks x dims) embedding matrix enables hybrid ranking.
+    """
+    def __init__(self, chunk_starts, chunk_ends, chunk_texts, vocabulary, term_ptr, doc_ids, term_freqs, doc_lengths, embeddings=None):
+        self.chunk_starts = chunk_starts; self.chunk_ends = chunk_ends; self.chunk_texts = chunk_texts
+        self.vocabulary = vocabulary; self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        self.term_ptr = term_ptr; self.doc_ids = doc_ids; self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths; self.embeddings = embeddings
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        document_frequency = np.diff(term_ptr).astype(np.float32)
+        self.idf = np.log(1.0 + (len(chunk_texts) - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+    @classmethod
+    def build(cls, chunks: PyList[Dict[str, Any]], embeddings: Optional[PyList[PyList[float]]] = None) -> "RetrievalIndex":
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc_id, chunk in enumerate(chunks):
+            terms = _terms(chunk["text"])
+            doc_lengths[doc_id] = len(terms)
+            for term in terms:
+                term_postings = postings.setdefault(term, {})
+                term_postings[doc_id] = term_postings.get(doc_id, 0) + 1
+        vocabulary = sorted(postings)
+        term_ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        doc_ids, term_freqs = [], []
+        for term_id, term in enumerate(vocabulary):
+            items = sorted(postings[term].items())
+            doc_ids.extend(doc_id for doc_id, _ in items); term_freqs.extend(freq for _, freq in items)
+            term_ptr[term_id + 1] = len(doc_ids)
+        embedding_matrix = None
+        if embeddings is not None and len(embeddings) == len(chunks) and chunks:
+            embedding_matrix = np.asarray(embeddings, dtype=np.float32)
+            embedding_matrix /= np.maximum(np.linalg.norm(embedding_matrix, axis=1, keepdims=True), 1e-8)
+        return cls(np.array([c["start"] for c in chunks], dtype=np.float64), np.array([c["end"] for c in chunks], dtype=np.float64),
+                   [c["text"] for c in chunks], vocabulary, term_ptr, np.asarray(doc_ids, dtype=np.int32),
+                   np.asarray(term_freqs, dtype=np.float32), doc_lengths, embedding_matrix)
+
+    def __len__(self) -> int:
+        return len(self.chunk_texts)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate in-memory size: the NumPy arrays plus the chunk and vocabulary strings."""
+        arrays = (self.chunk_starts, self.chunk_ends, self.term_ptr, self.doc_ids, self.term_freqs, self.doc_lengths, self.idf)
+        size = sum(array.nbytes for array in arrays) + (self.embeddings.nbytes if self.embeddings is not None else 0)
+        return size + sum(len(text) for text in self.chunk_texts) + sum(len(term) for term in self.vocabulary)
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.chunk_texts), dtype=np.float32)
+        if not len(scores): return scores
+        for term in set(_terms(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None: continue
+            lo, hi = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            docs = self.doc_ids[lo:hi]; freqs = self.term_freqs[lo:hi]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / max(self.avg_doc_length, 1e-8))
+            scores[docs] += self.idf[term_id] * freqs * (BM25_K1 + 1) / (freqs + norm)
+        return scores
+
+    def search(self, query: str, top_k: int, query_embedding: Optional[PyList[float]] = None) -> PyList[int]:
+        """Returns the indices of the top_k chunks, most relevant first."""
+        if not len(self.chunk_texts): return []
+        scores = self.bm25_scores(query)
+        if self.embeddings is not None and query_embedding is not None:
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            query_vector /= max(float(np.linalg.norm(query_vector)), 1e-8)
+            similarity = self.embeddings @ query_vector
+            lexical = scores / scores.max() if scores.max() > 0 else scores
+            scores = (1 - RETRIEVAL_EMBEDDING_WEIGHT) * lexical + RETRIEVAL_EMBEDDING_WEIGHT * similarity
+        if not scores.any(): return list(range(min(top_k, len(scores)))) # nothing matched: fall back to the opening
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        return [int(i) for i in candidates[np.argsort(-scores[candidates])] if scores[i] > 0] or [int(candidates[0])]
+
+    def format_context(self, chunk_indices: PyList[int]) -> str:
+        """Renders the chosen chunks in chronological order, each prefixed with its [HH:MM:SS] start time."""
+        lines = []
+        for i in sorted(chunk_indices):
+            lines.append(f"[{format_timestamp(float(self.chunk_starts[i]))[:8]}] {self.chunk_texts[i]}")
+        return "\n\n".join(lines)
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        arrays = {"chunk_starts": self.chunk_starts, "chunk_ends": self.chunk_ends, "term_ptr": self.term_ptr, "doc_ids": self.doc_ids,
+                  "term_freqs": self.term_freqs, "doc_lengths": self.doc_lengths,
+                  "meta": np.frombuffer(json.dumps({"vocabulary": self.vocabulary, "chunk_texts": self.chunk_texts}).encode("utf-8"), dtype=np.uint8)}
+        if self.embeddings is not None: arrays["embeddings"] = self.embeddings
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RetrievalIndex":
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            meta = json.loads(arrays["meta"].tobytes().decode("utf-8"))
+            return cls(arrays["chunk_starts"], arrays["chunk_ends"], meta["chunk_texts"], meta["vocabulary"], arrays["term_ptr"],
+                       arrays["doc_ids"], arrays["term_freqs"], arrays["doc_lengths"], arrays["embeddings"] if "embeddings" in arrays.files else None)
+
+async def build_retrieval_index(segments: PyList[Dict[str, Any]]) -> RetrievalIndex:
+    """Chunks the transcript segments and indexes them, adding chunk embeddings when RETRIEVAL_EMBEDDINGS_ENABLED."""
+    chunks = chunk_segments(segments)
+    embeddings = None
+    if RETRIEVAL_EMBEDDINGS_ENABLED and chunks:
+        try: embeddings = await embed_texts([chunk["text"] for chunk in chunks])
+        except Exception as e: logger.warning(f"Embedding chunks failed, using BM25 only: {e}")
+    return await asyncio.to_thread(RetrievalIndex.build, chunks, embeddings)
@@ -0,0 +1,146 @@
+import logging
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from .. import crud
+from . import metrics
+from ..database import AsyncSessionLocal
+from typing import Optional, List as PyList, Any, Dict, Callable
+
+try: import tiktoken # optional: without it token counts are estimated from the text length
+except ImportError: tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Context windows of the models this app calls; unknown models get LLM_DEFAULT_CONTEXT_TOKENS.
+MODEL_CONTEXT_TOKENS = {"gpt-3.5-turbo": 16385, "gpt-3.5-turbo-0125": 16385, "gpt-4o": 128000, "gpt-4o-mini": 128000}
+LLM_DEFAULT_CONTEXT_TOKENS = int(os.getenv("LLM_DEFAULT_CONTEXT_TOKENS", "16385"))
+# Tokens kept free for the completion when sizing a prompt.
+LLM_COMPLETION_TOKENS_RESERVE = int(os.getenv("LLM_COMPLETION_TOKENS_RESERVE", "2000"))
+# Comma-separated "<model>=<max prompt tokens>" pairs, to budget prompts below the context window.
+LLM_PROMPT_TOKEN_BUDGETS = os.getenv("LLM_PROMPT_TOKEN_BUDGETS", "")
+# Default per-project ceiling on LLM tokens within the window; 0 means unlimited. projects.token_ceiling overrides it.
+PROJECT_TOKEN_CEILING = int(os.getenv("PROJECT_TOKEN_CEILING", "0"))
+PROJECT_TOKEN_CEILING_WINDOW_DAYS = int(os.getenv("PROJECT_TOKEN_CEILING_WINDOW_DAYS", "30"))
+# How long a project's usage total is trusted before it is re-read from llm_usage.
+PROJECT_USAGE_CACHE_SECONDS = float(os.getenv("PROJECT_USAGE_CACHE_SECONDS", "15"))
+CHARS_PER_TOKEN = 4
+
+# Who an LLM call is for: {"video_id", "project_id", "stage"}, any of them may be missing.
+_usage_scope: contextvars.ContextVar = contextvars.ContextVar("llm_usage_scope", default={})
+# Both lookup caches below are simply cleared when they grow past this many entries.
+_LOOKUP_CACHE_MAX_ENTRIES = 10000
+_video_projects: Dict[int, Optional[int]] = {}
+_project_usage: Dict[int, Dict[str, Any]] = {} # project id -> {"expires_at", "used", "ceiling"}
+
+class TokenCeilingExceeded(Exception):
+    pass
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        if "=" not in item: continue
+        model, tokens = item.split("=", 1)
+        budgets[model.strip()] = int(tokens)
+    return budgets
+
+_prompt_budgets = _parse_budgets(LLM_PROMPT_TOKEN_BUDGETS)
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    try: return tiktoken.encoding_for_model(model)
+    except KeyError: return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: str) -> int:
+    if not text: return 0
+    if tiktoken is None: return len(text) // CHARS_PER_TOKEN + 1
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+def count_message_tokens(messages: PyList[Dict[str, Any]], model: str) -> int:
+    """Prompt tokens of a chat request, including the few tokens of framing per message."""
+    return sum(count_tokens(message.get("content") or "", model) + 4 for message in messages) + 3
+
+def prompt_budget(model: str) -> int:
+    window = MODEL_CONTEXT_TOKENS.get(model, LLM_DEFAULT_CONTEXT_TOKENS) - LLM_COMPLETION_TOKENS_RESERVE
+    return min(window, _prompt_budgets[model]) if model in _prompt_budgets else window
+
+def trim_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    if max_tokens <= 0: return ""
+    if tiktoken is None: return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = _encoding(model).encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else _encoding(model).decode(tokens[:max_tokens])
+
+def fit_prompt(model: str, build_prompt: Callable[[str], str], text: str, system_prompt: str = "") -> str:
+    """
+    Returns build_prompt(text), with `text` (the transcript part of the prompt) cut so that the system and user
+    messages fit prompt_budget(model).
+    """
+    overhead = count_message_tokens([{"content": system_prompt}, {"content": build_prompt("")}], model)
+    allowed = prompt_budget(model) - overhead
+    text_tokens = count_tokens(text, model)
+    if text_tokens > allowed:
+        logger.warning(f"Prompt for {model} over budget by {text_tokens - allowed} tokens, trimming the transcript to {max(0, allowed)} tokens.")
+        text = trim_to_tokens(text, allowed, model)
+    return build_prompt(text)
+
+@contextmanager
+def usage_scope(**fields):
+    """Attributes LLM calls made inside the block (and tasks started from it) to the given video/project/stage."""
+    token = _usage_scope.set({**_usage_scope.get(), **{key: value for key, value in fields.items() if value is not None}})
+    try: yield
+    finally: _usage_scope.reset(token)
+
+def bind_usage_scope(**fields) -> None:
+    """usage_scope() for the rest of the current task, e.g. a request handler and the response it streams."""
+    _usage_scope.set({**_usage_scope.get(), **{key: value for key, value in fields.items() if value is not None}})
+
+async def _project_id(scope: Dict[str, Any]) -> Optional[int]:
+    if scope.get("project_id") is not None or scope.get("video_id") is None: return scope.get("project_id")
+    video_id = scope["video_id"]
+    if video_id not in _video_projects:
+        async with AsyncSessionLocal() as db:
+            project_id = await crud.get_video_project_id(db, video_id=video_id)
+        if len(_video_projects) > _LOOKUP_CACHE_MAX_ENTRIES: _video_projects.clear()
+        _video_projects[video_id] = project_id
+    return _video_projects[video_id]
+
+async def check_token_ceiling() -> None:
+    """Raises TokenCeilingExceeded when the current scope's project has used up its tokens for the window."""
+    project_id = await _project_id(_usage_scope.get())
+    if project_id is None: return
+    state = _project_usage.get(project_id)
+    if state is None or state["expires_at"] < time.monotonic():
+        since = datetime.now(timezone.utc) - timedelta(days=PROJECT_TOKEN_CEILING_WINDOW_DAYS)
+        async with AsyncSessionLocal() as db:
+            used = await crud.get_project_token_usage(db, project_id=project_id, since=since)
+            project = await crud.get_project(db, project_id=project_id)
+        ceiling = project.token_ceiling if project and project.token_ceiling is not None else PROJECT_TOKEN_CEILING
+        if len(_project_usage) > _LOOKUP_CACHE_MAX_ENTRIES: _project_usage.clear()
+        state = _project_usage[project_id] = {"expires_at": time.monotonic() + PROJECT_USAGE_CACHE_SECONDS, "used": used, "ceiling": ceiling}
+    if state["ceiling"] and state["used"] >= state["ceiling"]:
+        raise TokenCeilingExceeded(f"Project {project_id} used {state['used']} of its {state['ceiling']} LLM tokens in the last {PROJECT_TOKEN_CEILING_WINDOW_DAYS} days.")
+
+def forget_project_usage(project_id: int) -> None:
+    """Drops the cached usage total, e.g. after the project's ceiling changed."""
+    _project_usage.pop(project_id, None)
+
+async def record_usage(kind: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0, latency_ms: int = 0, audio_seconds: Optional[float] = None) -> None:
+    """Stores one API call in llm_usage under the current scope. Best effort: failures are logged, never raised."""
+    metrics.observe_api_call(kind, model, latency_ms, prompt_tokens, completion_tokens, audio_seconds)
+    scope = _usage_scope.get()
+    try:
+        project_id = await _project_id(scope)
+        if project_id in _project_usage: _project_usage[project_id]["used"] += prompt_tokens + completion_tokens
+        async with AsyncSessionLocal() as db:
+            await crud.record_llm_usage(db, kind=kind, model=model, stage=scope.get("stage"), video_id=scope.get("video_id"), project_id=project_id,
+                                        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, latency_ms=latency_ms, audio_seconds=audio_seconds)
+    except Exception as e: logger.warning(f"Could not record {kind} usage for {model}: {e}")
+
+def scoped_stage(stage_name: str, run):
+    """Wraps a pipeline stage runner so the LLM calls it makes are attributed to that stage."""
+    async def run_in_scope(context):
+        with usage_scope(stage=stage_name): return await run(context)
+    return run_in_scope
@@ -0,0 +1,79 @@
+import os
+import logging
+import functools
+from contextlib import contextmanager
+from typing import Optional, Any, Dict
+
+try: # optional: without the OpenTelemetry API, spans are no-ops
+    from opentelemetry import trace, propagate
+except ImportError:
+    trace = None; propagate = None
+
+logger = logging.getLogger(__name__)
+
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "true").lower() == "true"
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "video-processor")
+# Spans are exported over OTLP/HTTP only when an endpoint is configured (and the SDK is installed).
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+
+def init_tracing(service_role: str, engine=None) -> None:
+    """
+    Installs the OTLP exporter for this process (`service_role`: api or worker) and instruments SQLAlchemy and
+    httpx when their OpenTelemetry instrumentations are installed. Without the SDK, spans stay no-ops.
+    """
+    if trace is None or not OTEL_ENABLED: return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.info("OpenTelemetry SDK or OTLP exporter not installed, spans are not exported."); return
+    if not OTEL_EXPORTER_OTLP_ENDPOINT:
+        logger.info("OTEL_EXPORTER_OTLP_ENDPOINT not set, spans are not exported."); return
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME, "service.instance.role": service_role}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    try:
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+        if engine is not None: SQLAlchemyInstrumentor().instrument(engine=engine.sync_engine)
+    except ImportError: pass
+    try:
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+        HTTPXClientInstrumentor().instrument()
+    except ImportError: pass
+    logger.info(f"Exporting spans to {OTEL_EXPORTER_OTLP_ENDPOINT} as {OTEL_SERVICE_NAME} ({service_role}).")
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, **attributes):
+    """
+    A span around the block, child of the current span, or of `traceparent` (a W3C header value, e.g. from a
+    job payload) when given. Exceptions are recorded on the span and re-raised.
+    """
+    if trace is None: yield None; return
+    context = propagate.extract({"traceparent": traceparent}) if traceparent else None
+    clean = {key: value for key, value in attributes.items() if isinstance(value, (str, bool, int, float))}
+    with trace.get_tracer(__name__).start_as_current_span(name, context=context, attributes=clean) as current:
+        yield current
+
+def traced(name: str):
+    """Decorator for coroutine functions: runs every call in span(name)."""
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with span(name): return await function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def current_traceparent() -> Optional[str]:
+    """The W3C traceparent of the current span, for handing the trace to another process (e.g. in a job payload)."""
+    if propagate is None: return None
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier.get("traceparent")
+
+def current_trace_ids() -> Dict[str, Any]:
+    if trace is None: return {}
+    context = trace.get_current_span().get_span_context()
+    if not context.is_valid: return {}
+    return {"trace_id": format(context.trace_id, "032x"), "span_id": format(context.span_id, "016x")}
@@ -0,0 +1,99 @@
+import os
+import threading
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from .utils import transcript_document
+from typing import Optional, Any, Dict
+
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "256"))
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Rough per-row cost of the dicts and timestamp strings in an assembled document.
+SEGMENT_OVERHEAD_BYTES = 400
+
+class CachedTranscript:
+    """Transcript document of one video at one `transcript_version`, plus structures derived from it on demand."""
+    def __init__(self, video_id: int, version: int, transcript: Optional[Dict[str, Any]], full_text: str, size_bytes: int):
+        self.video_id = video_id; self.version = version
+        self.transcript = transcript; self.full_text = full_text
+        self.size_bytes = size_bytes
+        self.retrieval_index = None # set by chat_service the first time the video is chatted with
+
+class TranscriptCache:
+    """
+    Per-process LRU of assembled transcript documents keyed by video id. An entry is only served for the
+    `transcript_version` it was built from, so a transcript change or (un)publish made by any process (crud bumps
+    the version) turns the next lookup into a miss. Sizes are estimated from the text and index array sizes.
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries; self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, CachedTranscript]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "loads": 0, "evictions": 0, "invalidations": 0}
+
+    def _get(self, video_id: int, version: int) -> Optional[CachedTranscript]:
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is not None and entry.version != version:
+                self._drop(video_id); self.stats["stale"] += 1; entry = None
+            if entry is None:
+                self.stats["misses"] += 1; return None
+            self._entries.move_to_end(video_id)
+            self.stats["hits"] += 1
+            return entry
+
+    def _put(self, entry: CachedTranscript) -> None:
+        if entry.size_bytes > self.max_bytes: return
+        with self._lock:
+            current = self._entries.get(entry.video_id)
+            if current is not None and current.version > entry.version: return # a newer version got there first
+            if current is not None: self._drop(entry.video_id)
+            self._entries[entry.video_id] = entry; self._bytes += entry.size_bytes
+            self._evict()
+
+    def _drop(self, video_id: int) -> None:
+        self._bytes -= self._entries.pop(video_id).size_bytes
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries))); self.stats["evictions"] += 1
+
+    async def get_or_load(self, db: AsyncSession, video_id: int, version: int) -> CachedTranscript:
+        """Returns the cached transcript for (video_id, version), reading the segment and key moment rows on a miss."""
+        entry = self._get(video_id, version)
+        if entry is not None: return entry
+        row = (await db.execute(select(models.Video.transcript_segment_count, models.Video.transcript_version).where(models.Video.id == video_id))).first()
+        transcript, full_text, size_bytes = None, "", 0
+        if row is not None and row.transcript_segment_count is not None:
+            segment = models.TranscriptSegment
+            segments = (await db.execute(select(segment.start_seconds, segment.end_seconds, segment.text).where(segment.video_id == video_id).order_by(segment.position))).all()
+            key_moments = (await db.scalars(select(models.KeyMoment).where(models.KeyMoment.video_id == video_id).order_by(models.KeyMoment.position))).all()
+            transcript = transcript_document(segments, key_moments)
+            full_text = " ".join(seg.text for seg in segments if seg.text)
+            size_bytes = 2 * len(full_text) + SEGMENT_OVERHEAD_BYTES * (len(segments) + len(key_moments))
+        entry = CachedTranscript(video_id, row.transcript_version if row else version, transcript, full_text, size_bytes)
+        self.stats["loads"] += 1
+        self._put(entry)
+        return entry
+
+    def attach_retrieval_index(self, entry: CachedTranscript, index: Any, index_bytes: int) -> None:
+        with self._lock:
+            entry.retrieval_index = index
+            if self._entries.get(entry.video_id) is entry:
+                entry.size_bytes += index_bytes; self._bytes += index_bytes
+                self._evict()
+
+    def invalidate(self, video_id: int) -> None:
+        with self._lock:
+            if video_id in self._entries:
+                self._drop(video_id); self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "hit_ratio": (self.stats["hits"] / lookups) if lookups else 0.0,
+                "entries": len(self._entries), "memory_bytes": self._bytes,
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes}
+
+transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_MAX_ENTRIES, TRANSCRIPT_CACHE_MAX_BYTES)
@@ -1,134 +1,238 @@
+import logging
 import os
 import json
-import subprocess
 import asyncio
 from .. import crud
-from ..database import SessionLocal
-from .openai_utils import client, extract_key_moments, generate_tags_from_transcript 
-from .utils import format_timestamp 
-from typing import Optional, List as PyList, Any, Dict
+from .openai_utils import client, extract_key_moments, generate_tags_from_transcript, transcribe_audio, generate_mindmap_data_from_transcript
+from .utils import parse_timestamp 
+from . import audio_chunking, progress_events, ffmpeg_runner, quiz_service, token_budget, metrics, tracing
+from .ffmpeg_runner import FFmpegUsage, FFmpegTimeout
+from .pipeline import Pipeline, Stage, StageFailed
+from .retrieval import build_retrieval_index
+from .chat_service import save_retrieval_index
+from .condensation import condense_transcript
+from typing import Optional, List as PyList, Any, Dict, Iterable
 
-FFMPEG_TIMEOUT_SECONDS = 300 
+logger = logging.getLogger(__name__)
 
-async def transcribe_video_with_openai(video_filepath: str, video_id: int, db_session_factory):
-    db = db_session_factory()
-    print(f"[TranscriptionService] Video ID {video_id}: Starting transcription process for {video_filepath}")
-    default_error_transcript = {
-        "key_moments": [{"label": "Processing error", "timestamp_start": "00:00:00.000"}],
-        "segments": []
+# Speech-only audio sent to Whisper: Opus in Ogg, 16 kHz mono.
+AUDIO_FORMAT = "ogg"
+AUDIO_BITRATE = os.getenv("AUDIO_BITRATE", "24k")
+WHISPER_CHUNK_CONCURRENCY = int(os.getenv("WHISPER_CHUNK_CONCURRENCY", "4"))
+# Optional downstream stages run right after transcription, e.g. "mindmap,quiz". A job payload's "stages" overrides it.
+PIPELINE_OPTIONAL_STAGES = [name.strip() for name in os.getenv("PIPELINE_OPTIONAL_STAGES", "").split(",") if name.strip()]
+
+class StageError(Exception):
+    """A stage failure with the label shown to users in the error transcript."""
+    def __init__(self, label: str, details: str = ""):
+        super().__init__(f"{label}: {details}" if details else label)
+        self.label = label; self.details = details
+
+async def transcribe_audio_in_chunks(audio: bytes, duration: float, video_id: int, usage: FFmpegUsage) -> PyList[Any]:
+    """
+    Splits the extracted audio at silences into overlapping chunks, transcribes up to WHISPER_CHUNK_CONCURRENCY
+    chunks at once and stitches the segments back onto the full timeline. Everything stays in memory.
+    """
+    silences = []
+    if duration > audio_chunking.WHISPER_CHUNK_SECONDS * 1.25:
+        silences = await audio_chunking.detect_silences(audio, duration, usage)
+    chunks = audio_chunking.plan_chunks(duration, silences)
+    if len(chunks) <= 1:
+        return audio_chunking.stitch_segments([{"index": 0, "cut_start": 0.0, "cut_end": float("inf"), "audio_start": 0.0, "audio_end": duration}], [await transcribe_audio(audio, f"audio_{video_id}.{AUDIO_FORMAT}")])
+
+    logger.info(f"Video ID {video_id}: Transcribing {duration:.0f}s of audio in {len(chunks)} chunks (fan-out {WHISPER_CHUNK_CONCURRENCY}).")
+    semaphore = asyncio.Semaphore(max(1, WHISPER_CHUNK_CONCURRENCY))
+    completed_chunks = 0
+
+    async def transcribe_chunk(chunk: Dict[str, float]) -> PyList[Any]:
+        async with semaphore:
+            chunk_audio = await audio_chunking.extract_chunk(audio, chunk, AUDIO_FORMAT, usage)
+            segments = await transcribe_audio(chunk_audio, f"audio_{video_id}_chunk{chunk['index']:03}.{AUDIO_FORMAT}")
+            nonlocal completed_chunks
+            completed_chunks += 1
+            logger.debug(f"Video ID {video_id}: Chunk {chunk['index'] + 1}/{len(chunks)} transcribed.")
+            await progress_events.publish(video_id, "progress", stage="transcribe", percent=int(100 * completed_chunks / len(chunks)),
+                                          completed_chunks=completed_chunks, total_chunks=len(chunks))
+            return segments
+
+    chunk_segments = await asyncio.gather(*[transcribe_chunk(chunk) for chunk in chunks])
+    return audio_chunking.stitch_segments(chunks, chunk_segments)
+
+def _error_key_moments(label: str, details: Optional[str] = None) -> PyList[Dict[str, Any]]:
+    return [{"label": label, "start": 0.0, "details": details[:500] if details else None}]
+
+async def extract_audio_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Probes the upload, then has ffmpeg stream its first audio track as 16 kHz mono Opus to stdout. The audio (about
+    11 MB per hour at 24 kbps) is kept in memory for chunking and upload, so nothing is written next to the uploads.
+    """
+    video_filepath, video_id = context["video_filepath"], context["video_id"]
+    usage = context["ffmpeg_usage"].setdefault("extract_audio", FFmpegUsage())
+    try: media = await ffmpeg_runner.probe_media(video_filepath)
+    except FFmpegTimeout as e: raise StageError("FFprobe timeout", str(e))
+    if not media["has_audio"]:
+        raise StageError("No audio track", "The uploaded file has no audio stream to transcribe.")
+    duration = media["duration"]
+    args = ["-i", video_filepath, "-map", "0:a:0", "-vn", "-c:a", "libopus", "-b:a", AUDIO_BITRATE, "-application", "voip",
+            "-ar", "16000", "-ac", "1", "-progress", "pipe:2", "-f", AUDIO_FORMAT, "pipe:1"]
+    timeout = ffmpeg_runner.timeout_for(duration)
+    logger.info(f"Video ID {video_id}: Extracting {duration:.0f}s of audio (timeout {timeout:.0f}s): ffmpeg {' '.join(args)}")
+    reporter = progress_events.PercentReporter(video_id, "extract_audio")
+
+    async def follow_progress(line: str):
+        # -progress writes key=value lines; out_time_us (out_time_ms on older builds, also in microseconds) drives percent events.
+        key, _, value = line.partition("=")
+        if key in ("out_time_us", "out_time_ms") and duration > 0 and value.isdigit():
+            await reporter.report(100 * int(value) / 1_000_000 / duration)
+
+    try:
+        result = usage.add(await ffmpeg_runner.run_ffmpeg(args, timeout, on_stderr_line=follow_progress, operation="extract_audio"))
+    except FFmpegTimeout as e:
+        raise StageError("FFmpeg timeout", str(e))
+    if result.returncode != 0 or not result.stdout:
+        raise StageError("FFmpeg audio extraction failed", result.stderr or "Unknown FFmpeg error")
+    logger.info(f"Video ID {video_id}: Extracted {result.bytes_out} bytes of audio in {result.wall_seconds:.1f}s ({result.cpu_seconds:.1f}s CPU).")
+    return {"audio": result.stdout, "audio_duration": duration}
+
+async def transcribe_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    video_id = context["video_id"]
+    logger.info(f"Video ID {video_id}: Starting Whisper transcription.")
+    try:
+        usage = context["ffmpeg_usage"].setdefault("transcribe", FFmpegUsage())
+        whisper_segments_objects = await transcribe_audio_in_chunks(context["audio"], context["audio_duration"], video_id, usage)
+    except StageError: raise
+    except Exception as e:
+        raise StageError("OpenAI API call or processing failed", str(e))
+    logger.info(f"Video ID {video_id}: Whisper transcription finished ({len(whisper_segments_objects)} segments).")
+    transcript_segments = [{
+        "start": float(getattr(seg_obj, 'start', 0.0)),
+        "end": float(getattr(seg_obj, 'end', 0.0)),
+        "text": getattr(seg_obj, 'text', "").strip()
+    } for seg_obj in whisper_segments_objects]
+    full_transcript_text = " ".join(seg.text.strip() for seg in whisper_segments_objects)
+    if not full_transcript_text.strip():
+        logger.info(f"Video ID {video_id}: Whisper returned empty transcript text. Key moment and tag extraction will be skipped.")
+    return {"whisper_segments": whisper_segments_objects, "transcript_segments": transcript_segments, "full_text": full_transcript_text}
+
+async def key_moments_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    if not context["full_text"].strip(): return {"key_moments": []}
+    logger.info(f"Video ID {context['video_id']}: Starting key moment extraction.")
+    key_moments_data = await extract_key_moments(context["full_text"], context["whisper_segments"])
+    logger.info(f"Video ID {context['video_id']}: Key moment extraction finished.")
+    return {"key_moments": key_moments_data}
+
+async def condense_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    key_moments = [{"label": moment["label"], "start": parse_timestamp(moment["timestamp_start"])} for moment in context["key_moments"]]
+    digest, condensed = await condense_transcript(context["transcript_segments"], key_moments)
+    return {"digest": digest, "digest_condensed": condensed}
+
+async def tags_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    if not context["digest"].strip(): return {"tags": []}
+    logger.info(f"Video ID {context['video_id']}: Starting tag generation.")
+    video_tags = await generate_tags_from_transcript(context["digest"])
+    logger.info(f"Video ID {context['video_id']}: Tag generation finished. Tags: {video_tags}")
+    return {"tags": video_tags}
+
+async def retrieval_index_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    return {"retrieval_index": await build_retrieval_index(context["transcript_segments"])}
+
+async def mindmap_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    return {"mindmap_data": await generate_mindmap_data_from_transcript(context["digest"], context["key_moments"])}
+
+async def quiz_stage(context: Dict[str, Any]) -> Dict[str, Any]:
+    key_moments = [{"label": moment["label"], "start": parse_timestamp(moment["timestamp_start"])} for moment in context["key_moments"]]
+    chapters = quiz_service.plan_chapters(context["transcript_segments"], key_moments)
+    quiz_chapters = await quiz_service.generate_chapters(chapters, context["video_title"], quiz_service.questions_per_chapter(len(chapters)))
+    return {"quiz_chapters": quiz_chapters, "quiz_data": quiz_service.merge_quiz(context["video_title"], quiz_chapters)}
+
+def build_video_pipeline(db, video_id: int, optional_stages: Iterable[str] = ()) -> Pipeline:
+    """
+    extract_audio -> transcribe -> key_moments || retrieval_index; key_moments -> condense -> tags [|| mindmap]; key_moments [-> quiz]
+    Each stage's result is written to the video row as soon as it finishes; the status stays 'processing'
+    until the whole graph is done. Only audio extraction and transcription fail the video; a failed enrichment
+    stage just skips the stages built on it. Tags and the mind map read the condensed digest (the whole transcript for
+    short videos); the quiz is generated per chapter.
+    """
+    async def persist_key_moments(context, outputs):
+        key_moments = [{"label": moment["label"], "start": parse_timestamp(moment["timestamp_start"])} for moment in outputs["key_moments"]]
+        await crud.save_key_moments(db, video_id=video_id, key_moments=key_moments)
+    async def persist_digest(context, outputs):
+        # Short transcripts are their own digest; only a condensed one is worth storing.
+        if outputs["digest_condensed"]: await crud.update_video_data(db=db, video_id=video_id, summary=outputs["digest"])
+    async def persist_quiz(context, outputs):
+        await crud.save_quiz_chapters(db, video_id=video_id, chapters=outputs["quiz_chapters"], chapter_count=len(outputs["quiz_chapters"]), commit=False)
+        await crud.update_video_data(db=db, video_id=video_id, quiz_data=json.dumps(outputs["quiz_data"]))
+    stages = [
+        Stage("extract_audio", extract_audio_stage, inputs=["video_filepath"], outputs=["audio", "audio_duration"], critical=True),
+        Stage("transcribe", transcribe_stage, inputs=["audio", "audio_duration"], outputs=["whisper_segments", "transcript_segments", "full_text"],
+              persist=lambda context, outputs: crud.save_transcript(db, video_id=video_id, segments=outputs["transcript_segments"], key_moments=[]), critical=True),
+        Stage("key_moments", key_moments_stage, inputs=["full_text", "whisper_segments"], outputs=["key_moments"], persist=persist_key_moments),
+        Stage("condense", condense_stage, inputs=["transcript_segments", "key_moments"], outputs=["digest", "digest_condensed"], persist=persist_digest),
+        Stage("tags", tags_stage, inputs=["digest"], outputs=["tags"],
+              persist=lambda context, outputs: crud.update_video_data(db=db, video_id=video_id, tags=outputs["tags"])),
+        Stage("retrieval_index", retrieval_index_stage, inputs=["transcript_segments"], outputs=["retrieval_index"],
+              persist=lambda context, outputs: save_retrieval_index(db, video_id, outputs["retrieval_index"])),
+    ]
+    optional_stage_factories = {
+        "mindmap": lambda: Stage("mindmap", mindmap_stage, inputs=["digest", "key_moments"], outputs=["mindmap_data"],
+                                 persist=lambda context, outputs: crud.update_video_data(db=db, video_id=video_id, mindmap_data=outputs["mindmap_data"])),
+        "quiz": lambda: Stage("quiz", quiz_stage, inputs=["transcript_segments", "key_moments", "video_title"], outputs=["quiz_chapters", "quiz_data"], persist=persist_quiz),
     }
-    video_tags = [] 
+    for name in optional_stages:
+        if name in optional_stage_factories: stages.append(optional_stage_factories[name]())
+        else: logger.warning(f"Video ID {video_id}: Unknown optional stage '{name}' ignored.")
+    for stage in stages: stage.run = tracing.traced(f"stage {stage.name}")(token_budget.scoped_stage(stage.name, stage.run))
+    return Pipeline(stages, initial_inputs=["video_id", "video_filepath", "video_title", "ffmpeg_usage"])
+
+async def transcribe_video_with_openai(video_filepath: str, video_id: int, db_session_factory, optional_stages: Optional[PyList[str]] = None, final_attempt: bool = True):
+    """
+    Runs the video pipeline. Audio extraction or transcription failures are re-raised so the job queue retries
+    with backoff; the failed error transcript is only written on the `final_attempt`.
+    """
+    db = db_session_factory()
+    logger.info(f"Video ID {video_id}: Starting transcription process for {video_filepath}")
+    context: Dict[str, Any] = {"video_id": video_id, "video_filepath": video_filepath, "ffmpeg_usage": {}}
     try:
         if not client: 
-            print(f"[TranscriptionService] Video ID {video_id}: OpenAI client not initialized.")
-            default_error_transcript["key_moments"] = [{"label": "OpenAI client not initialized", "timestamp_start": "00:00:00.000"}]
-            crud.update_video_data(db=db, video_id=video_id, status="failed", transcript=json.dumps(default_error_transcript))
+            logger.warning(f"Video ID {video_id}: OpenAI client not initialized.")
+            await crud.save_transcript(db, video_id=video_id, segments=[], key_moments=_error_key_moments("OpenAI client not initialized"), status="failed")
             return
 
-        base_filename = os.path.splitext(os.path.basename(video_filepath))[0]
-        audio_output_path = os.path.join(os.path.dirname(video_filepath), f"{base_filename}.mp3")
-        
-        ffmpeg_command = [
-            "ffmpeg", "-y", "-i", video_filepath,
-            "-vn", "-acodec", "mp3", "-ab", "192k",
-            "-ar", "16000", "-ac", "1", audio_output_path
-        ]
-        
-        print(f"[TranscriptionService] Video ID {video_id}: Running FFmpeg command: {' '.join(ffmpeg_command)}")
-        try:
-            process = await asyncio.to_thread(
-                subprocess.run, 
-                ffmpeg_command, 
-                capture_output=True, 
-                text=True, 
-                check=False, 
-                timeout=FFMPEG_TIMEOUT_SECONDS 
-            )
-        except subprocess.TimeoutExpired:
-            error_details = f"FFmpeg process timed out after {FFMPEG_TIMEOUT_SECONDS} seconds."
-            print(f"[TranscriptionService] Video ID {video_id}: {error_details}")
-            default_error_transcript["key_moments"] = [{"label": "FFmpeg timeout", "timestamp_start": "00:00:00.000", "details": error_details}]
-            crud.update_video_data(db=db, video_id=video_id, status="failed", transcript=json.dumps(default_error_transcript))
-            return
+        video = await crud.get_video(db, video_id=video_id)
+        context["video_title"] = video.filename if video else os.path.basename(video_filepath)
+        pipeline = build_video_pipeline(db, video_id, PIPELINE_OPTIONAL_STAGES if optional_stages is None else optional_stages)
 
-        if process.returncode != 0:
-            error_details = process.stderr or "Unknown FFmpeg error"
-            print(f"[TranscriptionService] Video ID {video_id}: FFmpeg failed: {error_details}")
-            default_error_transcript["key_moments"] = [{"label": "FFmpeg audio extraction failed", "timestamp_start": "00:00:00.000", "details": error_details[:500]}]
-            crud.update_video_data(db=db, video_id=video_id, status="failed", transcript=json.dumps(default_error_transcript))
-            return
+        async def stage_started(stage_name: str):
+            await progress_events.publish(video_id, "stage", stage=stage_name, status="started")
+
+        async def record_stage(stage_name: str, status: str, duration_seconds: float, error: Optional[str]):
+            logger.info(f"Video ID {video_id}: Stage '{stage_name}' {status} in {duration_seconds:.2f}s.")
+            metrics.PIPELINE_STAGE_DURATION.labels(stage_name, status).observe(duration_seconds)
+            await progress_events.publish(video_id, "stage", stage=stage_name, status=status, duration_seconds=round(duration_seconds, 3))
+            usage = context["ffmpeg_usage"].get(stage_name)
+            if usage: logger.info(f"Video ID {video_id}: Stage '{stage_name}' ran {usage.runs} ffmpeg process(es): {usage.cpu_seconds:.2f}s CPU, {usage.bytes_in} bytes in, {usage.bytes_out} bytes out.")
+            try: await crud.record_pipeline_stage_run(db, video_id=video_id, stage=stage_name, status=status, duration_ms=int(duration_seconds * 1000), error=error, ffmpeg_usage=usage)
+            except Exception as e: logger.warning(f"Video ID {video_id}: Could not record stage timing: {e}"); await db.rollback()
 
-        print(f"[TranscriptionService] Video ID {video_id}: Audio extracted to: {audio_output_path}")
-
-        try:
-            print(f"[TranscriptionService] Video ID {video_id}: Starting Whisper transcription.")
-            with open(audio_output_path, "rb") as audio_file:
-                whisper_response = await asyncio.to_thread(
-                    client.audio.transcriptions.create,
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="verbose_json", 
-                    timestamp_granularities=["segment"] 
-                )
-            print(f"[TranscriptionService] Video ID {video_id}: Whisper transcription finished.")
-            
-            full_transcript_text = getattr(whisper_response, 'text', "")
-            whisper_segments_objects = getattr(whisper_response, 'segments', [])
-            
-            formatted_segments_for_json = []
-            if whisper_segments_objects:
-                for seg_obj in whisper_segments_objects:
-                    formatted_segments_for_json.append({
-                        "timestamp_start": format_timestamp(getattr(seg_obj, 'start', 0.0)),
-                        "timestamp_end": format_timestamp(getattr(seg_obj, 'end', 0.0)),
-                        "text": getattr(seg_obj, 'text', "").strip()
-                    })
-            
-            key_moments_data = []
-            if not full_transcript_text.strip():
-                print(f"[TranscriptionService] Video ID {video_id}: Whisper returned empty transcript text. Skipping key moment and tag extraction.")
-            else:
-                 print(f"[TranscriptionService] Video ID {video_id}: Starting key moment extraction.")
-                 key_moments_data = await extract_key_moments(full_transcript_text, whisper_segments_objects)
-                 print(f"[TranscriptionService] Video ID {video_id}: Key moment extraction finished.")
-                 
-                 print(f"[TranscriptionService] Video ID {video_id}: Starting tag generation.")
-                 video_tags = await generate_tags_from_transcript(full_transcript_text)
-                 print(f"[TranscriptionService] Video ID {video_id}: Tag generation finished. Tags: {video_tags}")
-
-
-            combined_transcript_data = {
-                "key_moments": key_moments_data,
-                "segments": formatted_segments_for_json
-            }
-
-            final_transcript_json = json.dumps(combined_transcript_data)
-            print(f"[TranscriptionService] Video ID {video_id}: Updating status to 'completed'.")
-            crud.update_video_data(
-                db=db, 
-                video_id=video_id, 
-                status="completed", 
-                transcript=final_transcript_json,
-                tags=video_tags 
-            )
-            print(f"[TranscriptionService] Video ID {video_id}: Transcription, key moments, and tags saved.")
-
-        except Exception as e:
-            error_details = str(e)
-            print(f"[TranscriptionService] Video ID {video_id}: OpenAI API call or processing failed: {error_details}")
-            default_error_transcript["key_moments"] = [{"label": "OpenAI API call or processing failed", "timestamp_start": "00:00:00.000", "details": error_details[:500]}]
-            crud.update_video_data(db=db, video_id=video_id, status="failed", transcript=json.dumps(default_error_transcript))
-        finally:
-            if os.path.exists(audio_output_path):
-                try: os.remove(audio_output_path)
-                except Exception as e_clean: print(f"[TranscriptionService] Video ID {video_id}: Error cleaning up audio file: {e_clean}")
+        await pipeline.run(context, on_stage_finished=record_stage, on_stage_started=stage_started)
+        logger.info(f"Video ID {video_id}: Updating status to 'completed'.")
+        await crud.update_video_data(db=db, video_id=video_id, status="completed")
+        logger.info(f"Video ID {video_id}: Transcription, key moments, and tags saved.")
+    except StageFailed as e:
+        label = e.error.label if isinstance(e.error, StageError) else f"Stage '{e.stage_name}' failed"
+        details = e.error.details if isinstance(e.error, StageError) else str(e.error)
+        logger.info(f"Video ID {video_id}: {label}: {details}")
+        if final_attempt: await crud.save_transcript(db, video_id=video_id, segments=[], key_moments=_error_key_moments(label, details), status="failed")
+        raise
     except Exception as e:
         error_details = str(e)
-        print(f"[TranscriptionService] Video ID {video_id}: Unexpected error during transcription: {error_details}")
-        db_video_check = crud.get_video(db=db, video_id=video_id)
-        if db_video_check and db_video_check.status != "completed" and db_video_check.status != "failed": 
-             default_error_transcript["key_moments"] = [{"label": "Unexpected transcription error", "timestamp_start": "00:00:00.000", "details": error_details[:500]}]
-             crud.update_video_data(db=db, video_id=video_id, status="failed", transcript=json.dumps(default_error_transcript))
+        logger.error(f"Video ID {video_id}: Unexpected error during transcription: {error_details}")
+        if final_attempt:
+            await db.rollback()
+            db_video_check = await crud.get_video(db=db, video_id=video_id)
+            if db_video_check and db_video_check.status != "completed" and db_video_check.status != "failed": 
+                 await crud.save_transcript(db, video_id=video_id, segments=[], key_moments=_error_key_moments("Unexpected transcription error", error_details), status="failed")
+        raise
     finally:
-        print(f"[TranscriptionService] Video ID {video_id}: Transcription task finished, closing DB session.")
-        db.close()
\ No newline at end of file
+        logger.debug(f"Video ID {video_id}: Transcription task finished, closing DB session.")
+        await db.close()
@@ -0,0 +1,110 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from typing import Optional, AsyncIterator, Tuple
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploaded_videos")
+# Path UPLOAD_DIR is served under by the API (see main.py).
+STATIC_VIDEOS_URL = "/static_videos"
+# Resumable uploads are assembled here, on the same volume as UPLOAD_DIR so finalizing is a rename.
+PARTIAL_UPLOAD_DIR = os.path.join(UPLOAD_DIR, ".partial")
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+class UploadTooLarge(Exception):
+    """The stream went past the `max_bytes` it was allowed to write."""
+
+def file_extension_for(filename: Optional[str]) -> str:
+    return (os.path.splitext(filename)[1] if filename else "") or ".mp4"
+
+def new_upload_path(filename: Optional[str]) -> str:
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{file_extension_for(filename)}")
+
+def partial_upload_path(upload_id: str) -> str:
+    return os.path.join(PARTIAL_UPLOAD_DIR, f"{upload_id}.part")
+
+async def iter_upload_file(upload_file) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload_file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk: return
+        yield chunk
+
+async def write_stream(chunks: AsyncIterator[bytes], file_path: str, offset: int = 0, hasher=None, max_bytes: Optional[int] = None) -> int:
+    """
+    Writes an async byte stream to `file_path` starting at `offset`, doing the disk I/O in a worker thread so the
+    event loop is never blocked. Returns the number of bytes written. The file is truncated to the new end so a
+    re-sent range never leaves stale bytes behind. Raises UploadTooLarge, without writing the chunk that would
+    overflow, once the stream exceeds `max_bytes`.
+    """
+    mode = "r+b" if os.path.exists(file_path) else "wb"
+    handle = await asyncio.to_thread(open, file_path, mode)
+    written = 0
+    try:
+        await asyncio.to_thread(handle.seek, offset)
+        async for chunk in chunks:
+            if max_bytes is not None and written + len(chunk) > max_bytes:
+                raise UploadTooLarge(f"Stream exceeds {max_bytes} bytes")
+            if hasher is not None: hasher.update(chunk)
+            await asyncio.to_thread(handle.write, chunk)
+            written += len(chunk)
+        await asyncio.to_thread(handle.truncate, offset + written)
+    finally:
+        await asyncio.to_thread(handle.close)
+    return written
+
+async def save_upload_file(upload_file) -> Tuple[str, str, int]:
+    """
+    Streams a multipart UploadFile to a new file under UPLOAD_DIR in UPLOAD_CHUNK_BYTES pieces, hashing it on the fly.
+    Returns (file_path, sha256 hex digest, size in bytes).
+    """
+    file_path = new_upload_path(upload_file.filename)
+    hasher = hashlib.sha256()
+    try:
+        size = await write_stream(iter_upload_file(upload_file), file_path, hasher=hasher)
+    except Exception:
+        if os.path.exists(file_path): os.remove(file_path)
+        raise
+    return file_path, hasher.hexdigest(), size
+
+def _sha256_of_file(file_path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(UPLOAD_CHUNK_BYTES), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+async def sha256_of_file(file_path: str) -> str:
+    return await asyncio.to_thread(_sha256_of_file, file_path)
+
+def create_partial_file(upload_id: str) -> str:
+    os.makedirs(PARTIAL_UPLOAD_DIR, exist_ok=True)
+    path = partial_upload_path(upload_id)
+    open(path, "wb").close()
+    return path
+
+async def truncate_partial_file(upload_id: str, size: int) -> None:
+    """Cuts the partial file back to `size`, dropping whatever a rejected chunk wrote past it."""
+    await asyncio.to_thread(os.truncate, partial_upload_path(upload_id), size)
+
+def blob_path_for(content_hash: str, filename: Optional[str]) -> str:
+    return os.path.join(UPLOAD_DIR, f"{content_hash}{file_extension_for(filename)}")
+
+def store_blob(source_path: str, content_hash: str, filename: Optional[str], existing_path: Optional[str] = None) -> str:
+    """
+    Moves a finished upload into content-addressed storage. When a blob with the same hash is already stored
+    (`existing_path`, or the canonical path for this hash) the new copy is dropped and the stored path is returned.
+    Callers must hold crud.lock_content_hash so a concurrent delete cannot remove the blob in between.
+    """
+    for candidate in (existing_path, blob_path_for(content_hash, filename)):
+        if candidate and os.path.exists(candidate):
+            os.remove(source_path)
+            return candidate
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    final_path = blob_path_for(content_hash, filename)
+    os.replace(source_path, final_path)
+    return final_path
+
+def discard_partial_file(upload_id: str) -> None:
+    path = partial_upload_path(upload_id)
+    if os.path.exists(path): os.remove(path)
@@ -2,4 +2,22 @@ import os
 def format_timestamp(seconds: float) -> str:
     hours = int(seconds // 3600); minutes = int((seconds % 3600) // 60); secs = int(seconds % 60)
     milliseconds = int((seconds - int(seconds)) * 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02}.{milliseconds:03}"
\ No newline at end of file
+    return f"{hours:02}:{minutes:02}:{secs:02}.{milliseconds:03}"
+def parse_timestamp(timestamp: str) -> float:
+    """Inverse of format_timestamp: "HH:MM:SS.mmm" (or "MM:SS", or plain seconds) to seconds."""
+    try:
+        seconds = 0.0
+        for part in str(timestamp).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except (TypeError, ValueError):
+        return 0.0
+def transcript_document(segments, key_moments) -> dict:
+    """Renders stored segment and key moment rows (anything with start_seconds/end_seconds/text and label/start_seconds/details) in the API transcript shape."""
+    document_key_moments = []
+    for moment in key_moments:
+        key_moment = {"label": moment.label, "timestamp_start": format_timestamp(moment.start_seconds)}
+        if moment.details: key_moment["details"] = moment.details
+        document_key_moments.append(key_moment)
+    return {"key_moments": document_key_moments,
+            "segments": [{"timestamp_start": format_timestamp(seg.start_seconds), "timestamp_end": format_timestamp(seg.end_seconds), "text": seg.text} for seg in segments]}
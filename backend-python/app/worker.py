@@ -0,0 +1,118 @@
+"""
+Pipeline worker entry point: `python -m app.worker`.
+
+Pulls jobs from the Postgres-backed `jobs` table and runs them with a per-job-type concurrency cap,
+so the API process only enqueues work and stays free to serve reads.
+"""
+import logging
+import os
+import time
+import socket
+import asyncio
+import traceback
+from .database import init_db, AsyncSessionLocal, engine
+from .services import job_queue, transcription_service, mindmap_service, quiz_service, hls_service, token_budget, metrics, tracing
+from .services.log import setup_logging, log_context
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+WORKER_POLL_INTERVAL_SECONDS = float(os.getenv("WORKER_POLL_INTERVAL_SECONDS", "2"))
+# Comma-separated "<job_type>=<max concurrent jobs>" pairs.
+WORKER_CONCURRENCY = os.getenv("WORKER_CONCURRENCY", "transcription=2,mindmap=4,quiz=4,hls=1")
+
+def parse_concurrency(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item: continue
+        job_type, limit = item.split("=", 1)
+        limits[job_type.strip()] = max(1, int(limit))
+    return limits
+
+# Handlers re-raise failures so the job is retried with backoff; on the `final_attempt` they first store the error result.
+async def _run_transcription(payload: Dict[str, Any], final_attempt: bool):
+    await transcription_service.transcribe_video_with_openai(payload["video_filepath"], payload["video_id"], AsyncSessionLocal, optional_stages=payload.get("stages"), final_attempt=final_attempt)
+
+async def _run_mindmap(payload: Dict[str, Any], final_attempt: bool):
+    await mindmap_service.process_mindmap_generation(payload["video_id"], AsyncSessionLocal, bypass_cache=payload.get("bypass_cache", False), final_attempt=final_attempt)
+
+async def _run_quiz(payload: Dict[str, Any], final_attempt: bool):
+    await quiz_service.process_quiz_generation(payload["video_id"], payload["video_title"], AsyncSessionLocal, bypass_cache=payload.get("bypass_cache", False),
+                                               chapters=payload.get("chapters"), final_attempt=final_attempt)
+
+async def _run_hls(payload: Dict[str, Any], final_attempt: bool):
+    await hls_service.process_hls_packaging(payload["video_id"], payload["video_filepath"], AsyncSessionLocal)
+
+JOB_HANDLERS = {
+    job_queue.JOB_TYPE_TRANSCRIPTION: _run_transcription,
+    job_queue.JOB_TYPE_MINDMAP: _run_mindmap,
+    job_queue.JOB_TYPE_QUIZ: _run_quiz,
+    job_queue.JOB_TYPE_HLS: _run_hls,
+}
+
+async def _with_session(fn, *args):
+    async with AsyncSessionLocal() as db:
+        return await fn(db, *args)
+
+async def _heartbeat(job_id: int):
+    interval = max(1.0, job_queue.JOB_LEASE_SECONDS / 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await _with_session(job_queue.heartbeat_job, job_id, WORKER_ID):
+                logger.warning(f"Job {job_id}: lease lost, another worker may pick it up.")
+                return
+        except Exception as e: logger.warning(f"Job {job_id}: heartbeat failed: {e}")
+
+async def _execute(job: Dict[str, Any]):
+    job_id, job_type, payload = job["id"], job["job_type"], job["payload"]
+    with log_context(job_id=job_id, job_type=job_type, video_id=payload.get("video_id")), \
+         tracing.span(f"job {job_type}", traceparent=payload.get("traceparent"), job_id=job_id, video_id=payload.get("video_id")):
+        logger.info(f"Job {job_id} ({job_type}) attempt {job['attempts']}/{job['max_attempts']} started.")
+        heartbeat_task = asyncio.create_task(_heartbeat(job_id))
+        metrics.WORKER_JOBS_IN_FLIGHT.labels(job_type).inc(); started_at = time.perf_counter(); outcome = "failed"
+        try:
+            with token_budget.usage_scope(video_id=payload.get("video_id"), stage=job_type):
+                await JOB_HANDLERS[job_type](payload, job["attempts"] >= job["max_attempts"])
+        except Exception as e:
+            error_details = f"{e}\n{traceback.format_exc()}"
+            will_retry = await _with_session(job_queue.fail_job, job_id, WORKER_ID, error_details)
+            logger.error(f"Job {job_id} ({job_type}) failed: {e}. {'Retrying with backoff.' if will_retry else 'No attempts left.'}")
+        else:
+            await _with_session(job_queue.complete_job, job_id, WORKER_ID); outcome = "succeeded"
+            logger.info(f"Job {job_id} ({job_type}) succeeded.")
+        finally:
+            heartbeat_task.cancel()
+            metrics.WORKER_JOBS_IN_FLIGHT.labels(job_type).dec()
+            metrics.WORKER_JOB_DURATION.labels(job_type, outcome).observe(time.perf_counter() - started_at)
+
+async def _poll_job_type(job_type: str, limit: int):
+    running = set()
+    while True:
+        free_slots = limit - len(running)
+        if free_slots > 0:
+            try:
+                jobs = await _with_session(job_queue.claim_jobs, job_type, WORKER_ID, free_slots)
+            except Exception as e:
+                logger.warning(f"Could not claim {job_type} jobs: {e}"); jobs = []
+            for job in jobs:
+                task = asyncio.create_task(_execute(job))
+                running.add(task); task.add_done_callback(running.discard)
+            if jobs: continue
+        await asyncio.sleep(WORKER_POLL_INTERVAL_SECONDS)
+
+async def run_worker():
+    limits = {job_type: limit for job_type, limit in parse_concurrency(WORKER_CONCURRENCY).items() if job_type in JOB_HANDLERS}
+    logger.info(f"{WORKER_ID} starting with concurrency limits: {limits}")
+    await asyncio.gather(*[_poll_job_type(job_type, limit) for job_type, limit in limits.items()])
+
+async def main():
+    setup_logging()
+    tracing.init_tracing("worker", engine=engine)
+    metrics.start_worker_metrics_server()
+    await init_db()
+    await run_worker()
+
+if __name__ == "__main__":
+    asyncio.run(main())
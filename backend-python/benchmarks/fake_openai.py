@@ -0,0 +1,198 @@
+"""
+Local stand-in for the OpenAI API: `python -m benchmarks.fake_openai --port 8010`.
+
+Point the API and the worker at it with OPENAI_BASE_URL=http://<host>:8010/v1. It implements the calls this app
+makes (audio.transcriptions verbose_json, chat.completions with and without streaming, embeddings) and answers
+each prompt kind (key moments, section summaries, mind map, chapter quiz, tags, chat) with a well-formed
+response, after a configurable latency. A share of requests can be rejected with 429 and a Retry-After header.
+GET /stats returns request counts per endpoint.
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import subprocess
+import uvicorn
+from collections import Counter
+from fastapi import FastAPI, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional, List as PyList, Any, Dict
+
+FAKE_OPENAI_LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "300"))
+FAKE_OPENAI_JITTER_MS = float(os.getenv("FAKE_OPENAI_JITTER_MS", "150"))
+# Whisper latency grows with the audio: latency + this many ms per second of audio.
+FAKE_OPENAI_WHISPER_MS_PER_AUDIO_SECOND = float(os.getenv("FAKE_OPENAI_WHISPER_MS_PER_AUDIO_SECOND", "20"))
+# Delay between streamed chat chunks.
+FAKE_OPENAI_STREAM_CHUNK_MS = float(os.getenv("FAKE_OPENAI_STREAM_CHUNK_MS", "20"))
+# Share of requests (0..1) answered with 429, and the Retry-After sent with them.
+FAKE_OPENAI_RATE_LIMIT_RATE = float(os.getenv("FAKE_OPENAI_RATE_LIMIT_RATE", "0"))
+FAKE_OPENAI_RETRY_AFTER_SECONDS = float(os.getenv("FAKE_OPENAI_RETRY_AFTER_SECONDS", "1"))
+FAKE_OPENAI_SEED = int(os.getenv("FAKE_OPENAI_SEED", "7"))
+SEGMENT_SECONDS = 5.0
+# Synthetic speech: each transcript segment is one sentence; every CHAPTER_EVERY_SEGMENTS-th opens a chapter.
+CHAPTER_EVERY_SEGMENTS = 12
+TOPICS = ["caching", "indexes", "queues", "codecs", "latency", "storage", "retries", "sharding", "tokens", "profiling"]
+WORDS = ["the", "system", "reads", "every", "request", "and", "then", "writes", "a", "small", "record", "to", "disk",
+         "while", "workers", "process", "frames", "in", "parallel", "so", "throughput", "stays", "high"]
+
+app = FastAPI(title="Fake OpenAI")
+settings: Dict[str, float] = {}
+request_counts: Counter = Counter()
+_rng = random.Random(FAKE_OPENAI_SEED)
+
+def _configure(latency_ms: float, jitter_ms: float, rate_limit_rate: float, retry_after_seconds: float, whisper_ms_per_audio_second: float, stream_chunk_ms: float) -> None:
+    settings.update(latency_ms=latency_ms, jitter_ms=jitter_ms, rate_limit_rate=rate_limit_rate, retry_after_seconds=retry_after_seconds,
+                    whisper_ms_per_audio_second=whisper_ms_per_audio_second, stream_chunk_ms=stream_chunk_ms)
+
+_configure(FAKE_OPENAI_LATENCY_MS, FAKE_OPENAI_JITTER_MS, FAKE_OPENAI_RATE_LIMIT_RATE, FAKE_OPENAI_RETRY_AFTER_SECONDS,
+           FAKE_OPENAI_WHISPER_MS_PER_AUDIO_SECOND, FAKE_OPENAI_STREAM_CHUNK_MS)
+
+def _rate_limited(endpoint: str) -> Optional[JSONResponse]:
+    request_counts[endpoint] += 1
+    if _rng.random() >= settings["rate_limit_rate"]: return None
+    request_counts[f"{endpoint}:429"] += 1
+    return JSONResponse(status_code=429, headers={"retry-after": f"{settings['retry_after_seconds']:g}"},
+                        content={"error": {"message": "Rate limit reached (injected).", "type": "requests", "code": "rate_limit_exceeded", "param": None}})
+
+async def _delay(extra_ms: float = 0.0) -> None:
+    await asyncio.sleep(max(0.0, settings["latency_ms"] + extra_ms + _rng.uniform(-1, 1) * settings["jitter_ms"]) / 1000)
+
+def _tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _sentence(index: int) -> str:
+    """Segment `index` of every synthetic transcript; deterministic so LLM-cache behaviour is reproducible."""
+    topic = TOPICS[(index // CHAPTER_EVERY_SEGMENTS) % len(TOPICS)]
+    words = " ".join(WORDS[(index * 7 + offset * 3) % len(WORDS)] for offset in range(14))
+    if index % CHAPTER_EVERY_SEGMENTS == 0: return f"Part {index // CHAPTER_EVERY_SEGMENTS + 1} begins here with {topic}, {words}."
+    return f"On {topic} number {index}, {words}."
+
+def _audio_duration(audio: bytes) -> float:
+    """Duration of the uploaded audio via ffprobe; estimated from the app's 24 kbit/s Opus bitrate if that fails."""
+    with tempfile.NamedTemporaryFile(suffix=".audio") as handle:
+        handle.write(audio); handle.flush()
+        try:
+            output = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", handle.name],
+                                    capture_output=True, text=True, timeout=30).stdout.strip()
+            return float(output)
+        except (OSError, ValueError, subprocess.SubprocessError): return len(audio) * 8 / 24000
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(file: UploadFile = File(...), model: str = Form("whisper-1"), response_format: str = Form("json")):
+    limited = _rate_limited("audio.transcriptions")
+    if limited: return limited
+    duration = await asyncio.to_thread(_audio_duration, await file.read())
+    await _delay(duration * settings["whisper_ms_per_audio_second"])
+    # Chunks of one video are transcribed separately; offset the sentence numbers by the chunk so they differ.
+    chunk = re.search(r"chunk(\d+)", file.filename or "")
+    first_index = int(chunk.group(1)) * 1000 if chunk else 0
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(duration, start + SEGMENT_SECONDS); index = len(segments)
+        text = _sentence(first_index + index)
+        segments.append({"id": index, "seek": int(start * 100), "start": round(start, 2), "end": round(end, 2), "text": f" {text}", "tokens": [],
+                         "temperature": 0.0, "avg_logprob": -0.2, "compression_ratio": 1.4, "no_speech_prob": 0.01})
+        start = end
+    full_text = "".join(segment["text"] for segment in segments).strip()
+    if response_format != "verbose_json": return {"text": full_text}
+    return {"task": "transcribe", "language": "english", "duration": duration, "text": full_text, "segments": segments}
+
+def _number(pattern: str, text: str, default: int) -> int:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+def _chat_content(messages: PyList[Dict[str, Any]]) -> str:
+    """An answer in the shape the app expects for the prompt kind, recognised from the system message."""
+    system = next((message.get("content") or "" for message in messages if message.get("role") == "system"), "").lower()
+    user = next((message.get("content") or "" for message in reversed(messages) if message.get("role") == "user"), "")
+    # Answers are built from the synthetic transcript sentences in the prompt, not from the instructions around them.
+    words = re.findall(r"[A-Za-z]+", " ".join(re.findall(r"(?:Part \d+ begins here with|On \w+ number \d+,)[^.]*\.", user))) or re.findall(r"[A-Za-z]+", user)
+    topics = [topic for topic in TOPICS if topic in user] or ["overview"]
+    if "key moments" in system:
+        openings = re.findall(r"Part \d+ begins here with \w+", user)
+        return json.dumps({"key_moments": [{"label": opening.split(" with ")[-1].capitalize() + f" ({opening.split()[1]})", "starting_phrase": opening} for opening in openings]})
+    if "quiz" in system:
+        count = _number(r"generate (\d+) quiz questions", user, 3)
+        return json.dumps({"questions": [{"question_text": f"What does the chapter say about {topics[i % len(topics)]}?", "question_type": "single-choice",
+                                          "options": [{"text": f"It {verb} {topics[i % len(topics)]}", "is_correct": j == 0} for j, verb in enumerate(["explains", "ignores", "forbids", "renames"])],
+                                          "explanation": "Stated in the chapter."} for i in range(max(1, min(count, 10)))]})
+    if "tags" in system: return json.dumps({"tags": topics[:6]})
+    if "mind map" in system:
+        return "# Overview\n" + "".join(f"## {topic.capitalize()}\n- {' '.join(words[i * 5:i * 5 + 5])}\n" for i, topic in enumerate(topics))
+    if "condense" in system or "merge summaries" in system:
+        limit = _number(r"at most (\d+) words", user, 60)
+        return " ".join(words[:min(limit, 60)])
+    return f"Based on the transcript, the video covers {', '.join(topics)}. " + " ".join(words[-30:])
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    limited = _rate_limited("chat.completions")
+    if limited: return limited
+    body = await request.json()
+    model = body.get("model", "gpt-4o-mini")
+    content = _chat_content(body.get("messages") or [])
+    prompt_tokens = sum(_tokens(message.get("content") or "") + 4 for message in body.get("messages") or []) + 3
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": _tokens(content), "total_tokens": prompt_tokens + _tokens(content)}
+    completion_id = "chatcmpl-" + hashlib.sha1(f"{time.time()}{_rng.random()}".encode()).hexdigest()[:24]
+    await _delay()
+    if not body.get("stream"):
+        return {"id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model, "usage": usage,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+    async def events():
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, chunk_usage: Optional[Dict[str, int]] = None, choices: bool = True) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [], "usage": chunk_usage}
+            return f"data: {json.dumps(payload)}\n\n"
+        yield chunk({"role": "assistant", "content": ""})
+        for piece in re.findall(r"\S+\s*", content):
+            await asyncio.sleep(settings["stream_chunk_ms"] / 1000)
+            yield chunk({"content": piece})
+        yield chunk({}, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"): yield chunk({}, chunk_usage=usage, choices=False)
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    limited = _rate_limited("embeddings")
+    if limited: return limited
+    body = await request.json()
+    inputs = body.get("input") or []
+    inputs = [inputs] if isinstance(inputs, str) else inputs
+    dimensions = int(body.get("dimensions") or 1536)
+    await _delay()
+    data = []
+    for index, text in enumerate(inputs):
+        # Deterministic per text, so identical chunks embed identically.
+        vector_rng = random.Random(hashlib.sha1(str(text).encode()).hexdigest())
+        data.append({"object": "embedding", "index": index, "embedding": [vector_rng.gauss(0, 1) for _ in range(dimensions)]})
+    return {"object": "list", "data": data, "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": sum(_tokens(str(text)) for text in inputs), "total_tokens": sum(_tokens(str(text)) for text in inputs)}}
+
+@app.get("/stats")
+async def stats():
+    return {"requests": dict(request_counts), "settings": settings}
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency-ms", type=float, default=FAKE_OPENAI_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=FAKE_OPENAI_JITTER_MS)
+    parser.add_argument("--rate-limit-rate", type=float, default=FAKE_OPENAI_RATE_LIMIT_RATE, help="share of requests answered with 429")
+    parser.add_argument("--retry-after-seconds", type=float, default=FAKE_OPENAI_RETRY_AFTER_SECONDS)
+    parser.add_argument("--whisper-ms-per-audio-second", type=float, default=FAKE_OPENAI_WHISPER_MS_PER_AUDIO_SECOND)
+    parser.add_argument("--stream-chunk-ms", type=float, default=FAKE_OPENAI_STREAM_CHUNK_MS)
+    args = parser.parse_args()
+    _configure(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.retry_after_seconds, args.whisper_ms_per_audio_second, args.stream_chunk_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+End-to-end throughput benchmark: `python -m benchmarks.load --base-url http://localhost:8000 --uploads 20`.
+
+Run it against an API and worker that talk to benchmarks.fake_openai (OPENAI_BASE_URL), so it costs nothing and
+OpenAI latency is under control. Three phases:
+1. uploads: synthetic videos (benchmarks.synthetic_media, each with a distinct content hash unless --dedup) are
+   uploaded `--upload-concurrency` at a time and polled until 'completed' or 'failed';
+2. publish: every completed video gets a public slug;
+3. reads: `--reads` public page loads and `--chats` chat questions (streamed with --stream) against those slugs.
+
+The report (printed, and written to --output as JSON) has uploads completed per minute, p50/p90/p99 latencies per
+operation, per-stage pipeline timings and ffmpeg CPU, and API/worker CPU seconds and peak memory scraped from
+their /metrics endpoints while the run was going on.
+"""
+import os
+import json
+import math
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import httpx
+from collections import defaultdict
+from typing import Optional, List as PyList, Any, Dict
+from .synthetic_media import make_corpus, make_variant
+
+FINISHED_STATUSES = ("completed", "failed")
+CHAT_QUESTIONS = ["What is this video about?", "Which topics come up first?", "Summarize the part about caching.", "What is said about retries?"]
+
+def percentile(values: PyList[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile, None for no values."""
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+def summarize(samples: PyList[float], errors: int = 0) -> Dict[str, Any]:
+    return {"count": len(samples), "errors": errors, "p50": percentile(samples, 0.5), "p90": percentile(samples, 0.9),
+            "p99": percentile(samples, 0.99), "max": max(samples) if samples else None,
+            "mean": sum(samples) / len(samples) if samples else None}
+
+class Recorder:
+    """Latency samples (seconds) and error counts per operation."""
+    def __init__(self):
+        self.samples: Dict[str, PyList[float]] = defaultdict(list); self.errors: Dict[str, int] = defaultdict(int)
+
+    def add(self, operation: str, seconds: float) -> None: self.samples[operation].append(seconds)
+
+    def error(self, operation: str) -> None: self.errors[operation] += 1
+
+    def report(self) -> Dict[str, Any]:
+        return {operation: summarize(self.samples.get(operation, []), self.errors.get(operation, 0)) for operation in sorted(set(self.samples) | set(self.errors))}
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Unlabelled samples of a Prometheus text exposition, e.g. {"process_cpu_seconds_total": 12.3}."""
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#") or "{" in line: continue
+        name, _, value = line.partition(" ")
+        try: values[name] = float(value.split()[0])
+        except (ValueError, IndexError): pass
+    return values
+
+class ResourceSampler:
+    """Scrapes process CPU and memory from /metrics endpoints every `interval` seconds during the run."""
+    def __init__(self, client: httpx.AsyncClient, endpoints: Dict[str, str], interval: float):
+        self.client = client; self.endpoints = endpoints; self.interval = interval
+        self.first: Dict[str, Dict[str, float]] = {}; self.last: Dict[str, Dict[str, float]] = {}; self.peak_rss: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def sample(self) -> None:
+        for name, url in self.endpoints.items():
+            try: values = parse_metrics((await self.client.get(url, timeout=5)).text)
+            except httpx.HTTPError: continue
+            self.first.setdefault(name, values); self.last[name] = values
+            self.peak_rss[name] = max(self.peak_rss.get(name, 0.0), values.get("process_resident_memory_bytes", 0.0))
+
+    async def _loop(self) -> None:
+        while True:
+            await self.sample(); await asyncio.sleep(self.interval)
+
+    def start(self) -> None: self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task: self._task.cancel()
+        await self.sample()
+
+    def report(self, elapsed_seconds: float) -> Dict[str, Any]:
+        report = {}
+        for name in self.last:
+            cpu = self.last[name].get("process_cpu_seconds_total", 0.0) - self.first[name].get("process_cpu_seconds_total", 0.0)
+            report[name] = {"cpu_seconds": round(cpu, 2), "avg_cpu_cores": round(cpu / elapsed_seconds, 3) if elapsed_seconds else None,
+                            "peak_rss_mb": round(self.peak_rss.get(name, 0.0) / 2 ** 20, 1)}
+        return report
+
+def prepare_uploads(media_dir: str, uploads: int, durations: PyList[float], height: int, dedup: bool) -> PyList[str]:
+    """Paths to upload, cycling through `durations`; unless `dedup`, each is a variant with its own content hash."""
+    bases = make_corpus(media_dir, durations, height)
+    if dedup: return [bases[i % len(bases)] for i in range(uploads)]
+    run_dir = tempfile.mkdtemp(prefix="bench-uploads-", dir=media_dir)
+    run_id = uuid.uuid4().hex[:8]
+    return [make_variant(bases[i % len(bases)], os.path.join(run_dir, f"upload_{i:04}.mp4"), f"bench-{run_id}-{i}") for i in range(uploads)]
+
+async def upload_and_wait(client: httpx.AsyncClient, recorder: Recorder, semaphore: asyncio.Semaphore, project_id: int, path: str,
+                          poll_seconds: float, timeout_seconds: float) -> Dict[str, Any]:
+    """Uploads one file, then polls its video until it is finished; returns {"video_id", "status", "started_at", "finished_at"}."""
+    async with semaphore:
+        started_at = time.monotonic()
+        try:
+            with open(path, "rb") as handle:
+                response = await client.post(f"/projects/{project_id}/upload_video/", files={"file": (os.path.basename(path), handle, "video/mp4")}, timeout=600)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            recorder.error("upload"); return {"video_id": None, "status": "upload_failed", "started_at": started_at, "finished_at": time.monotonic()}
+        recorder.add("upload", time.monotonic() - started_at)
+    video = response.json()
+    while video["status"] not in FINISHED_STATUSES and time.monotonic() - started_at < timeout_seconds:
+        await asyncio.sleep(poll_seconds)
+        poll_started_at = time.monotonic()
+        try:
+            poll = await client.get(f"/videos/{video['id']}"); poll.raise_for_status(); video = poll.json()
+            recorder.add("video_status", time.monotonic() - poll_started_at)
+        except httpx.HTTPError: recorder.error("video_status")
+    finished_at = time.monotonic()
+    status = video["status"] if video["status"] in FINISHED_STATUSES else "timed_out"
+    if status == "completed": recorder.add("upload_to_completed", finished_at - started_at)
+    else: recorder.error("upload_to_completed")
+    return {"video_id": video["id"], "status": status, "started_at": started_at, "finished_at": finished_at}
+
+async def read_public_video(client: httpx.AsyncClient, recorder: Recorder, slug: str) -> None:
+    started_at = time.monotonic()
+    try:
+        response = await client.get(f"/public/videos/{slug}"); response.raise_for_status()
+        recorder.add("public_read", time.monotonic() - started_at)
+    except httpx.HTTPError: recorder.error("public_read")
+
+async def chat(client: httpx.AsyncClient, recorder: Recorder, slug: str, question: str, stream: bool) -> None:
+    started_at = time.monotonic(); body = {"question": question, "chat_history": []}
+    try:
+        if not stream:
+            response = await client.post(f"/public/videos/{slug}/chat", json=body, timeout=120); response.raise_for_status()
+            recorder.add("chat", time.monotonic() - started_at); return
+        first_token_at = None
+        async with client.stream("POST", f"/public/videos/{slug}/chat/stream", json=body, timeout=120) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if first_token_at is None and line.startswith("event: token"): first_token_at = time.monotonic()
+                if line.startswith("event: error"): raise httpx.HTTPError("error event")
+        if first_token_at: recorder.add("chat_stream_first_token", first_token_at - started_at)
+        recorder.add("chat_stream", time.monotonic() - started_at)
+    except httpx.HTTPError: recorder.error("chat_stream" if stream else "chat")
+
+async def run_limited(coroutines: PyList[Any], concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    async def limited(coroutine):
+        async with semaphore: await coroutine
+    await asyncio.gather(*[limited(coroutine) for coroutine in coroutines])
+
+async def stage_report(client: httpx.AsyncClient, video_ids: PyList[int]) -> Dict[str, Any]:
+    """Pipeline stage durations and ffmpeg CPU across the benchmark's videos, from /videos/{id}/stage-runs."""
+    durations: Dict[str, PyList[float]] = defaultdict(list); ffmpeg_cpu_ms: Dict[str, int] = defaultdict(int)
+    for video_id in video_ids:
+        try: runs = (await client.get(f"/videos/{video_id}/stage-runs")).json()
+        except (httpx.HTTPError, ValueError): continue
+        for run in runs:
+            durations[run["stage"]].append(run["duration_ms"] / 1000)
+            ffmpeg_cpu_ms[run["stage"]] += run.get("ffmpeg_cpu_ms") or 0
+    return {stage: {**summarize(samples), "ffmpeg_cpu_seconds": round(ffmpeg_cpu_ms[stage] / 1000, 2)} for stage, samples in sorted(durations.items())}
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    recorder = Recorder()
+    paths = prepare_uploads(args.media_dir, args.uploads, args.durations, args.height, args.dedup)
+    endpoints = {"api": f"{args.base_url.rstrip('/')}/metrics"}
+    if args.worker_metrics_url: endpoints["worker"] = args.worker_metrics_url
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30, limits=httpx.Limits(max_connections=max(args.upload_concurrency, args.read_concurrency) + 10)) as client:
+        sampler = ResourceSampler(client, endpoints, args.sample_interval)
+        fake_before = await fetch_json(client, args.fake_openai_url)
+        response = await client.post("/projects/", json={"name": f"bench-{uuid.uuid4().hex[:8]}"}); response.raise_for_status()
+        project = response.json()
+        sampler.start(); started_at = time.monotonic()
+
+        semaphore = asyncio.Semaphore(max(1, args.upload_concurrency))
+        videos = await asyncio.gather(*[upload_and_wait(client, recorder, semaphore, project["id"], path, args.poll_seconds, args.video_timeout) for path in paths])
+        uploads_finished_at = time.monotonic()
+        completed = [video for video in videos if video["status"] == "completed"]
+
+        slugs = []
+        for video in completed:
+            try:
+                response = await client.post(f"/videos/{video['video_id']}/publish"); response.raise_for_status()
+                slugs.append(response.json()["public_slug"])
+            except httpx.HTTPError: recorder.error("publish")
+        reads_started_at = time.monotonic()
+        if slugs:
+            work = [read_public_video(client, recorder, slugs[i % len(slugs)]) for i in range(args.reads)]
+            work += [chat(client, recorder, slugs[i % len(slugs)], CHAT_QUESTIONS[i % len(CHAT_QUESTIONS)], args.stream) for i in range(args.chats)]
+            await run_limited(work, args.read_concurrency)
+        reads_seconds = time.monotonic() - reads_started_at
+        await sampler.stop(); elapsed = time.monotonic() - started_at
+
+        upload_window = (max(video["finished_at"] for video in completed) - started_at) if completed else 0.0
+        statuses: Dict[str, int] = defaultdict(int)
+        for video in videos: statuses[video["status"]] += 1
+        fake_after = await fetch_json(client, args.fake_openai_url)
+        return {
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "elapsed_seconds": round(elapsed, 1),
+            "uploads": {"statuses": dict(statuses), "completed_per_minute": round(len(completed) / upload_window * 60, 2) if upload_window else 0.0,
+                        "window_seconds": round(upload_window, 1), "phase_seconds": round(uploads_finished_at - started_at, 1)},
+            "reads": {"requests_per_second": round((args.reads + args.chats) / reads_seconds, 2) if slugs and reads_seconds else 0.0, "published_videos": len(slugs)},
+            "latency_seconds": recorder.report(),
+            "pipeline_stages": await stage_report(client, [video["video_id"] for video in completed]),
+            "resources": sampler.report(elapsed),
+            "fake_openai_requests": diff_counts((fake_before or {}).get("requests", {}), (fake_after or {}).get("requests", {})) if fake_after else None,
+        }
+
+async def fetch_json(client: httpx.AsyncClient, url: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not url: return None
+    try: return (await client.get(url, timeout=5)).json()
+    except (httpx.HTTPError, ValueError): return None
+
+def diff_counts(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {key: after[key] - before.get(key, 0) for key in sorted(after) if after[key] - before.get(key, 0)}
+
+def format_report(report: Dict[str, Any]) -> str:
+    def ms(value): return "-" if value is None else f"{value * 1000:.0f}"
+    lines = [f"Elapsed {report['elapsed_seconds']}s; uploads {report['uploads']['statuses']}",
+             f"Uploads completed per minute: {report['uploads']['completed_per_minute']} (over {report['uploads']['window_seconds']}s)",
+             f"Public reads + chats per second: {report['reads']['requests_per_second']}", "",
+             f"{'operation':<26}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for operation, stats in list(report["latency_seconds"].items()) + [(f"stage:{stage}", stats) for stage, stats in report["pipeline_stages"].items()]:
+        lines.append(f"{operation:<26}{stats['count']:>7}{stats['errors']:>8}{ms(stats['p50']):>10}{ms(stats['p90']):>10}{ms(stats['p99']):>10}{ms(stats['max']):>10}")
+    lines.append("")
+    for name, usage in report["resources"].items():
+        lines.append(f"{name}: {usage['cpu_seconds']} CPU seconds ({usage['avg_cpu_cores']} cores on average), peak RSS {usage['peak_rss_mb']} MB")
+    ffmpeg_cpu = sum(stats["ffmpeg_cpu_seconds"] for stats in report["pipeline_stages"].values())
+    lines.append(f"ffmpeg (pipeline stages): {ffmpeg_cpu:.1f} CPU seconds")
+    if report["fake_openai_requests"]: lines.append(f"fake OpenAI requests: {report['fake_openai_requests']}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput benchmark of the video processor.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--worker-metrics-url", default="http://localhost:9100/metrics", help="empty to skip the worker")
+    parser.add_argument("--fake-openai-url", default="http://localhost:8010/stats", help="empty to skip")
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--upload-concurrency", type=int, default=4)
+    parser.add_argument("--durations", type=lambda spec: [float(value) for value in spec.split(",")], default=[60.0, 180.0], help="comma-separated video lengths in seconds")
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--dedup", action="store_true", help="upload identical files, measuring the deduplicated path")
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--stream", action="store_true", help="use the streaming chat endpoint")
+    parser.add_argument("--read-concurrency", type=int, default=16)
+    parser.add_argument("--poll-seconds", type=float, default=1.0)
+    parser.add_argument("--video-timeout", type=float, default=1800)
+    parser.add_argument("--sample-interval", type=float, default=2.0)
+    parser.add_argument("--media-dir", default=os.path.join(tempfile.gettempdir(), "video-processor-bench"))
+    parser.add_argument("--output", default="benchmark-report.json")
+    args = parser.parse_args()
+    report = asyncio.run(run_benchmark(args))
+    print(format_report(report))
+    with open(args.output, "w") as handle: json.dump(report, handle, indent=2)
+    print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Synthetic test videos generated with ffmpeg's lavfi sources: `python -m benchmarks.synthetic_media out.mp4 --duration 120`.
+
+The picture is a moving test pattern with a running timestamp; the audio is a tone that pauses for
+SILENCE_SECONDS every TONE_PERIOD_SECONDS, so audio chunking finds silences to split at like it would in speech.
+The same arguments always produce the same file; make_variant() gives a copy a distinct content hash, so
+uploads are not deduplicated against earlier runs.
+"""
+import os
+import argparse
+import subprocess
+from typing import Optional
+
+TONE_PERIOD_SECONDS = 10
+SILENCE_SECONDS = 2
+
+def video_filename(duration_seconds: float, height: int) -> str:
+    return f"synthetic_{int(duration_seconds)}s_{height}p.mp4"
+
+def make_video(output_path: str, duration_seconds: float = 60, width: int = 640, height: int = 360, fps: int = 25, tone_hz: int = 440) -> str:
+    """Writes an H.264/AAC mp4 of `duration_seconds` to `output_path` (kept if it already exists) and returns the path."""
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0: return output_path
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    audio = f"aevalsrc='0.3*sin({tone_hz}*2*PI*t)*lt(mod(t,{TONE_PERIOD_SECONDS}),{TONE_PERIOD_SECONDS - SILENCE_SECONDS})':s=16000:d={duration_seconds}"
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+               "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={duration_seconds}",
+               "-f", "lavfi", "-i", audio,
+               "-c:v", "libx264", "-preset", "ultrafast", "-crf", "30", "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "64k",
+               "-shortest", "-movflags", "+faststart", output_path]
+    subprocess.run(command, check=True)
+    return output_path
+
+def make_variant(source_path: str, output_path: str, tag: str) -> str:
+    """Remuxes `source_path` (no re-encode) with `tag` in its metadata: same media, different bytes."""
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", source_path, "-map", "0", "-c", "copy",
+                    "-metadata", f"comment={tag}", "-movflags", "+faststart", output_path], check=True)
+    return output_path
+
+def make_corpus(directory: str, durations: list, height: int = 360) -> list:
+    """One video per entry of `durations` (seconds) in `directory`, reusing files made by earlier runs."""
+    return [make_video(os.path.join(directory, video_filename(duration, height)), duration, width=height * 16 // 9 // 2 * 2, height=height) for duration in durations]
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic test video with ffmpeg lavfi sources.")
+    parser.add_argument("output")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--fps", type=int, default=25)
+    args = parser.parse_args(argv)
+    print(make_video(args.output, args.duration, width=args.height * 16 // 9 // 2 * 2, height=args.height, fps=args.fps))
+
+if __name__ == "__main__":
+    main()
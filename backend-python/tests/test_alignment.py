@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+from app.services.alignment import SegmentTextIndex, normalize_tokens
+
+def _index(*texts):
+    return SegmentTextIndex([SimpleNamespace(start=10.0 * position, text=text) for position, text in enumerate(texts)])
+
+def test_normalization_drops_punctuation_casing_and_accents():
+    assert normalize_tokens("Café, RÉSUMÉ -- it's fine!") == ["cafe", "resume", "it", "s", "fine"]
+
+def test_phrase_matches_regardless_of_punctuation_and_casing():
+    index = _index("Welcome to the course.", "Today: Gradient Descent, explained!", "Thanks for watching.")
+    assert index.find_phrase("today gradient descent explained")[0] == 1
+
+def test_phrase_spanning_two_segments_maps_to_where_it_starts():
+    index = _index("In this video we look at", "how gradient descent works well", "on convex problems")
+    segment, score = index.find_phrase("we look at how gradient descent")
+    assert segment == 0 and score == 1.0
+
+def test_typo_in_every_trigram_falls_back_to_shorter_ngrams():
+    index = _index("An introduction to optimization.", "Gradient descent works well on smooth losses.")
+    assert index.find_phrase("gradient decsent works well")[0] == 1
+
+def test_only_segments_after_min_start_seconds_are_considered():
+    index = _index("gradient descent works well", "something else entirely", "gradient descent works well again")
+    assert index.find_phrase("gradient descent works well")[0] == 0
+    assert index.find_phrase("gradient descent works well", min_start_seconds=0.0)[0] == 2
+    assert index.find_phrase("gradient descent works well", min_start_seconds=20.0) is None
+
+def test_unrelated_phrase_is_not_matched():
+    assert _index("gradient descent works well").find_phrase("bananas are yellow") is None
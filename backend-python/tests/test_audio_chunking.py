@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+from app.services import audio_chunking
+from app.services.audio_chunking import plan_chunks, stitch_segments
+
+def _segment(start, end, text="words"): return SimpleNamespace(start=start, end=end, text=text)
+
+def test_cuts_snap_to_the_nearest_silence(monkeypatch):
+    monkeypatch.setattr(audio_chunking, "WHISPER_CHUNK_OVERLAP_SECONDS", 2.0)
+    chunks = plan_chunks(1500.0, [(560.0, 562.0), (590.0, 592.0)], chunk_seconds=600)
+    assert [chunk["cut_start"] for chunk in chunks] == [0.0, 591.0, 1191.0]
+    assert chunks[1]["audio_start"] == 589.0 and chunks[0]["audio_end"] == 593.0
+
+def test_cut_falls_back_to_the_target_without_a_nearby_silence(monkeypatch):
+    monkeypatch.setattr(audio_chunking, "WHISPER_CHUNK_SEARCH_SECONDS", 60.0)
+    chunks = plan_chunks(1000.0, [(699.0, 701.0)], chunk_seconds=600)
+    assert [(chunk["cut_start"], chunk["cut_end"]) for chunk in chunks] == [(0.0, 600.0), (600.0, 1000.0)]
+
+def test_short_tail_is_kept_in_the_last_chunk():
+    chunks = plan_chunks(700.0, [], chunk_seconds=600)
+    assert len(chunks) == 1 and chunks[0]["cut_end"] == chunks[0]["audio_end"] == 700.0
+    assert plan_chunks(0.0, []) == []
+
+def test_segment_heard_twice_in_the_overlap_is_kept_once(monkeypatch):
+    monkeypatch.setattr(audio_chunking, "WHISPER_CHUNK_OVERLAP_SECONDS", 2.0)
+    chunks = plan_chunks(1000.0, [(599.0, 601.0)], chunk_seconds=600)
+    stitched = stitch_segments(chunks, [[_segment(597.0, 599.5, "before the cut")],
+                                        [_segment(0.0, 2.5, "before the cut"), _segment(3.0, 5.0, "after the cut")]])
+    assert [(seg.start, seg.text) for seg in stitched] == [(597.0, "before the cut"), (601.0, "after the cut")]
+
+def test_last_chunk_keeps_segments_past_its_cut_end():
+    chunks = plan_chunks(100.0, [], chunk_seconds=600)
+    stitched = stitch_segments(chunks, [[_segment(98.0, 104.0, "trailing words"), _segment(99.0, 99.5, "  ")]])
+    assert [seg.text for seg in stitched] == ["trailing words"]
+
+def test_stitched_times_are_monotonic():
+    chunks = [{"index": 0, "cut_start": 0.0, "cut_end": 10.0, "audio_start": 0.0, "audio_end": 12.0},
+              {"index": 1, "cut_start": 10.0, "cut_end": 20.0, "audio_start": 8.0, "audio_end": 20.0}]
+    stitched = stitch_segments(chunks, [[_segment(4.0, 3.0), _segment(1.0, 2.0)], [_segment(3.0, 4.0)]])
+    assert [(seg.start, seg.end) for seg in stitched] == [(1.0, 2.0), (4.0, 4.0), (11.0, 12.0)]
@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+from app.services import openai_utils, token_budget
+
+class _Stream:
+    def __init__(self, texts):
+        self.chunks = [SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))]) for text in texts]
+        self.closed = False
+    def __aiter__(self): return self._iterate()
+    async def _iterate(self):
+        for chunk in self.chunks: yield chunk
+    async def close(self): self.closed = True
+
+def test_usage_is_recorded_when_the_client_disconnects(monkeypatch):
+    stream = _Stream(["Hello", " there", " again"]); recorded = []
+    async def call_with_retries(*args, **kwargs): return stream
+    async def check_token_ceiling(): pass
+    async def record_usage(kind, model, prompt_tokens, completion_tokens, latency_ms): recorded.append((kind, prompt_tokens, completion_tokens))
+    monkeypatch.setattr(openai_utils, "client", object())
+    monkeypatch.setattr(openai_utils, "_call_with_retries", call_with_retries)
+    monkeypatch.setattr(token_budget, "check_token_ceiling", check_token_ceiling)
+    monkeypatch.setattr(token_budget, "record_usage", record_usage)
+
+    async def read_one_token():
+        events = openai_utils.stream_answer_question_from_transcript("transcript", "question?", [])
+        assert await events.__anext__() == ("token", {"text": "Hello"})
+        await events.aclose()
+    asyncio.run(read_one_token())
+    assert stream.closed
+    assert len(recorded) == 1 and recorded[0][0] == "chat" and recorded[0][1] > 0 and recorded[0][2] > 0
@@ -0,0 +1,15 @@
+import pytest
+from app import crud
+
+def test_cursor_round_trip():
+    cursor = crud.encode_cursor("2024-05-01T10:00:00+00:00", 42)
+    assert crud.decode_cursor(cursor, str, int) == ["2024-05-01T10:00:00+00:00", 42]
+
+@pytest.mark.parametrize("values", [(), (None,), ("7",), (True,), (1, 2)])
+def test_malformed_cursors_are_rejected(values):
+    with pytest.raises(ValueError):
+        crud.decode_cursor(crud.encode_cursor(*values), int)
+
+def test_garbage_is_rejected():
+    with pytest.raises(ValueError):
+        crud.decode_cursor("not a cursor!", int)
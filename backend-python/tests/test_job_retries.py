@@ -0,0 +1,34 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app import crud
+from app.services import mindmap_service, condensation
+
+class _Session:
+    async def rollback(self): pass
+    async def close(self): pass
+
+def _run_failing_mindmap(monkeypatch, final_attempt):
+    writes = []
+    async def get_video(db, video_id): return SimpleNamespace(id=video_id, transcript_segment_count=3, summary=None)
+    async def get_transcript_text(db, video_id): return "some transcript"
+    async def get_key_moments(db, video_id): return []
+    async def load_digest(db, video): raise TimeoutError("upstream timeout")
+    async def update_video_data(db, video_id, **fields): writes.append(fields)
+    async def publish(*args, **kwargs): pass
+    monkeypatch.setattr(crud, "get_video", get_video)
+    monkeypatch.setattr(crud, "get_transcript_text", get_transcript_text)
+    monkeypatch.setattr(crud, "get_key_moments", get_key_moments)
+    monkeypatch.setattr(crud, "update_video_data", update_video_data)
+    monkeypatch.setattr(condensation, "load_digest", load_digest)
+    monkeypatch.setattr(mindmap_service.progress_events, "publish", publish)
+    with pytest.raises(TimeoutError):
+        asyncio.run(mindmap_service.process_mindmap_generation(1, _Session, final_attempt=final_attempt))
+    return writes
+
+def test_mindmap_failure_is_retried_without_storing_an_error(monkeypatch):
+    assert _run_failing_mindmap(monkeypatch, final_attempt=False) == []
+
+def test_mindmap_failure_on_final_attempt_stores_the_error(monkeypatch):
+    writes = _run_failing_mindmap(monkeypatch, final_attempt=True)
+    assert writes and writes[0]["mindmap_data"].startswith("# Mind Map Error")
@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+from app.services.pipeline import Pipeline, Stage, StageFailed
+
+def _stage(name, inputs=(), outputs=(), started=None, fail=False, **kwargs):
+    async def run(context):
+        if started is not None: started.append(name)
+        await asyncio.sleep(0)
+        if fail: raise RuntimeError(f"{name} broke")
+        return {output: f"{name}:{output}" for output in outputs}
+    return Stage(name, run, inputs=inputs, outputs=outputs, **kwargs)
+
+def _run(pipeline, context):
+    finished = {}
+    def on_finished(name, status, duration, error): finished[name] = status
+    asyncio.run(pipeline.run(context, on_stage_finished=on_finished))
+    return finished
+
+def test_stages_start_once_their_inputs_are_ready():
+    started = []
+    pipeline = Pipeline([_stage("c", inputs=["b"], outputs=["c"], started=started), _stage("b", inputs=["a"], outputs=["b"], started=started),
+                         _stage("a", inputs=["source"], outputs=["a"], started=started)], initial_inputs=["source"])
+    context = {"source": 1}
+    assert _run(pipeline, context) == {"a": "succeeded", "b": "succeeded", "c": "succeeded"}
+    assert started == ["a", "b", "c"] and context["c"] == "c:c"
+
+def test_failed_stage_skips_only_its_dependents():
+    pipeline = Pipeline([_stage("root", outputs=["text"], critical=True), _stage("tags", inputs=["text"], outputs=["tags"], fail=True),
+                         _stage("tag_index", inputs=["tags"], outputs=["tag_index"]), _stage("index", inputs=["text"], outputs=["index"])])
+    context = {}
+    assert _run(pipeline, context) == {"root": "succeeded", "tags": "failed", "tag_index": "skipped", "index": "succeeded"}
+    assert "index" in context and "tags" not in context
+
+def test_failed_persist_withdraws_the_outputs():
+    def persist(context, outputs): raise RuntimeError("database is down")
+    pipeline = Pipeline([_stage("root", outputs=["text"]), _stage("summary", inputs=["text"], outputs=["summary"], persist=persist),
+                         _stage("mindmap", inputs=["summary"], outputs=["mindmap"])])
+    context = {}
+    assert _run(pipeline, context) == {"root": "succeeded", "summary": "failed", "mindmap": "skipped"}
+    assert "summary" not in context
+
+def test_critical_failure_aborts_the_run():
+    pipeline = Pipeline([_stage("transcribe", outputs=["text"], fail=True, critical=True), _stage("index", inputs=["text"], outputs=["index"])])
+    with pytest.raises(StageFailed) as raised:
+        asyncio.run(pipeline.run({}))
+    assert raised.value.stage_name == "transcribe"
+
+def test_cycles_and_missing_inputs_are_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        Pipeline([_stage("a", inputs=["b"], outputs=["a"]), _stage("b", inputs=["a"], outputs=["b"])])
+    with pytest.raises(ValueError, match="no stage produces"):
+        Pipeline([_stage("a", inputs=["missing"], outputs=["a"])])
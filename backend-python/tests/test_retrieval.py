@@ -0,0 +1,46 @@
+import math
+import numpy as np
+import pytest
+from app.services import retrieval
+from app.services.retrieval import RetrievalIndex, chunk_segments
+
+CHUNKS = [{"start": 0.0, "end": 40.0, "text": "Gradient descent, gradient!"},
+          {"start": 40.0, "end": 80.0, "text": "The learning rate schedule."},
+          {"start": 80.0, "end": 120.0, "text": "Gradient boosting trees."}]
+EMBEDDINGS = [[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [0.0, 0.0, 1.0]]
+
+def test_bm25_scores_follow_the_formula():
+    scores = RetrievalIndex.build(CHUNKS).bm25_scores("the gradient")
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5)) # "the" is a stopword; "gradient" is in 2 of 3 chunks of 3 terms each
+    assert scores == pytest.approx([idf * 2 * 2.5 / (2 + 1.5), 0.0, idf * 1 * 2.5 / (1 + 1.5)])
+
+def test_search_returns_matching_chunks_best_first():
+    index = RetrievalIndex.build(CHUNKS)
+    assert index.search("gradient", top_k=1) == [0]
+    assert index.search("gradient", top_k=5) == [0, 2]
+
+def test_search_without_matches_falls_back_to_the_opening():
+    assert RetrievalIndex.build(CHUNKS).search("photosynthesis", top_k=2) == [0, 1]
+    assert RetrievalIndex.build([]).search("gradient", top_k=2) == []
+
+@pytest.mark.parametrize("embedding_weight, expected", [(0.8, [1, 0, 2]), (0.2, [0, 2, 1])])
+def test_hybrid_ranking_weights_embedding_similarity(monkeypatch, embedding_weight, expected):
+    monkeypatch.setattr(retrieval, "RETRIEVAL_EMBEDDING_WEIGHT", embedding_weight)
+    index = RetrievalIndex.build(CHUNKS, embeddings=EMBEDDINGS)
+    assert index.search("gradient", top_k=3, query_embedding=[0.0, 3.0, 0.0]) == expected
+
+@pytest.mark.parametrize("embeddings", [None, EMBEDDINGS])
+def test_bytes_round_trip(embeddings):
+    index = RetrievalIndex.build(CHUNKS, embeddings=embeddings)
+    restored = RetrievalIndex.from_bytes(index.to_bytes())
+    assert restored.chunk_texts == index.chunk_texts and restored.vocabulary == index.vocabulary
+    assert np.array_equal(restored.chunk_starts, index.chunk_starts)
+    assert np.allclose(restored.bm25_scores("gradient trees"), index.bm25_scores("gradient trees"))
+    assert (restored.embeddings is None) == (embeddings is None)
+    if embeddings: assert np.allclose(restored.embeddings, index.embeddings)
+
+def test_segments_are_grouped_into_timed_chunks(monkeypatch):
+    monkeypatch.setattr(retrieval, "RETRIEVAL_CHUNK_SECONDS", 30.0)
+    segments = [{"start": 0.0, "end": 10.0, "text": "one"}, {"start": 10.0, "end": 25.0, "text": "two"},
+                {"start": 25.0, "end": 40.0, "text": "three"}, {"start": 40.0, "end": 41.0, "text": "  "}]
+    assert chunk_segments(segments) == [{"start": 0.0, "end": 25.0, "text": "one two"}, {"start": 25.0, "end": 40.0, "text": "three"}]
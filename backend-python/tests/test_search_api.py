@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app import crud, database
+from app.main import app
+
+async def _no_db():
+    yield None
+
+def test_search_returns_hits_with_timestamps(monkeypatch):
+    async def get_project(db, project_id): return SimpleNamespace(id=project_id)
+    async def search_project_transcripts(db, project_id, query_text, limit, offset):
+        return [SimpleNamespace(video_id=3, video_filename="lecture.mp4", position=7, start_seconds=65.5, end_seconds=70.0, snippet="<b>gradient</b> descent", rank=0.8)]
+    monkeypatch.setattr(crud, "get_project", get_project)
+    monkeypatch.setattr(crud, "search_project_transcripts", search_project_transcripts)
+    app.dependency_overrides[database.get_db] = _no_db
+    try: response = TestClient(app).get("/projects/1/search", params={"q": "gradient"})
+    finally: app.dependency_overrides.clear()
+    assert response.status_code == 200
+    hit = response.json()["hits"][0]
+    assert hit["video_id"] == 3 and hit["timestamp"].startswith("00:01:05")
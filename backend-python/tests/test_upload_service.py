@@ -0,0 +1,18 @@
+import asyncio
+import pytest
+from app.services import upload_service
+
+async def _chunks(*parts):
+    for part in parts: yield part
+
+def test_rewritten_range_truncates_the_stale_tail(tmp_path):
+    path = str(tmp_path / "upload.part")
+    asyncio.run(upload_service.write_stream(_chunks(b"abcdef"), path))
+    assert asyncio.run(upload_service.write_stream(_chunks(b"XY"), path, offset=2)) == 2
+    assert open(path, "rb").read() == b"abXY"
+
+def test_stream_past_max_bytes_is_rejected_before_the_overflowing_chunk(tmp_path):
+    path = str(tmp_path / "upload.part")
+    with pytest.raises(upload_service.UploadTooLarge):
+        asyncio.run(upload_service.write_stream(_chunks(b"abc", b"def"), path, max_bytes=4))
+    assert open(path, "rb").read() == b"abc"
@@ -30,7 +30,8 @@ import { Api } from '../../services/api';
   styleUrl: './all-videos.scss'
 })
 export class AllVideos implements OnInit {
-  allVideos: (Video & { project_name?: string })[] = []; // Add project_name for context
+  allVideos: Video[] = [];
+  nextCursor: string | null = null;
   isLoading: boolean = true;
   errorMessage: string | null = null;
 
@@ -48,8 +49,9 @@ export class AllVideos implements OnInit {
     this.isLoading = true;
     this.errorMessage = null;
     this.apiService.getAllVideos().subscribe({
-      next: (videos) => {
-        this.allVideos = videos.sort((a, b) => new Date(b.uploaded_at || 0).getTime() - new Date(a.uploaded_at || 0).getTime());
+      next: (page) => {
+        this.allVideos = page.items;
+        this.nextCursor = page.next_cursor;
         this.isLoading = false;
       },
       error: (err) => {
@@ -61,6 +63,17 @@ export class AllVideos implements OnInit {
     });
   }
 
+  loadMoreVideos(): void {
+    if (!this.nextCursor) return;
+    this.apiService.getAllVideos(this.nextCursor).subscribe({
+      next: (page) => {
+        this.allVideos = [...this.allVideos, ...page.items];
+        this.nextCursor = page.next_cursor;
+      },
+      error: (err) => this.snackBar.open(`Error loading videos: ${err.message}`, 'Close', { panelClass: 'snackbar-error' })
+    });
+  }
+
   viewVideoInProject(video: Video): void {
     if (video.project_id && video.id) {
       // Navigate to the project view, and the project view will handle selecting this video
@@ -24,6 +24,7 @@ import { Api } from '../../services/api';
 })
 export class ProjectList implements OnInit {
 projects: Project[] = [];
+  nextCursor: string | null = null;
   isLoading: boolean = true;
   errorMessage: string | null = null;
 
@@ -41,8 +42,9 @@ projects: Project[] = [];
     this.isLoading = true;
     this.errorMessage = null;
     this.apiService.getProjects().subscribe({
-      next: (data) => {
-        this.projects = data;
+      next: (page) => {
+        this.projects = page.items;
+        this.nextCursor = page.next_cursor;
         this.isLoading = false;
       },
       error: (err) => {
@@ -54,6 +56,17 @@ projects: Project[] = [];
     });
   }
 
+  loadMoreProjects(): void {
+    if (!this.nextCursor) return;
+    this.apiService.getProjects(this.nextCursor).subscribe({
+      next: (page) => {
+        this.projects = [...this.projects, ...page.items];
+        this.nextCursor = page.next_cursor;
+      },
+      error: (err) => this.snackBar.open(`Error loading projects: ${err.message}`, 'Close', { panelClass: 'snackbar-error' })
+    });
+  }
+
   viewProject(projectId?: number): void {
     if (projectId) {
       this.router.navigate(['/projects', projectId]);
@@ -6,8 +6,8 @@ import { MatListModule } from '@angular/material/list';
 import { MatProgressBarModule } from '@angular/material/progress-bar';
 import { MatSnackBar } from '@angular/material/snack-bar';
 import { ActivatedRoute, Router, RouterLink } from '@angular/router';
-import { Subscription, Subject, timer, switchMap, takeWhile, finalize } from 'rxjs';
-import { Project, QuizData, Video, VideoTranscript } from '../../models/models';
+import { Subscription, Subject, takeWhile, finalize, filter, concatMap, map, of, tap } from 'rxjs';
+import { Project, QuizData, Video, VideoProgressEvent, VideoTranscript } from '../../models/models';
 import { TranscriptDisplay } from '../transcript-display/transcript-display';
 import { VideoUpload } from '../video-upload/video-upload';
 import { MatProgressSpinnerModule } from '@angular/material/progress-spinner';
@@ -60,10 +60,12 @@ export class ProjectView implements OnInit, OnDestroy {
   parsedTranscript: VideoTranscript | null = null;
   parsedQuizData: QuizData | null = null;
   isPollingVideo: boolean = false;
+  videoProgress: string | null = null;
   isGeneratingMindmap: boolean = false;
   isGeneratingQuiz: boolean = false;
   editingTagsVideoId: number | null = null;
   currentTags: string[] = [];
+  videosNextCursor: string | null = null;
 
   private pollingSub?: Subscription;
   private ngUnsubscribe = new Subject<void>();
@@ -91,16 +93,13 @@ export class ProjectView implements OnInit, OnDestroy {
     this.apiService.getProject(projectId).subscribe({
         next: (data) => {
             if (data) {
-                this.project = data;
-                if (this.project.videos) {
-                    this.project.videos.sort((a,b) => new Date(b.uploaded_at || 0).getTime() - new Date(a.uploaded_at || 0).getTime());
-                }
-                this.determineInitialVideoForTranscript();
+                this.project = { ...data, videos: [] };
+                this.loadProjectVideos(projectId);
             } else {
                 this.errorMessage = "Project not found.";
                 this.snackBar.open(this.errorMessage, 'Close');
+                this.isLoadingProject = false;
             }
-            this.isLoadingProject = false;
         },
         error: (err) => {
             this.errorMessage = err.message;
@@ -110,6 +109,28 @@ export class ProjectView implements OnInit, OnDestroy {
     });
   }
 
+  // The listing only carries summaries (newest first); transcript, mind map and quiz are fetched per video on selection.
+  loadProjectVideos(projectId: number, cursor: string | null = null): void {
+    this.apiService.getProjectVideos(projectId, cursor).subscribe({
+        next: (page) => {
+            if (!this.project) return;
+            this.project.videos = [...(this.project.videos || []), ...page.items];
+            this.videosNextCursor = page.next_cursor;
+            if (!cursor) this.determineInitialVideoForTranscript();
+            this.isLoadingProject = false;
+        },
+        error: (err) => {
+            this.errorMessage = err.message;
+            this.snackBar.open(`Error loading videos: ${err.message}`, 'Close', { panelClass: 'snackbar-error' });
+            this.isLoadingProject = false;
+        }
+    });
+  }
+
+  loadMoreVideos(): void {
+    if (this.project?.id && this.videosNextCursor) this.loadProjectVideos(this.project.id, this.videosNextCursor);
+  }
+
   private parseVideoData(video: Video | null): void {
     if (video && video.transcript && typeof video.transcript === 'string') {
       try {
@@ -178,23 +199,48 @@ export class ProjectView implements OnInit, OnDestroy {
     }
   }
 
-  pollVideoStatus(videoId: number): void {
+  watchVideoStatus(videoId: number): void {
     if (this.pollingSub) this.pollingSub.unsubscribe();
     this.isPollingVideo = true;
-    this.pollingSub = timer(0, 3000).pipe(
-      switchMap(() => this.apiService.getVideoStatus(videoId)),
-      takeWhile(video => ['processing', 'uploaded', 'generating_mindmap', 'generating_quiz'].includes(video.status || ''), true),
+    this.videoProgress = null;
+    this.pollingSub = this.apiService.watchVideoEvents(videoId).pipe(
+      // After a 'resync' the server may have skipped events, so the current status is read once.
+      concatMap(event => event.event === 'resync'
+        ? this.apiService.getVideoStatus(videoId).pipe(map(video => ({ video_id: videoId, event: 'status', status: video.status } as VideoProgressEvent)))
+        : of(event)),
+      tap(event => this.applyProgressEvent(videoId, event)),
+      filter(event => event.event === 'status'),
+      takeWhile(event => ['processing', 'uploaded', 'generating_mindmap', 'generating_quiz'].includes(event.status || ''), true),
       finalize(() => {
         this.isPollingVideo = false;
+        this.videoProgress = null;
         if (this.currentVideoForTranscript?.id === videoId) {
           this.apiService.getVideoStatus(videoId).subscribe(finalVideoState => this.handleFinalVideoState(finalVideoState));
         }
       })
     ).subscribe({
-      next: (video) => this.updateLocalVideoState(video),
       error: (err) => this.handlePollingError(err)
     });
   }
+
+  applyProgressEvent(videoId: number, event: VideoProgressEvent): void {
+    if (event.event === 'status') {
+      this.updateVideoStatusOptimistically(videoId, event.status as Video['status'], {});
+    } else if (event.event === 'stage' && event.status === 'started') {
+      this.videoProgress = `${this.describeStage(event.stage)}...`;
+    } else if (event.event === 'progress') {
+      const chunks = event.total_chunks ? ` (chunk ${event.completed_chunks}/${event.total_chunks})` : '';
+      this.videoProgress = `${this.describeStage(event.stage)}: ${event.percent ?? 0}%${chunks}`;
+    }
+  }
+
+  describeStage(stage?: string): string {
+    const labels: Record<string, string> = {
+      extract_audio: 'Extracting audio', transcribe: 'Transcribing', key_moments: 'Finding key moments', tags: 'Generating tags',
+      retrieval_index: 'Indexing for chat', mindmap: 'Generating mind map', quiz: 'Generating quiz'
+    };
+    return labels[stage || ''] || stage || 'Processing';
+  }
   
   handleFinalVideoState(finalVideoState: Video): void {
     this.updateLocalVideoState(finalVideoState);
@@ -217,7 +263,7 @@ export class ProjectView implements OnInit, OnDestroy {
   }
   
   handlePollingError(err: any): void {
-    this.snackBar.open(`Error polling video status: ${err.message}`, 'Close', { panelClass: 'snackbar-error' });
+    this.snackBar.open(`Lost the video status stream: ${err.message}`, 'Close', { panelClass: 'snackbar-error' });
     this.isGeneratingMindmap = false;
     this.isGeneratingQuiz = false;
   }
@@ -229,10 +275,16 @@ export class ProjectView implements OnInit, OnDestroy {
     this.isGeneratingQuiz = video.status === 'generating_quiz';
     this.editingTagsVideoId = null; 
     if (video.id && ['processing', 'uploaded', 'generating_mindmap', 'generating_quiz'].includes(video.status || '')) {
-      this.pollVideoStatus(video.id);
+      this.watchVideoStatus(video.id);
     } else {
       if (this.pollingSub) this.pollingSub.unsubscribe();
       this.isPollingVideo = false;
+      if (video.id && (video.has_transcript || video.has_mindmap || video.has_quiz) && video.transcript === undefined) {
+        this.apiService.getVideoStatus(video.id).subscribe({
+          next: (detail) => this.updateLocalVideoState(detail),
+          error: (err) => this.snackBar.open(`Error loading video: ${err.message}`, 'Close', { panelClass: 'snackbar-error' })
+        });
+      }
     }
   }
 
@@ -244,7 +296,7 @@ export class ProjectView implements OnInit, OnDestroy {
     this.apiService.generateMindmap(videoId).subscribe({
       next: (response) => {
         this.snackBar.open(response.message, 'OK', { duration: 2000 });
-        this.pollVideoStatus(videoId); 
+        this.watchVideoStatus(videoId); 
       },
       error: (err) => this.handleGenerationError(err, videoId, 'mind map')
     });
@@ -258,7 +310,7 @@ export class ProjectView implements OnInit, OnDestroy {
     this.apiService.generateQuiz(videoId).subscribe({
       next: (response) => {
         this.snackBar.open(response.message, 'OK', { duration: 2000 });
-        this.pollVideoStatus(videoId);
+        this.watchVideoStatus(videoId);
       },
       error: (err) => this.handleGenerationError(err, videoId, 'quiz')
     });
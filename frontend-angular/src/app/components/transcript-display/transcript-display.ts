@@ -35,7 +35,10 @@ export class TranscriptDisplay implements OnChanges, OnDestroy, AfterViewInit {
   keyMoments: KeyMoment[] = [];
   currentSegmentIndex: number = -1;
   
-  public baseUrlForVideos = 'http://localhost:8000/static_videos';
+  public apiBaseUrl = 'http://localhost:8000';
+  public baseUrlForVideos = `${this.apiBaseUrl}/static_videos`;
+  // Only browsers that play HLS natively (Safari, iOS, Android) get the adaptive stream; others get the original file.
+  private readonly supportsNativeHls = typeof document !== 'undefined' && document.createElement('video').canPlayType('application/vnd.apple.mpegurl') !== '';
   private timeUpdateListener?: () => void;
 
   constructor(
@@ -177,6 +180,9 @@ export class TranscriptDisplay implements OnChanges, OnDestroy, AfterViewInit {
   }
 
   getVideoSource(): string | null {
+    if (this.video?.hls_manifest_url && this.supportsNativeHls) {
+      return `${this.apiBaseUrl}${this.video.hls_manifest_url}`;
+    }
     if (this.video && this.video.filepath) {
       const filename = this.video.filepath.split('/').pop();
       return filename ? `${this.baseUrlForVideos}/${filename}` : null;
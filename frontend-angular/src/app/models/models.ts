@@ -2,9 +2,15 @@ export interface Project {
   id?: number;
   name: string;
   created_at?: string;
+  video_count?: number;
   videos?: Video[];
 }
 
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
 export interface TranscriptSegment {
   timestamp_start: string;
   timestamp_end: string;
@@ -54,7 +60,25 @@ export interface Video {
   tags?: string[];
   is_public?: boolean;
   public_slug?: string | null;
+  hls_manifest_url?: string | null;
   uploaded_at?: string;
+  has_transcript?: boolean;
+  has_mindmap?: boolean;
+  has_quiz?: boolean;
+  project_name?: string | null;
+}
+
+// Event pushed on GET /videos/{id}/events
+export interface VideoProgressEvent {
+  video_id: number;
+  event: 'status' | 'stage' | 'progress' | 'resync';
+  status?: string;
+  stage?: string;
+  percent?: number;
+  completed_chunks?: number;
+  total_chunks?: number;
+  duration_seconds?: number;
+  ts?: number;
 }
 
 // Schema for public video view
@@ -1,7 +1,7 @@
-import { HttpClient, HttpErrorResponse, HttpEvent, HttpRequest } from '@angular/common/http';
+import { HttpClient, HttpErrorResponse, HttpEvent, HttpParams, HttpRequest } from '@angular/common/http';
 import { Injectable } from '@angular/core';
-import { catchError, map, Observable, throwError } from 'rxjs';
-import { ChatRequest, ChatResponse, Project, PublicVideoData, Video } from '../models/models';
+import { catchError, Observable, throwError } from 'rxjs';
+import { ChatRequest, ChatResponse, Page, Project, PublicVideoData, Video, VideoProgressEvent } from '../models/models';
 
 @Injectable({
   providedIn: 'root'
@@ -26,8 +26,12 @@ export class Api {
       .pipe(catchError(this.handleError));
   }
 
-  getProjects(): Observable<Project[]> {
-    return this.http.get<Project[]>(`${this.baseUrl}/projects/`)
+  private pageParams(cursor?: string | null): HttpParams {
+    return cursor ? new HttpParams().set('cursor', cursor) : new HttpParams();
+  }
+
+  getProjects(cursor?: string | null): Observable<Page<Project>> {
+    return this.http.get<Page<Project>>(`${this.baseUrl}/projects/`, { params: this.pageParams(cursor) })
       .pipe(catchError(this.handleError));
   }
 
@@ -36,13 +40,14 @@ export class Api {
       .pipe(catchError(this.handleError));
   }
 
-  getAllVideos(): Observable<Video[]> {
-    return this.http.get<Project[]>(`${this.baseUrl}/projects/`).pipe(
-      map(projects => projects.flatMap(project => 
-        (project.videos || []).map(video => ({...video, project_name: project.name})) 
-      )),
-      catchError(this.handleError)
-    );
+  getProjectVideos(projectId: number, cursor?: string | null): Observable<Page<Video>> {
+    return this.http.get<Page<Video>>(`${this.baseUrl}/projects/${projectId}/videos`, { params: this.pageParams(cursor) })
+      .pipe(catchError(this.handleError));
+  }
+
+  getAllVideos(cursor?: string | null): Observable<Page<Video>> {
+    return this.http.get<Page<Video>>(`${this.baseUrl}/videos/`, { params: this.pageParams(cursor) })
+      .pipe(catchError(this.handleError));
   }
 
 
@@ -61,6 +66,18 @@ export class Api {
       .pipe(catchError(this.handleError));
   }
 
+  watchVideoEvents(videoId: number): Observable<VideoProgressEvent> {
+    return new Observable<VideoProgressEvent>(subscriber => {
+      const source = new EventSource(`${this.baseUrl}/videos/${videoId}/events`);
+      const forward = (message: MessageEvent) => subscriber.next(JSON.parse(message.data));
+      for (const type of ['status', 'stage', 'progress', 'resync']) source.addEventListener(type, forward as EventListener);
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) subscriber.error(new Error('Progress event stream closed'));
+      };
+      return () => source.close();
+    });
+  }
+
   generateMindmap(videoId: number): Observable<{ message: string }> {
     return this.http.post<{ message: string }>(`${this.baseUrl}/videos/${videoId}/generate-mindmap`, {})
       .pipe(catchError(this.handleError));